@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Image, ModelCategory, Model, ProcessedImage, UserSetting
+from .models import User, Image, ImageDerivative, ModelCategory, Model, ProcessedImage, ProcessingJob, UserSetting
 
 admin.site.site_header = "DeepSight Image Processing"
 admin.site.site_title = "DeepSight Admin"
@@ -43,8 +43,8 @@ class ModelCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Model)
 class ModelAdmin(admin.ModelAdmin):
-    list_display = ("model_name", "model_format", "model_version", "category")
-    list_filter = ("model_format", "category")
+    list_display = ("model_name", "model_format", "handler", "precision", "model_version", "category")
+    list_filter = ("model_format", "precision", "category")
     search_fields = ("model_name", "model_description")
     ordering = ("model_name",)
 
@@ -53,7 +53,22 @@ class ModelAdmin(admin.ModelAdmin):
 class ProcessedImageAdmin(admin.ModelAdmin):
     list_display = ("image", "model", "creation_date", "processing_time", "output_format")
     list_filter = ("model", "output_format", "creation_date")
-    readonly_fields = ("image", "model", "creation_date", "processing_time", "output_format")
+    readonly_fields = ("image", "model", "creation_date", "processing_time", "stage_times", "output_format")
+    search_fields = ("image__image_name", "model__model_name")
+
+
+@admin.register(ImageDerivative)
+class ImageDerivativeAdmin(admin.ModelAdmin):
+    list_display = ("id", "image", "processed_image", "size", "output_format", "creation_date")
+    list_filter = ("output_format", "size")
+    readonly_fields = ("image", "processed_image", "size", "output_format", "blob_key", "creation_date")
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "image", "model", "status", "creation_date", "start_date", "end_date")
+    list_filter = ("status", "model", "creation_date")
+    readonly_fields = ("image", "model", "processed_image", "creation_date", "start_date", "end_date", "worker", "attempts", "error")
     search_fields = ("image__image_name", "model__model_name")
 
 
@@ -0,0 +1,87 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+jwt_authentication = JWTAuthentication()
+
+
+async def authenticate(request):
+    # JWTAuthentication.authenticate() with the user lookup done through the async ORM
+    header = jwt_authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = jwt_authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = jwt_authentication.get_validated_token(raw_token)
+
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("Token contained no recognizable user identification")
+
+    try:
+        user = await jwt_authentication.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+    except jwt_authentication.user_model.DoesNotExist:
+        raise AuthenticationFailed("User not found", code="user_not_found")
+    if not user.is_active:
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    return user
+
+
+def not_authenticated(detail):
+    # Same body and header as DRF's exception handler, which the frontend relies on to refresh its token
+    httpresponse = JsonResponse(detail if isinstance(detail, dict) else {"detail": detail}, status=401)
+    httpresponse["WWW-Authenticate"] = jwt_authentication.authenticate_header(None)
+    return httpresponse
+
+
+def async_api_view(methods, authenticated=False):
+    # The async counterpart of @api_view/@permission_classes, DRF itself cannot run coroutine views
+    allowed = set(methods) | ({"HEAD"} if "GET" in methods else set())
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+            try:
+                request.user = await authenticate(request) or AnonymousUser()
+            except AuthenticationFailed as e:
+                return not_authenticated(e.detail)
+            if authenticated and not request.user.is_authenticated:
+                return not_authenticated("Authentication credentials were not provided.")
+
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def aiter_blob(iterator):
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, next, iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def run_sync(func, *args):
+    # Blocking helpers run off the event loop, and file bodies are read there too instead of one thread hop per chunk
+    httpresponse = await sync_to_async(func, thread_sensitive=False)(*args)
+    if httpresponse.streaming and not httpresponse.is_async:
+        httpresponse.block_size = settings.ASYNC_BLOB_CHUNK_SIZE
+        httpresponse.streaming_content = aiter_blob(iter(httpresponse.streaming_content))
+    return httpresponse
@@ -0,0 +1,416 @@
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+from .pool import SOLUTIONS, SolutionPool
+from .sessions import create_session, graph_batch_size, load_session, run_onnx, session_config
+from .yolo import YoloSession, draw_detections, exported_path
+
+
+mediapipe_pool = SolutionPool(settings.MEDIAPIPE_POOL_SIZE)
+
+# The same edges as mediapipe.solutions.hands.HAND_CONNECTIONS and pose.POSE_CONNECTIONS, kept here so drawing needs no MediaPipe import
+HAND_CONNECTIONS = frozenset([
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (5, 9), (9, 10), (10, 11), (11, 12),
+    (9, 13), (13, 14), (14, 15), (15, 16),
+    (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),
+])
+POSE_CONNECTIONS = frozenset([
+    (0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19),
+    (12, 14), (14, 16), (16, 18), (16, 20), (16, 22), (18, 20),
+    (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28),
+    (27, 29), (28, 30), (29, 31), (30, 32), (27, 31), (28, 32),
+])
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    # Next to this module rather than the working directory, so commands run from anywhere can draw
+    return ImageFont.truetype(os.path.join(os.path.dirname(__file__), "static", "EudoxusSans-Bold.ttf"), size)
+
+
+def draw_caption(image, text):
+    image_width, image_height = image.size
+    new_height = image_height + 150
+    new_image = Image.new("RGB", (image_width, new_height), color=(0, 0, 0))
+    new_image.paste(image, (0, 0))
+
+    draw = ImageDraw.Draw(new_image)
+
+    font = load_font(40)
+
+    text_bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+
+    text_position = ((image_width - text_width) // 2, image_height + 50)
+
+    draw.text(text_position, text, font=font, fill="white")
+    return new_image
+
+
+def draw_landmarks(draw, points, connections):
+    for start_idx, end_idx in connections:
+        x_start, y_start = int(points[start_idx][0]), int(points[start_idx][1])
+        x_end, y_end = int(points[end_idx][0]), int(points[end_idx][1])
+        draw.line([(x_start, y_start), (x_end, y_end)], fill="red", width=2)
+
+    for point in points:
+        x, y = int(point[0]), int(point[1])
+        draw.ellipse([x - 5, y - 5, x + 5, y + 5], fill="red")
+
+
+class Backend:
+    # Whether infer_batch() runs a whole batch at once, only then are requests micro-batched
+    batchable = False
+    # Whether track() can follow results from frame to frame in a video
+    tracking = False
+    # The smallest long side the model needs, None decodes at full size
+    decode_side = None
+    # Whether large images can be cut into tiles whose detections are merged, see TILING_PIXEL_THRESHOLD
+    tileable = False
+
+    def load(self, modelObject):
+        return None
+
+    def batches(self, modelObject):
+        # Whether this model's inference really takes a whole batch in one call, see batchable
+        return self.batchable
+
+    def warm(self, model):
+        pass
+
+    def prepare(self, decoded):
+        pass
+
+    def infer(self, decoded, model):
+        raise NotImplementedError
+
+    def infer_batch(self, images, model):
+        return [self.infer(decoded, model) for decoded in images]
+
+    def track(self, images):
+        raise NotImplementedError
+
+    def annotate(self, decoded, result):
+        return decoded.rgb
+
+
+def googlenet_input(image_np):
+    import cv2
+
+    image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+    resized_image = cv2.resize(image_bgr, (224, 224))
+    input_image = resized_image - np.array([104, 117, 123])
+    input_image = np.transpose(input_image, [2, 0, 1])
+    return np.expand_dims(input_image, axis=0).astype(np.float32)
+
+
+class GoogleNetBackend(Backend):
+    batchable = True
+    decode_side = 448
+
+    def __init__(self, task, labels):
+        self.task = task
+        self.labels = labels
+
+    def load(self, modelObject):
+        return load_session(modelObject)
+
+    def batches(self, modelObject):
+        # The published GoogleNet graphs take one image per run until batch_models rewrites them
+        return graph_batch_size(modelObject.model_dir) is None
+
+    def warm(self, model):
+        model_input = model.get_inputs()[0]
+        shape = [dim if isinstance(dim, int) else 1 for dim in model_input.shape]
+        model.run(None, {model_input.name: np.zeros(shape, dtype=np.float32)})
+
+    def prepare(self, decoded):
+        # Age and gender take the same input, so it is built once per image
+        self.model_input(decoded)
+
+    def model_input(self, decoded):
+        return decoded.input("googlenet", googlenet_input)
+
+    def result(self, scores):
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        index = int(scores.argmax())
+        return {
+            "type": "classification",
+            "task": self.task,
+            "label": self.labels[index],
+            "scores": {label: round(float(score), 5) for label, score in zip(self.labels, scores)},
+        }
+
+    def infer(self, decoded, model):
+        return self.infer_batch([decoded], model)[0]
+
+    def preprocess(self, image_np):
+        return googlenet_input(image_np)
+
+    def classify(self, input_batch, model):
+        return [self.result(scores) for scores in run_onnx(model, input_batch)]
+
+    def infer_batch(self, images, model):
+        return self.classify(np.concatenate([self.model_input(image) for image in images]), model)
+
+    def annotate(self, decoded, result):
+        return draw_caption(decoded.rgb, f"{result['task'].capitalize()}: {result['label']}")
+
+
+class YoloBackend(Backend):
+    batchable = True
+    decode_side = 640
+    tileable = True
+
+    def load(self, modelObject):
+        # The graph exported by export_models runs without PyTorch, the .pt weights remain the fallback
+        runtime = (modelObject.runtime_options or {}).get("yolo_runtime", settings.YOLO_RUNTIME)
+        onnx_path = exported_path(modelObject.model_dir)
+        if runtime == "onnx" and os.path.exists(onnx_path):
+            return YoloSession(create_session(onnx_path, modelObject.model_version, session_config(modelObject)))
+
+        import ultralytics
+
+        return ultralytics.YOLO(modelObject.model_dir)
+
+    def warm(self, model):
+        if isinstance(model, YoloSession):
+            model.predict([np.zeros((640, 640, 3), dtype=np.uint8)])
+        else:
+            model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+    def result(self, results):
+        return {
+            "type": "detection",
+            "detections": [
+                {"box": [round(float(v), 2) for v in box], "class": int(cls), "label": results.names[int(cls)], "score": round(float(conf), 5)}
+                for box, cls, conf in zip(results.boxes.xyxy.tolist(), results.boxes.cls.tolist(), results.boxes.conf.tolist())
+            ],
+        }
+
+    def infer(self, decoded, model):
+        return self.infer_batch([decoded], model)[0]
+
+    def infer_batch(self, images, model):
+        if isinstance(model, YoloSession):
+            return model.predict([image.rgb_np for image in images])
+        # Ultralytics takes a list of images and runs them as one batch
+        return [self.result(results) for results in model([image.image for image in images], verbose=False)]
+
+    def annotate(self, decoded, result):
+        # Drawn like results.plot(), and returned as a BGR array like it
+        import cv2
+
+        return draw_detections(cv2.cvtColor(decoded.rgb_np, cv2.COLOR_RGB2BGR), result["detections"])
+
+
+def landmark_points(landmarks, width, height):
+    return [[round(landmark.x * width, 2), round(landmark.y * height, 2), round(landmark.z, 5)] for landmark in landmarks.landmark]
+
+
+class MediaPipeBackend(Backend):
+    tracking = True
+    decode_side = 1280
+
+    def __init__(self, solution, options):
+        self.solution = solution
+        self.options = options
+
+    def process(self, image_np):
+        with mediapipe_pool.checkout(self.solution, **self.options) as graph:
+            return graph.process(image_np)
+
+    def infer(self, decoded, model):
+        return self.result(self.process(decoded.rgb_np), decoded.rgb_np.shape)
+
+    def track(self, images):
+        # One graph of its own for the whole clip, in tracking mode so landmarks follow from frame to frame
+        options = {**self.options, "static_image_mode": False} if "static_image_mode" in self.options else self.options
+        with SOLUTIONS[self.solution](options) as graph:
+            for decoded in images:
+                yield decoded, self.result(graph.process(decoded.rgb_np), decoded.rgb_np.shape)
+
+
+class FaceDetectionBackend(MediaPipeBackend):
+    def faces(self, results, shape):
+        ih, iw, _ = shape
+        faces = []
+        for detection in results.detections or []:
+            bboxC = detection.location_data.relative_bounding_box
+            x, y, w, h = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.width * iw), int(bboxC.height * ih)
+            # The first two keypoints are the right and the left eye
+            eyes = [(keypoint.x * iw, keypoint.y * ih) for keypoint in detection.location_data.relative_keypoints[:2]]
+            faces.append({"box": [x, y, x + w, y + h], "score": round(float(detection.score[0]), 5), "eyes": eyes})
+        return faces
+
+    def result(self, results, shape):
+        return {"type": "detection", "detections": [{"box": face["box"], "label": "face", "score": face["score"]} for face in self.faces(results, shape)]}
+
+    def annotate(self, decoded, result):
+        image = decoded.rgb.copy()
+        canvas = ImageDraw.Draw(image)
+        for detection in result["detections"]:
+            canvas.rectangle(detection["box"], outline="red", width=5)
+        return image
+
+
+class LandmarkBackend(MediaPipeBackend):
+    def result(self, results, shape):
+        ih, iw, _ = shape
+        return {"type": "landmarks", "landmarks": [landmark_points(landmarks, iw, ih) for landmarks in self.landmarks(results)]}
+
+    def annotate(self, decoded, result):
+        image = decoded.rgb.copy()
+        canvas = ImageDraw.Draw(image)
+        for points in result["landmarks"]:
+            draw_landmarks(canvas, points, self.connections())
+        return image
+
+
+class HandsBackend(LandmarkBackend):
+    landmark_count = 21
+
+    def landmarks(self, results):
+        return results.multi_hand_landmarks or []
+
+    def connections(self):
+        return HAND_CONNECTIONS
+
+
+class PoseBackend(LandmarkBackend):
+    landmark_count = 33
+
+    def landmarks(self, results):
+        return [results.pose_landmarks] if results.pose_landmarks else []
+
+    def connections(self):
+        return POSE_CONNECTIONS
+
+
+def align_face(image_np, face, size, margin):
+    # Rotated so the eyes are level and cropped square around the face with some context, like the training crops
+    import cv2
+
+    x1, y1, x2, y2 = face["box"]
+    centre = ((x1 + x2) / 2, (y1 + y2) / 2)
+    side = max(x2 - x1, y2 - y1, 1) * (1 + margin)
+    angle = 0.0
+    if len(face["eyes"]) == 2:
+        (right_x, right_y), (left_x, left_y) = face["eyes"]
+        angle = math.degrees(math.atan2(left_y - right_y, left_x - right_x))
+    matrix = cv2.getRotationMatrix2D(centre, angle, size / side)
+    matrix[:, 2] += (size / 2 - centre[0], size / 2 - centre[1])
+    return cv2.warpAffine(image_np, matrix, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+class FaceCascadeBackend(Backend):
+    # Faces are detected once and every crop goes through each classifier in a single batch,
+    # instead of one full-image pass per classifier on a photo the classifiers were never trained on
+    decode_side = 1280
+    crop_size = 224
+    # Context kept around the detected box, as a share of its longer side
+    crop_margin = 0.4
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    def load(self, modelObject):
+        # The classifiers are shared with their own catalog entries through the registry, not loaded a second time
+        from .models import Model
+        from .process import model_registry
+
+        names = (modelObject.runtime_options or {}).get("classifiers", [])
+        classifiers = Model.objects.in_bulk(names, field_name="model_name")
+        missing = [name for name in names if name not in classifiers]
+        if missing:
+            raise ValueError(f"Cascade classifiers not in the catalog: {', '.join(missing)}.")
+        return [(get_backend(classifiers[name]), model_registry.get(classifiers[name])) for name in names]
+
+    def infer(self, decoded, model):
+        return self.infer_batch([decoded], model)[0]
+
+    def infer_batch(self, images, model):
+        faces = [self.detector.faces(self.detector.process(image.rgb_np), image.rgb_np.shape) for image in images]
+        crops = [align_face(image.rgb_np, face, self.crop_size, self.crop_margin) for image, image_faces in zip(images, faces) for face in image_faces]
+
+        classifications = [{} for _ in crops]
+        if crops:
+            # Classifiers with the same preprocessing, like age and gender, share one input batch
+            input_batches = {}
+            for backend, classifier in model:
+                key = type(backend)
+                if key not in input_batches:
+                    input_batches[key] = np.concatenate([backend.preprocess(crop) for crop in crops])
+                for face_classifications, result in zip(classifications, backend.classify(input_batches[key], classifier)):
+                    face_classifications[result["task"]] = {"label": result["label"], "scores": result["scores"]}
+
+        results = []
+        face_classifications = iter(classifications)
+        for image_faces in faces:
+            detections = [{"box": face["box"], "label": "face", "score": face["score"], "classifications": next(face_classifications)} for face in image_faces]
+            results.append({"type": "detection", "detections": detections})
+        return results
+
+    def annotate(self, decoded, result):
+        image = decoded.rgb.copy()
+        canvas = ImageDraw.Draw(image)
+        font = load_font(max(image.height // 40, 14))
+        for detection in result["detections"]:
+            canvas.rectangle(detection["box"], outline="red", width=max(image.height // 300, 2))
+            text = ", ".join(classification["label"] for classification in detection["classifications"].values())
+            if not text:
+                continue
+            # Labels sit above each box, or inside it when the box touches the top edge
+            left, top, right, bottom = canvas.textbbox((0, 0), text, font=font)
+            x, y = detection["box"][0], detection["box"][1] - (bottom - top) - 8
+            if y < 0:
+                y = detection["box"][1] + 4
+            canvas.rectangle([x, y, x + right - left + 8, y + bottom - top + 8], fill="red")
+            canvas.text((x + 4 - left, y + 4 - top), text, font=font, fill="white")
+        return image
+
+
+AGE_LABELS = ["(0-2)", "(4-6)", "(8-12)", "(15-20)", "(25-32)", "(38-43)", "(48-53)", "(60-100)"]
+GENDER_LABELS = ["Male", "Female"]
+
+# Pooled graphs are reused across unrelated images, so tracking between calls is disabled
+FACE_DETECTION = FaceDetectionBackend("face_detection", {"min_detection_confidence": 0.5})
+
+# Keyed by (Model.model_format, Model.handler). Backends are created here but import their runtime on first use
+BACKENDS = {
+    ("onnx", "googlenet_age"): GoogleNetBackend("age", AGE_LABELS),
+    ("onnx", "googlenet_gender"): GoogleNetBackend("gender", GENDER_LABELS),
+    ("mediapipe", "face_detection"): FACE_DETECTION,
+    ("mediapipe", "hands"): HandsBackend("hands", {"static_image_mode": True, "min_detection_confidence": 0.5, "min_tracking_confidence": 0.5}),
+    ("mediapipe", "pose"): PoseBackend("pose", {"static_image_mode": True, "min_detection_confidence": 0.5, "min_tracking_confidence": 0.5}),
+    ("yolo", "detection"): YoloBackend(),
+    ("cascade", "face_age_gender"): FaceCascadeBackend(FACE_DETECTION),
+}
+
+# Rows created before Model.handler existed are matched by name, and YOLO weights are detection models unless stated otherwise
+LEGACY_HANDLERS = {
+    "GoogleNet Age Classification Model": "googlenet_age",
+    "GoogleNet Gender Classification Model": "googlenet_gender",
+    "MediaPipe Face Detection": "face_detection",
+    "MediaPipe Hand Landmark": "hands",
+    "MediaPipe Full Body Pose Landmark": "pose",
+}
+DEFAULT_HANDLERS = {
+    "yolo": "detection",
+}
+
+
+def get_backend(modelObject):
+    handler = modelObject.handler or LEGACY_HANDLERS.get(modelObject.model_name) or DEFAULT_HANDLERS.get(modelObject.model_format)
+    backend = BACKENDS.get((modelObject.model_format, handler))
+    if backend is None:
+        raise ValueError(f"No backend for model format {modelObject.model_format!r} and handler {handler!r}.")
+    return backend
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BatchFailed(Exception):
+    pass
+
+
+class BatcherStopped(BatchFailed):
+    pass
+
+
+class BatchTimeout(BatchFailed):
+    pass
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size, max_wait, max_queue_depth, name):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        with self._lock:
+            # Checked under the lock stop() sets it with, so nothing is queued after the queue is drained
+            if self._stopped.is_set():
+                raise BatcherStopped("Model batcher was stopped.")
+            try:
+                self._queue.put_nowait((item, future))
+            except queue.Full:
+                raise QueueFull("Model queue is full.")
+        return future
+
+    def stop(self):
+        with self._lock:
+            self._stopped.set()
+        # Only wakes an idle thread, a full queue means the thread is busy and sees the flag after its batch
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _drain(self):
+        # Requests still waiting when the batcher stops are failed, so no caller waits on a future nobody resolves
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(BatcherStopped("Model batcher was stopped."))
+
+    def _collect(self, first):
+        # The window opens with the first request, so an idle model adds no latency beyond max_wait
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            first = self._queue.get()
+            if first is None:
+                continue
+
+            batch = self._collect(first)
+            futures = [future for _, future in batch if future.set_running_or_notify_cancel()]
+            items = [item for item, future in batch if future in futures]
+            if not items:
+                continue
+
+            try:
+                results = self.run_batch(items)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+        self._drain()
+
+    def status(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "batches": self.batches,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+        }
@@ -0,0 +1,213 @@
+import os
+import platform
+import re
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .backends import AGE_LABELS, GENDER_LABELS, FaceCascadeBackend, FaceDetectionBackend, GoogleNetBackend, LandmarkBackend, get_backend
+from .models import Model
+from .process import DecodedImage, decode_side, draw, mediapipe_pool, model_registry, run_inference
+
+
+# One model per backend, as unsaved rows so stub runs need neither a database nor model files
+STUB_MODELS = [
+    Model(id=-1, model_name="GoogleNet Age Classification Model", model_format="onnx", handler="googlenet_age", model_version="stub"),
+    Model(id=-2, model_name="GoogleNet Gender Classification Model", model_format="onnx", handler="googlenet_gender", model_version="stub"),
+    Model(id=-3, model_name="MediaPipe Face Detection", model_format="mediapipe", handler="face_detection", model_version="stub"),
+    Model(id=-4, model_name="MediaPipe Hand Landmark", model_format="mediapipe", handler="hands", model_version="stub"),
+    Model(id=-5, model_name="MediaPipe Full Body Pose Landmark", model_format="mediapipe", handler="pose", model_version="stub"),
+    Model(id=-6, model_name="YOLO v11 Object Detection (Best Model)", model_format="yolo", handler="detection", model_version="stub"),
+    Model(id=-7, model_name="Face Age and Gender Cascade", model_format="cascade", handler="face_age_gender", model_version="stub"),
+]
+
+METRICS = ["warm_p50_ms", "warm_p95_ms", "warm_p99_ms"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def synthetic_image(size, seed=0):
+    # Smooth gradients plus noise compress and decode like a photo, unlike pure noise
+    rng = np.random.default_rng(seed)
+    height, width = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * np.ones((height, 1, 3), dtype=np.float32)
+    noise = rng.normal(0, 24, (height, width, 3))
+    image_np = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    output = BytesIO()
+    Image.fromarray(image_np).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def stub_infer(decoded, modelObject):
+    # Fixed results of the right shape, so decoding, drawing and bookkeeping are measured without a model
+    width, height = decoded.rgb.size
+    box = [width // 4, height // 4, width * 3 // 4, height * 3 // 4]
+    backend = get_backend(modelObject)
+    if isinstance(backend, GoogleNetBackend):
+        return backend.result(np.full(len(backend.labels), 1 / len(backend.labels)))
+    elif isinstance(backend, FaceCascadeBackend):
+        classifications = {"age": {"label": AGE_LABELS[4], "scores": {}}, "gender": {"label": GENDER_LABELS[0], "scores": {}}}
+        return {"type": "detection", "detections": [{"box": box, "label": "face", "score": 1.0, "classifications": classifications}]}
+    elif isinstance(backend, FaceDetectionBackend):
+        return {"type": "detection", "detections": [{"box": box, "label": "face", "score": 1.0}]}
+    elif isinstance(backend, LandmarkBackend):
+        # Every landmark the model reports, on a circle inside the box, so every connection is drawn
+        angles = np.linspace(0, 2 * np.pi, backend.landmark_count, endpoint=False)
+        points = [[round(width / 2 + width / 4 * np.cos(angle), 2), round(height / 2 + height / 4 * np.sin(angle), 2), 0.0] for angle in angles]
+        return {"type": "landmarks", "landmarks": [points]}
+    return {"type": "detection", "detections": [{"box": box, "label": "object", "class": 0, "score": 1.0}]}
+
+
+def real_infer(decoded, modelObject):
+    return run_inference([decoded], modelObject)[0]
+
+
+def run_pipeline(binary_data, modelObject, infer_fn):
+    decoded = DecodedImage(binary_data)
+    result = infer_fn(decoded, modelObject)
+    draw(decoded, modelObject, result, BytesIO())
+
+
+def reset(modelObject):
+    # Cold runs start without the loaded model or any pooled MediaPipe graph
+    model_registry.evict(modelObject)
+    mediapipe_pool.clear()
+
+
+def memory_status(field):
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(rf"^{field}:\s+(\d+) kB", f.read(), re.M).group(1)) * 1024
+    except (OSError, AttributeError):
+        return None
+
+
+def reset_peak_rss():
+    # ru_maxrss never goes down, so the high-water mark is reset for each run to keep earlier runs out of its peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def rss_usage(run):
+    # Peak resident memory while run() ran, and how far it grew over the memory in use just before, None where Linux's /proc is missing
+    baseline = memory_status("VmRSS")
+    measured = reset_peak_rss()
+    run()
+    peak = memory_status("VmHWM") if measured else None
+    return peak, peak - baseline if peak is not None and baseline is not None else None
+
+
+def benchmark(modelObject, size, iterations, infer_fn):
+    binary_data = synthetic_image(size)
+
+    cold = None
+    latencies = []
+
+    def run():
+        nonlocal cold
+        start_time = time.perf_counter()
+        run_pipeline(binary_data, modelObject, infer_fn)
+        cold = time.perf_counter() - start_time
+        for _ in range(iterations):
+            start_time = time.perf_counter()
+            run_pipeline(binary_data, modelObject, infer_fn)
+            latencies.append(time.perf_counter() - start_time)
+
+    reset(modelObject)
+    # The cold run loads the model, so its memory is part of what this model costs
+    peak_rss, rss_growth = rss_usage(run)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "model_name": modelObject.model_name,
+        "size": f"{size[1]}x{size[0]}",
+        "iterations": iterations,
+        "cold_ms": round(cold * 1000, 3),
+        "warm_p50_ms": round(p50, 3),
+        "warm_p95_ms": round(p95, 3),
+        "warm_p99_ms": round(p99, 3),
+        "images_per_second": round(iterations / sum(latencies), 2),
+        "peak_rss_bytes": peak_rss,
+        "rss_growth_bytes": rss_growth,
+    }
+
+
+def result_key(result):
+    return f"{result['model_name']} @ {result['size']}"
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(results, baseline, threshold):
+    # Only warm latencies are compared, cold starts depend too much on the page cache
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(result_key(result))
+        if previous is None:
+            continue
+        for metric in METRICS:
+            if previous[metric] and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append({"key": result_key(result), "metric": metric, "baseline": previous[metric], "current": result[metric], "change": round(result[metric] / previous[metric] - 1, 4)})
+    return regressions
+
+
+def image_files(directory, limit=None):
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+def load_images(paths, modelObject):
+    # Decoded and preprocessed up front, variants of one model share the same input
+    backend = get_backend(modelObject)
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            decoded = DecodedImage(f.read(), decode_side(modelObject))
+        backend.prepare(decoded)
+        images.append(decoded)
+    return images
+
+
+def benchmark_variants(modelObjects, images, iterations):
+    # The first model is the reference, its labels and latency are what the other variants are compared against
+    backend = get_backend(modelObjects[0])
+    results = []
+    reference_labels = None
+    for modelObject in modelObjects:
+        model = backend.load(modelObject)
+        backend.warm(model)
+        labels = [backend.infer(decoded, model).get("label") for decoded in images]
+
+        latencies = []
+        for _ in range(iterations):
+            for decoded in images:
+                start_time = time.perf_counter()
+                backend.infer(decoded, model)
+                latencies.append(time.perf_counter() - start_time)
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+
+        if reference_labels is None:
+            reference_labels, reference_p50 = labels, p50
+        results.append(
+            {
+                "model_name": modelObject.model_name,
+                "precision": modelObject.precision,
+                "p50_ms": round(p50, 3),
+                "p95_ms": round(p95, 3),
+                "speedup": round(reference_p50 / p50, 2),
+                "top1_agreement": round(sum(label == reference_label for label, reference_label in zip(labels, reference_labels)) / len(labels), 4),
+            }
+        )
+    return results
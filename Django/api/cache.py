@@ -0,0 +1,125 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .models import ProcessedImage
+
+
+# Rough size of a cached row object on top of its result and any bytes it still carries from the bytea column
+ENTRY_OVERHEAD = 1024
+
+
+def content_hash(binary_data):
+    return hashlib.sha256(binary_data).hexdigest()
+
+
+def entry_size(processed_image):
+    # Results are JSON, and video results hold one list per frame, so their serialized size is what an entry costs
+    payload = len(json.dumps(processed_image.result)) + len(json.dumps(processed_image.stage_times))
+    return len(processed_image.binary_data or b"") + payload + ENTRY_OVERHEAD
+
+
+def result_cache_key(image_hash, modelObject, options=None):
+    options = ",".join(f"{name}={value}" for name, value in sorted((options or {}).items()))
+    return content_hash(f"{image_hash}:{modelObject.id}:{modelObject.model_version}:{options}".encode())
+
+
+class ResultCache:
+    def __init__(self, memory_budget, revalidate_after=60):
+        self.memory_budget = memory_budget
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()
+        # Row id to entry key, so a deleted row can be dropped without knowing its user
+        self._keys = {}
+        self._sizes = {}
+        self._checked = {}
+        self._memory_used = 0
+        self._model_versions = {}
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "database_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory_used -= self._sizes.pop(key)
+            self._keys.pop(entry.pk, None)
+            self._checked.pop(key, None)
+        return entry
+
+    def _check_version(self, modelObject):
+        # Entries are dropped as soon as a model is seen with a different version
+        known_version = self._model_versions.get(modelObject.id)
+        if known_version is not None and known_version != modelObject.model_version:
+            for key in [key for key, entry in self._entries.items() if entry.model_id == modelObject.id]:
+                self._remove(key)
+            self.counters["invalidations"] += 1
+        self._model_versions[modelObject.id] = modelObject.model_version
+
+    def get(self, user_id, cache_key, modelObject):
+        key = (user_id, cache_key)
+        with self._lock:
+            self._check_version(modelObject)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                # Deletions in this worker are dropped by discard(), rows deleted by other workers are caught when the entry is revalidated
+                if time.monotonic() - self._checked[key] < self.revalidate_after:
+                    self.counters["memory_hits"] += 1
+                    return entry
+
+        if entry is not None and ProcessedImage.objects.filter(pk=entry.pk).exists():
+            with self._lock:
+                if key in self._checked:
+                    self._checked[key] = time.monotonic()
+                self.counters["memory_hits"] += 1
+            return entry
+
+        processed_image = ProcessedImage.objects.filter(cache_key=cache_key, image__user_id=user_id).order_by("-id").first()
+        with self._lock:
+            if entry is not None and self._entries.get(key) is entry:
+                self._remove(key)
+            self.counters["database_hits" if processed_image is not None else "misses"] += 1
+        if processed_image is not None:
+            self.put(user_id, processed_image)
+        return processed_image
+
+    def put(self, user_id, processed_image):
+        key = (user_id, processed_image.cache_key)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = processed_image
+            self._keys[processed_image.pk] = key
+            self._checked[key] = time.monotonic()
+            # Kept per entry as a running total, so eviction never has to walk the whole cache
+            self._sizes[key] = entry_size(processed_image)
+            self._memory_used += self._sizes[key]
+            while self._memory_used > self.memory_budget and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, processed_image_id):
+        with self._lock:
+            key = self._keys.get(processed_image_id)
+            if key is not None:
+                self._remove(key)
+
+    def memory_used(self):
+        return self._memory_used
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._sizes.clear()
+            self._checked.clear()
+            self._memory_used = 0
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "memory_used": self._memory_used,
+                "memory_budget": self.memory_budget,
+            }
@@ -0,0 +1,38 @@
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .models import Image as ImageModel, ImageDerivative
+from .storage import open_blob, save_blob
+
+
+CONTENT_TYPES = {
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+
+def render_derivative(instance, size, output_format):
+    blob, _ = open_blob(instance)
+    with blob, Image.open(blob) as image:
+        # JPEG sources are decoded at a reduced scale instead of at full resolution
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if output_format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        output = BytesIO()
+        image.save(output, format=output_format.upper(), quality=settings.DERIVATIVE_QUALITY)
+    return save_blob(output.getvalue())
+
+
+def get_derivative(instance, size, output_format):
+    source = {"image": instance} if isinstance(instance, ImageModel) else {"processed_image": instance}
+    derivative = ImageDerivative.objects.filter(**source, size=size, output_format=output_format).first()
+    if derivative is None:
+        blob_key = render_derivative(instance, size, output_format)
+        # Concurrent first requests render the same bytes, so whichever row wins points at the same blob
+        derivative, _ = ImageDerivative.objects.get_or_create(**source, size=size, output_format=output_format, defaults={"blob_key": blob_key})
+    return derivative
@@ -0,0 +1,129 @@
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ProcessingJob
+from .process import process
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+executor = ThreadPoolExecutor(max_workers=settings.PROCESSING_JOB_WORKERS, thread_name_prefix="processing-job")
+_slots = threading.BoundedSemaphore(settings.PROCESSING_JOB_QUEUE_SIZE)
+HOSTNAME = socket.gethostname()
+
+
+def worker_id():
+    return f"{HOSTNAME}:{os.getpid()}"
+
+
+def run_job(job_id):
+    try:
+        # Claiming through a conditional update keeps two workers from running the same job
+        claimed = ProcessingJob.objects.filter(pk=job_id, status="queued").update(status="running", start_date=timezone.now(), worker=worker_id(), attempts=F("attempts") + 1)
+        if not claimed:
+            return
+
+        job = ProcessingJob.objects.select_related("image", "model").get(pk=job_id)
+        try:
+            # The annotated image is only drawn if the result is downloaded as an image
+            processed_image = process(job.image, job.model, render=False, stride=job.stride, tiling=job.tiling)
+            error = "" if processed_image is not None else "Failed to process image."
+        except Exception as e:
+            processed_image = None
+            error = str(e)
+
+        ProcessingJob.objects.filter(pk=job_id, status="running").update(
+            status="done" if processed_image is not None else "failed",
+            processed_image=processed_image,
+            error=error,
+            end_date=timezone.now(),
+        )
+    finally:
+        connection.close()
+
+
+def _release(future):
+    _slots.release()
+
+
+def _enqueue(job_id):
+    executor.submit(run_job, job_id).add_done_callback(_release)
+
+
+def submit_job(imageObject, modelObject, stride=1, tiling=None):
+    if not _slots.acquire(blocking=False):
+        raise JobQueueFull()
+
+    try:
+        job = ProcessingJob.objects.create(image=imageObject, model=modelObject, stride=stride, tiling=tiling)
+        _enqueue(job.id)
+    except Exception:
+        _slots.release()
+        raise
+    return job
+
+
+def worker_alive(worker):
+    hostname, _, pid = worker.rpartition(":")
+    if hostname != HOSTNAME or not pid.isdigit():
+        return None
+    # The worker resuming jobs has only just started, so a job claimed under its pid belongs to an earlier process
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def stale_jobs():
+    # Jobs of a worker on this host that is gone, or of any worker once they have run for longer than the timeout
+    timed_out = timezone.now() - timedelta(seconds=settings.PROCESSING_JOB_TIMEOUT)
+    running = ProcessingJob.objects.filter(status="running").values_list("id", "worker", "start_date")
+    return [job_id for job_id, worker, start_date in running if worker_alive(worker) is False or start_date < timed_out]
+
+
+def recover_stale_jobs():
+    stale = ProcessingJob.objects.filter(pk__in=stale_jobs(), status="running")
+    # A job that keeps taking its worker down is failed instead of being retried forever
+    failed = stale.filter(attempts__gte=settings.PROCESSING_JOB_MAX_ATTEMPTS).update(
+        status="failed",
+        error="The worker stopped while processing the job.",
+        end_date=timezone.now(),
+    )
+    requeued = stale.update(status="queued", start_date=None, worker="")
+    return requeued, failed
+
+
+def _resume_jobs():
+    try:
+        recover_stale_jobs()
+        # Resumed jobs take a slot like new ones, so the backlog never grows past PROCESSING_JOB_QUEUE_SIZE
+        for job_id in ProcessingJob.objects.filter(status="queued").order_by("id").values_list("id", flat=True):
+            _slots.acquire()
+            try:
+                _enqueue(job_id)
+            except Exception:
+                _slots.release()
+                raise
+    finally:
+        connection.close()
+
+
+def resume_jobs():
+    # Jobs that were queued or running when the previous worker stopped are picked up again, on a thread of their own
+    # since waiting for free slots on an executor thread could starve the jobs that would free them
+    threading.Thread(target=_resume_jobs, name="processing-job-resume", daemon=True).start()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Model
+from api.sessions import dynamic_batch_path, graph_inputs
+
+
+BATCH_AXIS = "batch"
+
+
+def constant_values(graph, name):
+    for initializer in graph.initializer:
+        if initializer.name == name:
+            return initializer
+    for node in graph.node:
+        if node.op_type == "Constant" and node.output[0] == name:
+            return node.attribute[0].t
+    return None
+
+
+def dynamic_batch_graph(model):
+    # Graphs converted from Caffe carry their batch size of 1 in the input and output shapes and in the Reshape targets
+    from onnx import numpy_helper
+
+    graph = model.graph
+    inputs = graph_inputs(graph)
+    batch_dim = inputs[0].type.tensor_type.shape.dim[0]
+    if not batch_dim.HasField("dim_value"):
+        return False
+    batch_size = batch_dim.dim_value
+
+    for value in [*inputs, *graph.output]:
+        dim = value.type.tensor_type.shape.dim[0]
+        if dim.HasField("dim_value") and dim.dim_value == batch_size:
+            dim.dim_param = BATCH_AXIS
+    # Inferred intermediate shapes still say 1, ONNX Runtime infers them again on load
+    del graph.value_info[:]
+
+    for node in graph.node:
+        if node.op_type != "Reshape":
+            continue
+        tensor = constant_values(graph, node.input[1])
+        if tensor is None:
+            continue
+        shape = numpy_helper.to_array(tensor).copy()
+        if len(shape) and shape[0] == batch_size:
+            # 0 copies the dimension from the Reshape input, which is the batch
+            shape[0] = 0
+            tensor.CopyFrom(numpy_helper.from_array(shape, tensor.name))
+    return True
+
+
+def batched_matches(path, sample_shape, batch_size=3, tolerance=1e-4):
+    # One run over a batch has to give what one run per image gives, or the rewrite changed the model
+    from onnxruntime import InferenceSession
+
+    session = InferenceSession(path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    input_batch = np.random.default_rng(0).uniform(-128, 128, (batch_size, *sample_shape)).astype(np.float32)
+    batched = session.run(None, {model_input.name: input_batch})[0]
+    single = np.concatenate([session.run(None, {model_input.name: input_batch[i : i + 1]})[0] for i in range(batch_size)])
+    return batched.shape == single.shape and np.allclose(batched, single, atol=tolerance)
+
+
+def make_dynamic_batch(source, target):
+    import onnx
+
+    model = onnx.load(source)
+    sample_shape = [dim.dim_value for dim in graph_inputs(model.graph)[0].type.tensor_type.shape.dim[1:]]
+    if not dynamic_batch_graph(model):
+        return False
+    onnx.checker.check_model(model)
+
+    # Written next to the target and checked before it is moved into place, so workers never load a broken graph
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(target) or ".") as temp_dir:
+        output = os.path.join(temp_dir, "dynamic.onnx")
+        onnx.save(model, output)
+        if not batched_matches(output, sample_shape):
+            raise CommandError(f"{source} gives different results once batched, it keeps running one image at a time.")
+        shutil.move(output, target)
+    return True
+
+
+class Command(BaseCommand):
+    help = "Rewrites the registered ONNX models that have a fixed batch size with a dynamic batch axis, so a batch runs in one call"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--models", nargs="+", help="Only rewrite these model names")
+        parser.add_argument("--force", action="store_true", help="Rewrite models that already have a dynamic-batch copy")
+
+    def handle(self, *args, **options):
+        modelObjects = Model.objects.filter(model_format="onnx", precision="fp32")
+        if options["models"]:
+            modelObjects = modelObjects.filter(model_name__in=options["models"])
+
+        failed = []
+        for modelObject in modelObjects:
+            target = dynamic_batch_path(modelObject.model_dir)
+            if not os.path.exists(modelObject.model_dir):
+                self.stdout.write(f"Missing weights: {modelObject.model_name}")
+            elif os.path.exists(target) and not options["force"]:
+                self.stdout.write(f"Exists: {modelObject.model_name}")
+            else:
+                try:
+                    converted = make_dynamic_batch(modelObject.model_dir, target)
+                except CommandError as e:
+                    failed.append(modelObject.model_name)
+                    self.stdout.write(f"Failed: {e}")
+                    continue
+                self.stdout.write(f"{'Rewritten' if converted else 'Already dynamic'}: {modelObject.model_name}")
+
+        if failed:
+            raise CommandError(f"Could not rewrite {', '.join(failed)}.")
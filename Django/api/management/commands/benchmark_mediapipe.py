@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.pool import SOLUTIONS, SolutionPool
+
+
+OPTIONS = {
+    "face_detection": {"min_detection_confidence": 0.5},
+    "hands": {"static_image_mode": True, "min_detection_confidence": 0.5, "min_tracking_confidence": 0.5},
+    "pose": {"static_image_mode": True, "min_detection_confidence": 0.5, "min_tracking_confidence": 0.5},
+}
+
+
+class Command(BaseCommand):
+    help = "Compares per-call MediaPipe latency with a fresh graph per call against the pooled graphs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--size", type=int, default=320, help="Side length of the synthetic square image")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        image_np = rng.integers(0, 256, (options["size"], options["size"], 3), dtype=np.uint8)
+        pool = SolutionPool(1)
+
+        for solution, solution_options in OPTIONS.items():
+            fresh = []
+            for _ in range(options["iterations"]):
+                start_time = time.perf_counter()
+                with SOLUTIONS[solution](solution_options) as instance:
+                    instance.process(image_np)
+                fresh.append(time.perf_counter() - start_time)
+
+            pooled = []
+            for _ in range(options["iterations"]):
+                start_time = time.perf_counter()
+                with pool.checkout(solution, **solution_options) as instance:
+                    instance.process(image_np)
+                pooled.append(time.perf_counter() - start_time)
+
+            fresh_ms = np.median(fresh) * 1000
+            pooled_ms = np.median(pooled) * 1000
+            self.stdout.write(f"{solution:<15} fresh: {fresh_ms:8.2f} ms  pooled: {pooled_ms:8.2f} ms  speedup: {fresh_ms / pooled_ms:5.1f}x")
+
+        pool.clear()
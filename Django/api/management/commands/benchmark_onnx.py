@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from onnxruntime import InferenceSession
+
+from api.models import Model
+from api.sessions import create_session, session_config
+
+
+class Command(BaseCommand):
+    help = "Compares ONNX session cold-start time and steady-state latency for the bare and the shipped session settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def measure(self, create):
+        start_time = time.perf_counter()
+        session = create()
+        cold_start = time.perf_counter() - start_time
+
+        model_input = session.get_inputs()[0]
+        shape = [dim if isinstance(dim, int) else 1 for dim in model_input.shape]
+        input_image = np.random.default_rng(0).standard_normal(shape).astype(np.float32)
+        session.run(None, {model_input.name: input_image})
+
+        latencies = []
+        for _ in range(self.iterations):
+            start_time = time.perf_counter()
+            session.run(None, {model_input.name: input_image})
+            latencies.append(time.perf_counter() - start_time)
+        return cold_start * 1000, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 95) * 1000
+
+    def handle(self, *args, **options):
+        self.iterations = options["iterations"]
+        cache_dir = tempfile.mkdtemp(prefix="onnx-benchmark-")
+        original_cache_dir = settings.ONNX_OPTIMIZED_CACHE_DIR
+        settings.ONNX_OPTIMIZED_CACHE_DIR = cache_dir
+
+        try:
+            for modelObject in Model.objects.filter(model_format="onnx"):
+                if not os.path.exists(modelObject.model_dir):
+                    self.stdout.write(self.style.WARNING(f"{modelObject.model_name}: {modelObject.model_dir} is missing, skipped"))
+                    continue
+
+                config = session_config(modelObject)
+                runs = {
+                    "bare InferenceSession": lambda: InferenceSession(modelObject.model_dir, providers=["CPUExecutionProvider"]),
+                    "tuned, no graph cache": lambda: create_session(modelObject.model_dir, modelObject.model_version, config, use_cache=False),
+                    "tuned, writing graph cache": lambda: create_session(modelObject.model_dir, modelObject.model_version, config),
+                    "tuned, cached graph": lambda: create_session(modelObject.model_dir, modelObject.model_version, config),
+                }
+
+                self.stdout.write(f"{modelObject.model_name} ({config})")
+                for name, create in runs.items():
+                    cold_start, p50, p95 = self.measure(create)
+                    self.stdout.write(f"  {name:<28} cold start: {cold_start:8.2f} ms  p50: {p50:7.2f} ms  p95: {p95:7.2f} ms")
+        finally:
+            settings.ONNX_OPTIMIZED_CACHE_DIR = original_cache_dir
+            shutil.rmtree(cache_dir, ignore_errors=True)
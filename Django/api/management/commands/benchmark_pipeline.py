@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import STUB_MODELS, benchmark, compare, environment, real_infer, stub_infer
+from api.models import Model
+
+
+def mebibytes(value):
+    return "      n/a" if value is None else f"{value / 2**20:5.1f} MiB"
+
+
+def parse_size(value):
+    width, _, height = value.partition("x")
+    return int(height or width), int(width)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks decode, inference and drawing for every model on synthetic images and compares the results against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", default=["320x240", "640x480", "1920x1080"], help="Synthetic image sizes as WIDTHxHEIGHT")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--models", nargs="+", help="Model names to benchmark, all models by default")
+        parser.add_argument("--stub", action="store_true", help="Replace inference with fixed results to measure pipeline overhead only")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+        parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown against the baseline, 0.2 is 20%%")
+
+    def handle(self, *args, **options):
+        if options["stub"]:
+            modelObjects = STUB_MODELS
+        else:
+            modelObjects = list(Model.objects.all())
+        if options["models"]:
+            modelObjects = [modelObject for modelObject in modelObjects if modelObject.model_name in options["models"]]
+        if not modelObjects:
+            raise CommandError("No models to benchmark.")
+
+        infer_fn = stub_infer if options["stub"] else real_infer
+        results = []
+        for modelObject in modelObjects:
+            for size in options["sizes"]:
+                result = benchmark(modelObject, parse_size(size), options["iterations"], infer_fn)
+                results.append(result)
+                self.stdout.write(
+                    f"{result['model_name']:<40} {result['size']:>10}  cold: {result['cold_ms']:9.2f} ms  "
+                    f"p50: {result['warm_p50_ms']:8.2f} ms  p95: {result['warm_p95_ms']:8.2f} ms  p99: {result['warm_p99_ms']:8.2f} ms  "
+                    f"{result['images_per_second']:7.2f} img/s  peak RSS: {mebibytes(result['peak_rss_bytes'])}  growth: {mebibytes(result['rss_growth_bytes'])}"
+                )
+
+        report = {"stub": options["stub"], "environment": environment(), "results": results}
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        if not options["baseline"]:
+            return
+
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        if baseline.get("stub") != options["stub"]:
+            raise CommandError("The baseline was recorded with a different --stub setting.")
+
+        regressions = compare(results, baseline, options["threshold"])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f"{regression['key']} {regression['metric']}: {regression['baseline']} -> {regression['current']} ms (+{regression['change']:.0%})"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) beyond {options['threshold']:.0%} of the baseline.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,83 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Model
+
+
+# Runtimes the web workers should only load once a model actually needs them
+HEAVY_MODULES = ["cv2", "mediapipe", "onnxruntime", "torch", "ultralytics"]
+
+# Each measurement runs in a fresh interpreter, anything imported by this command would otherwise already be loaded
+IMPORT_SCRIPT = """
+import json, os, sys, time
+start_time = time.perf_counter()
+import django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "deepsight.settings")
+django.setup()
+import api.views
+elapsed = time.perf_counter() - start_time
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+FIRST_REQUEST_SCRIPT = """
+import json, os, sys, time
+import django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "deepsight.settings")
+django.setup()
+import api.views
+from api.benchmark import real_infer, run_pipeline, synthetic_image
+from api.models import Model
+modelObject = Model.objects.get(pk=%d)
+binary_data = synthetic_image((480, 640))
+start_time = time.perf_counter()
+run_pipeline(binary_data, modelObject, real_infer)
+elapsed = time.perf_counter() - start_time
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measures how long a fresh worker takes to import the app and to serve the first request for each model"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters started per measurement")
+        parser.add_argument("--models", nargs="+", help="Model names to measure the first request for, all models by default")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def run(self, script):
+        completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise CommandError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "Measurement failed.")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def measure(self, script, repeat):
+        runs = [self.run(script) for _ in range(repeat)]
+        seconds = [run["seconds"] for run in runs]
+        return {
+            "median_ms": round(float(np.median(seconds)) * 1000, 3),
+            "max_ms": round(max(seconds) * 1000, 3),
+            "loaded_modules": runs[-1]["loaded"],
+        }
+
+    def handle(self, *args, **options):
+        import_result = self.measure(IMPORT_SCRIPT % HEAVY_MODULES, options["repeat"])
+        self.stdout.write(f"{'import':<45} median: {import_result['median_ms']} ms  max: {import_result['max_ms']} ms  loaded: {', '.join(import_result['loaded_modules']) or '-'}")
+
+        modelObjects = Model.objects.all()
+        if options["models"]:
+            modelObjects = modelObjects.filter(model_name__in=options["models"])
+
+        # First requests include loading the runtime and the model, which is what lazy imports move out of boot
+        first_requests = []
+        for modelObject in modelObjects:
+            result = {"model_name": modelObject.model_name, **self.measure(FIRST_REQUEST_SCRIPT % (modelObject.pk, HEAVY_MODULES), options["repeat"])}
+            first_requests.append(result)
+            self.stdout.write(f"{modelObject.model_name:<45} median: {result['median_ms']} ms  max: {result['max_ms']} ms  loaded: {', '.join(result['loaded_modules']) or '-'}")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"import": import_result, "first_request": first_requests}, f, indent=2)
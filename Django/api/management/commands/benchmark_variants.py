@@ -0,0 +1,45 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import benchmark_variants, environment, image_files, load_images
+from api.models import Model
+
+
+class Command(BaseCommand):
+    help = "Compares the latency and top-1 agreement of each precision variant against its FP32 model on a directory of images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", required=True, help="Directory of evaluation images, ideally not the calibration set")
+        parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument("--iterations", type=int, default=3, help="Passes over the images for the latency measurement")
+        parser.add_argument("--models", nargs="+", help="Model names to benchmark, all models with variants by default")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        paths = image_files(options["images"], options["limit"])
+        if not paths:
+            raise CommandError(f"No images in {options['images']}.")
+
+        bases = Model.objects.filter(variant_of__isnull=True, variants__isnull=False).distinct()
+        if options["models"]:
+            bases = bases.filter(model_name__in=options["models"])
+
+        results = []
+        for base in bases:
+            variants = [variant for variant in base.variants.order_by("precision") if os.path.exists(variant.model_dir)]
+            if not variants:
+                self.stdout.write(f"{base.model_name}: no variant has been built")
+                continue
+            images = load_images(paths, base)
+            for result in benchmark_variants([base, *variants], images, options["iterations"]):
+                results.append(result)
+                self.stdout.write(
+                    f"{result['model_name']:<50} {result['precision']:<5} p50: {result['p50_ms']} ms  p95: {result['p95_ms']} ms  "
+                    f"speedup: {result['speedup']}x  top-1 agreement: {result['top1_agreement']}"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"environment": environment(), "images": len(paths), "results": results}, f, indent=2)
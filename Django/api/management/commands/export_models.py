@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.backends import get_backend
+from api.benchmark import image_files, load_images
+from api.models import Model
+from api.sessions import create_session, session_config
+from api.yolo import YoloSession, box_iou, exported_path
+
+
+def matched_fraction(expected, actual, iou_threshold, score_tolerance):
+    # Share of the PyTorch detections that the ONNX graph found too, in the same class, place and confidence
+    if not expected:
+        return 1.0 if not actual else 0.0
+    matched = 0
+    for detection in expected:
+        candidates = [other for other in actual if other["class"] == detection["class"] and abs(other["score"] - detection["score"]) <= score_tolerance]
+        if candidates and box_iou(np.array(detection["box"]), np.array([other["box"] for other in candidates])).max() >= iou_threshold:
+            matched += 1
+    return matched / len(expected)
+
+
+class Command(BaseCommand):
+    help = "Exports the registered YOLO models to ONNX so they can be served with ONNX Runtime instead of PyTorch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--models", nargs="+", help="Only export these model names")
+        parser.add_argument("--imgsz", type=int, default=640)
+        parser.add_argument("--force", action="store_true", help="Export models that already have an ONNX graph")
+        parser.add_argument("--verify", help="Directory of images to compare the ONNX detections against PyTorch on")
+        parser.add_argument("--tolerance", type=float, default=0.95, help="Share of PyTorch detections the ONNX graph has to reproduce")
+
+    def export(self, modelObject, imgsz):
+        from ultralytics import YOLO
+
+        # Exported next to a copy of the weights, so a failed export never leaves a partial graph where workers look for it
+        target = exported_path(modelObject.model_dir)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(target) or ".") as temp_dir:
+            weights = shutil.copy(modelObject.model_dir, temp_dir)
+            exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=False)
+            os.replace(exported, target)
+
+    def verify(self, modelObject, paths, tolerance):
+        from ultralytics import YOLO
+
+        backend = get_backend(modelObject)
+        pytorch_model = YOLO(modelObject.model_dir)
+        onnx_model = YoloSession(create_session(exported_path(modelObject.model_dir), modelObject.model_version, session_config(modelObject), use_cache=False))
+        fractions = [
+            matched_fraction(backend.infer(decoded, pytorch_model)["detections"], backend.infer(decoded, onnx_model)["detections"], 0.9, 0.05)
+            for decoded in load_images(paths, modelObject)
+        ]
+        agreement = sum(fractions) / len(fractions)
+        self.stdout.write(f"Verified: {modelObject.model_name} reproduces {agreement:.1%} of the PyTorch detections on {len(paths)} images")
+        if agreement < tolerance:
+            raise CommandError(f"The ONNX export of {modelObject.model_name} is below the {tolerance:.0%} tolerance.")
+
+    def handle(self, *args, **options):
+        modelObjects = Model.objects.filter(model_format="yolo")
+        if options["models"]:
+            modelObjects = modelObjects.filter(model_name__in=options["models"])
+
+        paths = image_files(options["verify"]) if options["verify"] else []
+        if options["verify"] and not paths:
+            raise CommandError(f"No images in {options['verify']}.")
+
+        for modelObject in modelObjects:
+            if not os.path.exists(modelObject.model_dir):
+                self.stdout.write(f"Missing weights: {modelObject.model_name}")
+                continue
+            if os.path.exists(exported_path(modelObject.model_dir)) and not options["force"]:
+                self.stdout.write(f"Exists: {modelObject.model_name}")
+            else:
+                self.export(modelObject, options["imgsz"])
+                self.stdout.write(f"Exported: {modelObject.model_name}")
+            if paths:
+                self.verify(modelObject, paths, options["tolerance"])
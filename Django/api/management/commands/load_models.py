@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Model, ModelCategory
+
+
+# Manifest keys copied onto the Model row, model_dir is null for models without weights
+FIELDS = ["url", "model_dir", "model_format", "handler", "model_description", "model_version"]
+
+
+def variant_rows(model_info):
+    # Precision variants share the logical model's catalog entry and differ in their weights
+    yield model_info, None
+    for variant in model_info.get("variants", []):
+        precision = variant["precision"]
+        yield {
+            **model_info,
+            "url": "",
+            "model_name": f"{model_info['model_name']} ({precision.upper()})",
+            "model_version": f"{model_info['model_version']}-{precision}",
+            **variant,
+        }, model_info["model_name"]
+
+
+class Command(BaseCommand):
+    help = "Creates or updates the Model rows listed in a models.json manifest in one transaction, leaving unchanged rows alone"
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", nargs="?", default="models.json")
+        parser.add_argument("--models", nargs="+", help="Only load these model names from the manifest")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["manifest"]) as f:
+                models_data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['manifest']}: {e}")
+        if options["models"]:
+            models_data = [model_info for model_info in models_data if model_info["model_name"] in options["models"]]
+
+        rows = [row for model_info in models_data for row in variant_rows(model_info)]
+        counts = {"created": 0, "updated": 0, "unchanged": 0}
+        with transaction.atomic():
+            categories = {category.category_name: category for category in ModelCategory.objects.filter(category_name__in={model_info["model_category"] for model_info in models_data})}
+            existing = {modelObject.model_name: modelObject for modelObject in Model.objects.filter(model_name__in=[model_info["model_name"] for model_info, _ in rows])}
+
+            # Base models come before their variants, so variant_of can always be resolved
+            for model_info, base_name in rows:
+                category = categories.get(model_info["model_category"])
+                if category is None:
+                    category = categories[model_info["model_category"]] = ModelCategory.objects.create(category_name=model_info["model_category"])
+                values = {field: model_info.get(field) or "" for field in FIELDS}
+                values["runtime_options"] = model_info.get("runtime_options", {})
+                values["precision"] = model_info.get("precision", "fp32")
+                values["category_id"] = category.id
+                values["variant_of_id"] = existing[base_name].id if base_name else None
+
+                modelObject = existing.get(model_info["model_name"])
+                if modelObject is None:
+                    modelObject = existing[model_info["model_name"]] = Model.objects.create(model_name=model_info["model_name"], **values)
+                    status = "created"
+                else:
+                    changed = [field for field, value in values.items() if getattr(modelObject, field) != value]
+                    for field in changed:
+                        setattr(modelObject, field, values[field])
+                    if changed:
+                        modelObject.save(update_fields=changed)
+                    status = "updated" if changed else "unchanged"
+
+                counts[status] += 1
+                self.stdout.write(f"{status.capitalize()}: {model_info['model_name']}")
+
+        self.stdout.write(f"{counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged")
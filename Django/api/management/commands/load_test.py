@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Drives concurrent requests against a running server and reports throughput and latency per endpoint, optionally against an earlier run"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000/api/v1", help="Base URL of the API")
+        parser.add_argument("--token", help="Access token for the authenticated endpoints")
+        parser.add_argument("--get", nargs="*", default=["/models/", "/model_categories/", "/user/image/", "/user/processedimage/"], help="Paths requested with GET")
+        parser.add_argument("--post", nargs="*", default=[], help="Paths requested with POST, e.g. /user/image/1/process/2/?format=json")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--requests", type=int, default=500, help="Requests per path")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--baseline", help="JSON results of an earlier run, e.g. against the sync views, to compare against")
+
+    def opener(self, base_url):
+        # POSTs need the CSRF cookie and header, the same way the frontend gets them from /health
+        cookies = CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+        opener.open(f"{base_url}/health").read()
+        csrf_token = next((cookie.value for cookie in cookies if cookie.name == "csrftoken"), "")
+        return opener, csrf_token
+
+    def run_path(self, opener, csrf_token, url, method, options):
+        headers = {"X-CSRFToken": csrf_token, "Referer": url}
+        if options["token"]:
+            headers["Authorization"] = f"Bearer {options['token']}"
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def send(_):
+            nonlocal errors
+            request = urllib.request.Request(url, method=method, headers=headers, data=b"" if method == "POST" else None)
+            start_time = time.perf_counter()
+            try:
+                with opener.open(request) as httpresponse:
+                    httpresponse.read()
+            except (urllib.error.URLError, ConnectionError):
+                with lock:
+                    errors += 1
+                return
+            with lock:
+                latencies.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(send, range(options["requests"])))
+        elapsed = time.perf_counter() - start_time
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else (None, None, None)
+        return {
+            "method": method,
+            "path": url,
+            "requests": options["requests"],
+            "errors": errors,
+            "requests_per_second": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(p50, 3) if latencies else None,
+            "p95_ms": round(p95, 3) if latencies else None,
+            "p99_ms": round(p99, 3) if latencies else None,
+        }
+
+    def handle(self, *args, **options):
+        base_url = options["url"].rstrip("/")
+        try:
+            opener, csrf_token = self.opener(base_url)
+        except urllib.error.URLError as e:
+            raise CommandError(f"{base_url} is not reachable: {e}")
+
+        results = []
+        for method, paths in (("GET", options["get"]), ("POST", options["post"])):
+            for path in paths:
+                result = self.run_path(opener, csrf_token, base_url + path, method, options)
+                results.append(result)
+                self.stdout.write(
+                    f"{method:<5} {path:<45} {result['requests_per_second']:8.2f} req/s  "
+                    f"p50: {result['p50_ms']} ms  p95: {result['p95_ms']} ms  p99: {result['p99_ms']} ms  errors: {result['errors']}"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"concurrency": options["concurrency"], "results": results}, f, indent=2)
+
+        if not options["baseline"]:
+            return
+
+        with open(options["baseline"]) as f:
+            baseline = {(result["method"], result["path"]): result for result in json.load(f)["results"]}
+        self.stdout.write("\nAgainst the baseline:")
+        for result in results:
+            previous = baseline.get((result["method"], result["path"]))
+            if previous is None or not previous["requests_per_second"] or previous["p95_ms"] is None or result["p95_ms"] is None:
+                continue
+            self.stdout.write(
+                f"{result['method']:<5} {result['path']:<45} throughput: {result['requests_per_second'] / previous['requests_per_second']:5.2f}x  "
+                f"p95: {previous['p95_ms']} -> {result['p95_ms']} ms"
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Image, ProcessedImage
+from api.storage import save_blob
+
+
+class Command(BaseCommand):
+    help = "Moves image and processed image data out of the database columns into the blob store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def migrate(self, model, batch_size):
+        moved = 0
+        while True:
+            # Only ids are fetched per batch, blobs are then loaded one row at a time to keep memory bounded
+            ids = list(model.objects.filter(blob_key="").exclude(binary_data=b"").order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return moved
+
+            for pk in ids:
+                binary_data = model.objects.filter(pk=pk).values_list("binary_data", flat=True).first()
+                if binary_data is None:
+                    continue
+                blob_key = save_blob(binary_data)
+                updates = {"blob_key": blob_key, "binary_data": b""}
+                if model is Image:
+                    updates["content_hash"] = blob_key
+                model.objects.filter(pk=pk, blob_key="").update(**updates)
+                moved += 1
+
+            self.stdout.write(f"{model.__name__}: moved {moved} rows")
+
+    def handle(self, *args, **options):
+        for model in (Image, ProcessedImage):
+            moved = self.migrate(model, options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {moved} rows moved to the blob store"))
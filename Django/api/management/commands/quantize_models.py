@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from api.backends import get_backend
+from api.benchmark import image_files, load_images
+from api.models import Model
+from api.sessions import graph_path
+
+
+class CalibrationReader(CalibrationDataReader):
+    def __init__(self, modelObject, input_name, paths):
+        backend = get_backend(modelObject)
+        self.inputs = iter([{input_name: backend.model_input(decoded)} for decoded in load_images(paths, modelObject)])
+
+    def get_next(self):
+        return next(self.inputs, None)
+
+
+class Command(BaseCommand):
+    help = "Builds the INT8 ONNX variants listed in the model catalog from their FP32 models, calibrated on a directory of images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--calibration", help="Directory of representative images, required for static quantization")
+        parser.add_argument("--limit", type=int, default=200, help="Calibration images used per model")
+        parser.add_argument("--method", choices=["static", "dynamic"], default="static", help="Static quantizes activations too and is what speeds up convolutions")
+        parser.add_argument("--models", nargs="+", help="Only build the variants of these model names")
+        parser.add_argument("--force", action="store_true", help="Rebuild variants that already exist")
+
+    def quantize(self, variant, paths, method):
+        # Built from the dynamic-batch copy when there is one, so the variant batches like its base model
+        source = graph_path(variant.variant_of.model_dir)
+        os.makedirs(os.path.dirname(variant.model_dir) or ".", exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(variant.model_dir) or ".") as temp_dir:
+            # Shape inference and graph cleanup first, as the quantization tools expect
+            preprocessed = os.path.join(temp_dir, "preprocessed.onnx")
+            quant_pre_process(source, preprocessed)
+            output = os.path.join(temp_dir, "quantized.onnx")
+
+            if method == "dynamic":
+                quantize_dynamic(preprocessed, output, weight_type=QuantType.QInt8)
+            else:
+                from onnxruntime import InferenceSession
+
+                input_name = InferenceSession(source, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+                quantize_static(
+                    preprocessed,
+                    output,
+                    CalibrationReader(variant.variant_of, input_name, paths),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                )
+            # Moved into place only once complete, so workers never load a half-written model
+            os.replace(output, variant.model_dir)
+
+    def handle(self, *args, **options):
+        variants = Model.objects.select_related("variant_of").filter(precision="int8", model_format="onnx", variant_of__isnull=False)
+        if options["models"]:
+            variants = variants.filter(variant_of__model_name__in=options["models"])
+        if not variants:
+            raise CommandError("No INT8 variants in the catalog, run load_models first.")
+
+        paths = []
+        if options["method"] == "static":
+            if not options["calibration"]:
+                raise CommandError("Static quantization needs --calibration.")
+            paths = image_files(options["calibration"], options["limit"])
+            if not paths:
+                raise CommandError(f"No images in {options['calibration']}.")
+
+        for variant in variants:
+            if os.path.exists(variant.model_dir) and not options["force"]:
+                self.stdout.write(f"Exists: {variant.model_name}")
+                continue
+            self.quantize(variant, paths, options["method"])
+            self.stdout.write(f"Built: {variant.model_name} ({options['method']}, {os.path.getsize(variant.model_dir)} bytes)")
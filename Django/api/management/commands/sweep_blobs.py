@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models import BlobRelease
+from api.signals import sweep_blobs
+
+
+class Command(BaseCommand):
+    help = "Deletes the blobs nothing has referenced for longer than BLOB_DELETE_GRACE"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace", type=int, help="Seconds a released blob is kept, overrides BLOB_DELETE_GRACE")
+
+    def handle(self, *args, **options):
+        deleted = sweep_blobs(options["grace"], limit=None)
+        self.stdout.write(self.style.SUCCESS(f"{deleted} blobs deleted, {BlobRelease.objects.count()} pending"))
@@ -0,0 +1,125 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{format_labels(dict(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {series['count']}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {series['sum']}")
+        return lines
+
+
+class Gauge:
+    # Read when scraped, so the value always reflects the live object
+    def __init__(self, name, documentation, collect):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.monotonic() - start_time
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {name: round(seconds, 6) for name, seconds in self.stages.items()}
+
+
+stage_seconds = Histogram("deepsight_stage_seconds", "Time spent in each processing stage.", ["model", "stage"])
+request_seconds = Histogram("deepsight_request_seconds", "Time spent handling API requests.", ["view", "method"])
+requests_total = Counter("deepsight_requests_total", "API requests handled.", ["view", "method", "status"])
+
+registry = [stage_seconds, request_seconds, requests_total]
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def observe_stages(modelObject, timer):
+    for stage, seconds in timer.stages.items():
+        stage_seconds.observe(seconds, model=modelObject.model_name, stage=stage)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,36 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import request_seconds, requests_total
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI the chain stays async, otherwise every async view would be run through a thread
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def record(self, request, response, start_time):
+        # Labelled by route name rather than path, so ids in the URL do not create a series each
+        view = request.resolver_match.url_name if request.resolver_match else "unmatched"
+        request_seconds.observe(time.monotonic() - start_time, view=view, method=request.method)
+        requests_total.inc(view=view, method=request.method, status=response.status_code)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start_time = time.monotonic()
+        response = self.get_response(request)
+        self.record(request, response, start_time)
+        return response
+
+    async def __acall__(self, request):
+        start_time = time.monotonic()
+        response = await self.get_response(request)
+        self.record(request, response, start_time)
+        return response
@@ -13,11 +13,23 @@ class User(AbstractUser):
 class Image(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_images")
     binary_data = models.BinaryField()
+    blob_key = models.CharField(max_length=64, blank=True, db_index=True)
     is_processed = models.BooleanField(default=False)
     image_name = models.CharField(max_length=255, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
     image_format = models.CharField(max_length=10)
     image_size = models.PositiveIntegerField(null=True, blank=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Set for videos and animated GIFs, which are processed frame by frame (0 when the container does not say)
+    frame_count = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Covers the cursor-paginated listing so it can be answered from the index alone
+            models.Index(fields=["user", "-id"], include=["image_name", "image_format", "image_size", "upload_date", "is_processed"], name="image_user_listing_idx"),
+        ]
 
     def __str__(self):
         return f"Image {self.id} (User: {self.user})"
@@ -37,13 +49,31 @@ class Model(models.Model):
     MODEL_FORMAT_CHOICES = [
         ("yolo", "Yolo"),
         ("onnx", "ONNX"),
+        ("mediapipe", "MediaPipe"),
+        ("cascade", "Cascade"),
         ("tflite", "TFLite"),
         ("other", "Other"),
     ]
     model_format = models.CharField(max_length=20, choices=MODEL_FORMAT_CHOICES)
+    # Picks the backend for the format together with model_format, see api.backends.BACKENDS
+    handler = models.CharField(max_length=50, blank=True)
     model_description = models.TextField(blank=True)
     model_version = models.CharField(max_length=50)
+    # ONNX Runtime session overrides, see ONNX_SESSION_DEFAULTS
+    runtime_options = models.JSONField(default=dict, blank=True)
     category = models.ForeignKey(ModelCategory, on_delete=models.CASCADE, related_name="api_models")
+    PRECISION_CHOICES = [
+        ("fp32", "FP32"),
+        ("int8", "INT8"),
+    ]
+    # Variants are rows of their own, so loaded models, batches and cached results never mix precisions
+    precision = models.CharField(max_length=10, choices=PRECISION_CHOICES, default="fp32")
+    variant_of = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="variants")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["variant_of", "precision"], name="unique_model_variant"),
+        ]
 
     def __str__(self):
         return self.model_name
@@ -51,16 +81,87 @@ class Model(models.Model):
 
 class ProcessedImage(models.Model):
     image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name="api_processed_images")
+    # Copied from the image so the listing filters and orders on one table, null only for rows from before the column existed
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="api_processed_images")
     model = models.ForeignKey(Model, on_delete=models.CASCADE, related_name="api_processed_images")
     creation_date = models.DateTimeField(auto_now_add=True)
     binary_data = models.BinaryField()
+    blob_key = models.CharField(max_length=64, blank=True, db_index=True)
     processing_time = models.DurationField(null=True, blank=True)
     output_format = models.CharField(max_length=10, blank=True)
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    # Seconds spent in each stage of processing, keyed by stage name
+    stage_times = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Covers the cursor-paginated listing so it can be answered from the index alone
+            models.Index(fields=["user", "-id"], include=["image", "model", "creation_date", "processing_time", "output_format"], name="processed_image_listing_idx"),
+        ]
 
     def __str__(self):
         return f"Processed Image (Original: {self.image}, Model: {self.model}"
 
 
+class ImageDerivative(models.Model):
+    OUTPUT_FORMAT_CHOICES = [
+        ("webp", "WebP"),
+        ("jpeg", "JPEG"),
+        ("png", "PNG"),
+    ]
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, null=True, blank=True, related_name="api_derivatives")
+    processed_image = models.ForeignKey(ProcessedImage, on_delete=models.CASCADE, null=True, blank=True, related_name="api_derivatives")
+    size = models.PositiveIntegerField()
+    output_format = models.CharField(max_length=10, choices=OUTPUT_FORMAT_CHOICES)
+    blob_key = models.CharField(max_length=64, db_index=True)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["image", "size", "output_format"], name="unique_image_derivative"),
+            models.UniqueConstraint(fields=["processed_image", "size", "output_format"], name="unique_processed_image_derivative"),
+        ]
+
+    def __str__(self):
+        return f"Derivative {self.size}px {self.output_format} (Image: {self.image_id}, Processed Image: {self.processed_image_id})"
+
+
+class BlobRelease(models.Model):
+    # A blob nothing referenced any more when it was recorded, deleted by sweep_blobs once BLOB_DELETE_GRACE has passed
+    blob_key = models.CharField(max_length=64, unique=True)
+    release_date = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Blob Release {self.blob_key} ({self.release_date})"
+
+
+class ProcessingJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name="api_processing_jobs")
+    model = models.ForeignKey(Model, on_delete=models.CASCADE, related_name="api_processing_jobs")
+    processed_image = models.ForeignKey(ProcessedImage, on_delete=models.SET_NULL, null=True, blank=True, related_name="api_processing_jobs")
+    stride = models.PositiveIntegerField(default=1)
+    # Tiling requested for the job, see process.tiling_options
+    tiling = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    error = models.TextField(blank=True)
+    # hostname:pid of the worker running the job, so a restarted worker can tell which running jobs were orphaned
+    worker = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    creation_date = models.DateTimeField(auto_now_add=True)
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Processing Job {self.id} ({self.status}, Image: {self.image_id}, Model: {self.model})"
+
+
 class UserSetting(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     theme = models.CharField(
@@ -0,0 +1,100 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+def solutions():
+    # MediaPipe is only imported once a graph is actually needed
+    import mediapipe
+
+    return mediapipe.solutions
+
+
+SOLUTIONS = {
+    "face_detection": lambda options: solutions().face_detection.FaceDetection(**options),
+    "hands": lambda options: solutions().hands.Hands(**options),
+    "pose": lambda options: solutions().pose.Pose(**options),
+}
+
+
+class SolutionPool:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._idle = defaultdict(list)
+        self._created = defaultdict(int)
+        self._in_use = defaultdict(int)
+        # Woken whenever a graph is returned or discarded, so waiters either take it or create a replacement
+        self._available = threading.Condition()
+
+    @staticmethod
+    def key(solution, options):
+        return (solution, tuple(sorted(options.items())))
+
+    def _acquire(self, key, solution, options):
+        with self._available:
+            # Every graph for this key is checked out, wait for one to come back or for room to create one
+            self._available.wait_for(lambda: self._idle[key] or self._created[key] < self.max_size)
+            self._in_use[key] += 1
+            if self._idle[key]:
+                return self._idle[key].pop()
+            self._created[key] += 1
+
+        try:
+            return SOLUTIONS[solution](options)
+        except Exception:
+            with self._available:
+                self._created[key] -= 1
+                self._in_use[key] -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, key, instance):
+        with self._available:
+            self._in_use[key] -= 1
+            self._idle[key].append(instance)
+            self._available.notify()
+
+    def _discard(self, key, instance, in_use=True):
+        with self._available:
+            self._created[key] -= 1
+            if in_use:
+                self._in_use[key] -= 1
+            self._available.notify()
+        try:
+            instance.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def checkout(self, solution, **options):
+        key = self.key(solution, options)
+        instance = self._acquire(key, solution, options)
+        try:
+            yield instance
+        except Exception:
+            # A graph that failed mid-run may hold broken state, so it is not handed out again
+            self._discard(key, instance)
+            raise
+        else:
+            self._release(key, instance)
+
+    def clear(self):
+        with self._available:
+            idle = [(key, instance) for key, instances in self._idle.items() for instance in instances]
+            for instances in self._idle.values():
+                instances.clear()
+        for key, instance in idle:
+            self._discard(key, instance, in_use=False)
+
+    def status(self):
+        with self._available:
+            return [
+                {
+                    "solution": key[0],
+                    "options": dict(key[1]),
+                    "created": self._created[key],
+                    "in_use": self._in_use[key],
+                    "idle": len(self._idle[key]),
+                }
+                for key in self._created
+            ]
@@ -1,170 +1,641 @@
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageOps
 import numpy as np
-import cv2
-import mediapipe as mp
-import ultralytics
-from onnxruntime import InferenceSession
-from .models import ProcessedImage
-from datetime import datetime
-import time
-
-
-def load_model(model_dir, model_format):
-    if model_format == "yolo":
-        model = ultralytics.YOLO(model_dir)
-    elif model_format == "onnx":
-        model = InferenceSession(model_dir)
-    elif model_format == "mediapipe":
-        model = None
-    return model
-
-
-def process(imageObject, modelObject):
+from django.conf import settings
+from django.db import close_old_connections, connection
+from .models import Image as ImageModel, Model, ProcessedImage
+from .registry import ModelRegistry
+from .backends import get_backend, mediapipe_pool
+from .cache import ResultCache, content_hash, result_cache_key
+from .storage import get_blob_store, read_blob, save_blob
+from .batching import BatchFailed, BatcherStopped, BatchTimeout, MicroBatcher, QueueFull
+from .workers import get_inference_pool
+from .metrics import Gauge, StageTimer, observe_stages, register
+from .video import WRITERS, iter_frames, local_path, media_info
+from .yolo import box_ios, nms
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import cached_property
+from itertools import batched, islice
+import os
+import tempfile
+import asyncio
+import threading
+
+
+def load_model(modelObject):
+    return get_backend(modelObject).load(modelObject)
+
+
+def warm_model(model, modelObject):
+    # A dummy inference so the first real request does not pay for lazy initialisation
+    get_backend(modelObject).warm(model)
+
+
+model_registry = ModelRegistry(load_model, warm_model, settings.MODEL_REGISTRY_MEMORY_BUDGET)
+result_cache = ResultCache(settings.RESULT_CACHE_MEMORY_BUDGET, settings.RESULT_CACHE_REVALIDATE_AFTER)
+fanout_executor = ThreadPoolExecutor(max_workers=settings.FANOUT_WORKERS, thread_name_prefix="model-fanout")
+inference_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+def warm_up_models():
     try:
-        start_time = time.time()
-        image = Image.open(BytesIO(imageObject.binary_data))
-        model = load_model(modelObject.model_dir, modelObject.model_format)
-        processed_image_file = BytesIO()
-
-        # Google Net Models (ONNX)
-        if modelObject.model_name in ["GoogleNet Age Classification Model", "GoogleNet Gender Classification Model"]:
-            # Inferencing
-            image = image.convert("RGB")
-            image_np = np.array(image)
-            image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-            resized_image = cv2.resize(image_bgr, (224, 224))
-            input_image = resized_image - np.array([104, 117, 123])
-            input_image = np.transpose(input_image, [2, 0, 1])
-            input_image = np.expand_dims(input_image, axis=0).astype(np.float32)
-
-            input_name = model.get_inputs()[0].name
-            output = model.run(None, {input_name: input_image})
-            index = output[0].argmax()
-
-            text = ""
-            if "Gender" in modelObject.model_name:
-                gender = ["Male", "Female"][index]
-                text = f"Gender: {gender}"
+        names = settings.MODEL_REGISTRY_WARM_UP
+        if names == ["*"]:
+            models = list(Model.objects.all())
+        else:
+            models = list(Model.objects.filter(model_name__in=names))
+        model_registry.warm_up(models)
+    finally:
+        connection.close()
+
+
+def start_warm_up():
+    if not settings.MODEL_REGISTRY_WARM_UP:
+        model_registry.mark_ready()
+        return
+    threading.Thread(target=warm_up_models, name="model-warm-up", daemon=True).start()
+
+
+class DecodeBudgetExceeded(Exception):
+    pass
+
+
+# OpenCV decodes JPEGs at 1/2, 1/4 or 1/8 scale straight from the DCT coefficients
+REDUCED_FLAGS = {1: "IMREAD_COLOR", 2: "IMREAD_REDUCED_COLOR_2", 4: "IMREAD_REDUCED_COLOR_4", 8: "IMREAD_REDUCED_COLOR_8"}
+CV2_FORMATS = ["JPEG", "PNG", "WEBP", "BMP", "TIFF"]
+# Decode buffer, RGB array and the PIL image used for drawing
+DECODE_COPIES = 3
+
+
+def decode_reduction(image_format, width, height, max_side):
+    reduction = 1
+    if image_format != "JPEG":
+        return reduction
+    while reduction < 8:
+        next_width, next_height = -(-width // (reduction * 2)), -(-height // (reduction * 2))
+        fits_model = max_side is not None and max(next_width, next_height) >= max_side
+        over_budget = -(-width // reduction) * -(-height // reduction) > settings.DECODE_MAX_PIXELS
+        if not (fits_model or over_budget):
+            break
+        reduction *= 2
+    return reduction
+
+
+def decode_image(binary_data, max_side=None):
+    # The header is read without decoding, so the reduction and the budget are settled before any pixels are allocated
+    with Image.open(BytesIO(binary_data)) as header:
+        image_format, (width, height) = header.format, header.size
+        reduction = decode_reduction(image_format, width, height, max_side)
+        pixels = -(-width // reduction) * -(-height // reduction)
+        if pixels > settings.DECODE_MAX_PIXELS or pixels * 3 * DECODE_COPIES > settings.DECODE_MEMORY_BUDGET:
+            raise DecodeBudgetExceeded(f"Decoding {width}x{height} exceeds the decode budget.")
+
+        # EXIF orientation is applied once, by whichever decoder runs
+        if image_format in CV2_FORMATS:
+            import cv2
+
+            image_np = cv2.imdecode(np.frombuffer(memoryview(binary_data), dtype=np.uint8), getattr(cv2, REDUCED_FLAGS[reduction]))
+            if image_np is not None:
+                return cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB, dst=image_np)
+        return np.asarray(ImageOps.exif_transpose(header).convert("RGB"))
+
+
+class DecodedImage:
+    def __init__(self, binary_data, max_side=None):
+        self.binary_data = binary_data
+        self.max_side = max_side
+        self.inputs = {}
+        with Image.open(BytesIO(binary_data)) as header:
+            self.original_side = max(header.size)
+
+    @classmethod
+    def from_array(cls, rgb_np):
+        decoded = cls.__new__(cls)
+        decoded.binary_data = None
+        decoded.max_side = None
+        decoded.inputs = {}
+        decoded.original_side = max(rgb_np.shape[:2])
+        decoded.__dict__["rgb_np"] = rgb_np
+        return decoded
+
+    @cached_property
+    def rgb_np(self):
+        rgb_np = decode_image(self.binary_data, self.max_side)
+        self.binary_data = None
+        return rgb_np
+
+    @cached_property
+    def image(self):
+        return Image.fromarray(self.rgb_np)
+
+    @property
+    def rgb(self):
+        return self.image
+
+    @property
+    def scale(self):
+        # Results are stored in the coordinates of the original image, whatever size it was decoded at.
+        # Long sides are compared, so the factor does not depend on whether EXIF rotated the image
+        return self.original_side / max(self.rgb_np.shape[:2])
+
+    def input(self, key, build):
+        # Model inputs are kept per image, so models taking the same input share it
+        if key not in self.inputs:
+            self.inputs[key] = build(self.rgb_np)
+        return self.inputs[key]
+
+    def prepare(self, modelObjects):
+        # Shared intermediates are built up front so concurrent models only ever read them
+        self.rgb_np
+        for modelObject in modelObjects:
+            get_backend(modelObject).prepare(self)
+
+
+def decode_side(modelObject):
+    # The smallest long side each model needs, anything decoded larger is downsampled by the model anyway
+    side = (modelObject.runtime_options or {}).get("decode_max_side")
+    if side is not None:
+        return side
+    return get_backend(modelObject).decode_side
+
+
+def decode_max_side(modelObjects, render=False):
+    sides = [decode_side(modelObject) for modelObject in modelObjects]
+    if render:
+        sides.append(settings.DECODE_RENDER_MAX_SIDE)
+    return None if None in sides else max(sides)
+
+
+def scale_result(result, factor):
+    if factor == 1:
+        return result
+    if result["type"] == "detection":
+        return {**result, "detections": [{**detection, "box": [round(v * factor, 2) for v in detection["box"]]} for detection in result["detections"]]}
+    if result["type"] == "landmarks":
+        return {**result, "landmarks": [[[round(x * factor, 2), round(y * factor, 2), z] for x, y, z in points] for points in result["landmarks"]]}
+    return result
+
+
+def infer_batch(images, modelObject, model):
+    results = get_backend(modelObject).infer_batch(images, model)
+    return [scale_result(result, image.scale) for result, image in zip(results, images)]
+
+
+def tiling_options(imageObject, modelObject, tiling=None):
+    # The tile size and overlap to run with, or None for a single pass over the whole image
+    tiling = tiling or {}
+    mode = tiling.get("mode", "auto")
+    if mode == "off" or imageObject.frame_count is not None or not get_backend(modelObject).tileable:
+        return None
+    if mode == "auto" and (imageObject.image_width or 0) * (imageObject.image_height or 0) <= settings.TILING_PIXEL_THRESHOLD:
+        return None
+    return {"tile_size": tiling.get("tile_size") or settings.TILE_SIZE, "overlap": tiling.get("overlap", settings.TILE_OVERLAP)}
+
+
+def tile_grid(width, height, tile_size, overlap):
+    # The last row and column are aligned to the far edges, so every tile is full size
+    step = max(int(tile_size * (1 - overlap)), 1)
+    xs = list(range(0, max(width - tile_size, 0) + 1, step))
+    ys = list(range(0, max(height - tile_size, 0) + 1, step))
+    if xs[-1] + tile_size < width:
+        xs.append(width - tile_size)
+    if ys[-1] + tile_size < height:
+        ys.append(height - tile_size)
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for y in ys for x in xs]
+
+
+def infer_tiles(rgb_np, regions, modelObject):
+    images = [DecodedImage.from_array(np.ascontiguousarray(rgb_np[y1:y2, x1:x2])) for x1, y1, x2, y2 in regions]
+    return run_inference(images, modelObject)
+
+
+def infer_tiled(decoded, modelObject, tile_size, overlap):
+    rgb_np = decoded.rgb_np
+    height, width = rgb_np.shape[:2]
+    # Tile sizes are given in original pixels, and grown when a huge image would need too many tiles
+    tile_size = max(int(tile_size / decoded.scale), 32)
+    grid = tile_grid(width, height, tile_size, overlap)
+    while len(grid) > settings.TILING_MAX_TILES:
+        tile_size = int(tile_size * 1.25)
+        grid = tile_grid(width, height, tile_size, overlap)
+
+    # The whole image runs as one more tile, so objects larger than a tile are still found in one piece
+    regions = [(0, 0, width, height), *grid]
+    # Tiles are cut per batch, so only the batches in flight hold copies of the pixels
+    futures = [fanout_executor.submit(infer_tiles, rgb_np, batch, modelObject) for batch in batched(regions, settings.TILE_BATCH_SIZE)]
+    results = [result for future in futures for result in future.result()]
+
+    detections = [
+        {**detection, "box": [round(detection["box"][0] + x1, 2), round(detection["box"][1] + y1, 2), round(detection["box"][2] + x1, 2), round(detection["box"][3] + y1, 2)]}
+        for (x1, y1, _, _), result in zip(regions, results)
+        for detection in result["detections"]
+    ]
+    if detections:
+        keep = nms(
+            np.array([detection["box"] for detection in detections], dtype=np.float32),
+            np.array([detection["score"] for detection in detections], dtype=np.float32),
+            np.array([detection.get("class", 0) for detection in detections]),
+            settings.TILE_NMS_THRESHOLD,
+            overlap=box_ios,
+        )
+        detections = [detections[i] for i in keep]
+    return {"type": "detection", "detections": detections, "tiling": {"tile_size": round(tile_size * decoded.scale), "overlap": overlap, "tiles": len(grid)}}
+
+
+def run_inference(images, modelObject):
+    # With INFERENCE_PROCESSES set, decoded pixels go to the inference processes through shared memory
+    if settings.INFERENCE_PROCESSES:
+        results = get_inference_pool(settings.INFERENCE_PROCESSES, settings.INFERENCE_PROCESS_TIMEOUT).infer_batch(images, modelObject)
+        # The inference processes only see the decoded pixels, so mapping back to the original size happens here
+        return [scale_result(result, image.scale) for result, image in zip(results, images)]
+    return infer_batch(images, modelObject, model_registry.get(modelObject))
+
+
+class BatchScheduler:
+    def __init__(self):
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def options(modelObject):
+        return {**settings.MICRO_BATCHING, **(modelObject.runtime_options or {}).get("batching", {})}
+
+    def batcher(self, modelObject):
+        # MediaPipe graphs and fixed-batch ONNX graphs take one image at a time, so only models that run whole batches are batched
+        options = self.options(modelObject)
+        if not options["enabled"] or not get_backend(modelObject).batches(modelObject):
+            return None
+
+        key = ModelRegistry.key(modelObject)
+        with self._lock:
+            batcher = self._batchers.get(key)
+            if batcher is None:
+                for stale_key in [k for k in self._batchers if k[0] == key[0]]:
+                    self._batchers.pop(stale_key).stop()
+                batcher = self._batchers[key] = MicroBatcher(
+                    lambda images: run_inference(images, modelObject),
+                    options["max_batch_size"],
+                    options["max_wait_ms"] / 1000,
+                    options["max_queue_depth"],
+                    name=f"batcher-{modelObject.id}",
+                )
+        return batcher
+
+    def infer(self, decoded, modelObject):
+        batcher = self.batcher(modelObject)
+        if batcher is None:
+            return run_inference([decoded], modelObject)[0]
+        options = self.options(modelObject)
+        try:
+            future = batcher.submit(decoded)
+        except BatcherStopped:
+            # The model version changed between looking the batcher up and submitting, its replacement takes the request
+            future = self.batcher(modelObject).submit(decoded)
+        try:
+            return future.result(timeout=options["timeout_s"])
+        except FutureTimeoutError:
+            future.cancel()
+            raise BatchTimeout("Model did not answer in time.")
+
+    def status(self):
+        with self._lock:
+            return [{"id": key[0], "model_version": key[1], **batcher.status()} for key, batcher in self._batchers.items()]
+
+
+batch_scheduler = BatchScheduler()
+
+
+def inference_pool_status():
+    if not settings.INFERENCE_PROCESSES:
+        return None
+    return get_inference_pool(settings.INFERENCE_PROCESSES, settings.INFERENCE_PROCESS_TIMEOUT).status()
+
+
+register(Gauge("deepsight_batch_queue_depth", "Requests waiting in each model's micro-batch queue.", lambda: [({"model_id": batcher["id"], "model_version": batcher["model_version"]}, batcher["queue_depth"]) for batcher in batch_scheduler.status()]))
+register(Gauge("deepsight_model_cache_models", "Models loaded in the model registry.", lambda: [({}, len(model_registry.status()["loaded_models"]))]))
+register(Gauge("deepsight_model_cache_bytes", "Estimated memory held by loaded models.", lambda: [({}, model_registry.status()["memory_used"])]))
+register(Gauge("deepsight_model_cache_budget_bytes", "Memory budget of the model registry.", lambda: [({}, model_registry.memory_budget)]))
+register(Gauge("deepsight_result_cache_entries", "Entries in the in-memory result cache.", lambda: [({}, result_cache.status()["entries"])]))
+register(Gauge("deepsight_result_cache_bytes", "Estimated memory held by the result cache.", lambda: [({}, result_cache.status()["memory_used"])]))
+register(Gauge("deepsight_mediapipe_graphs", "Pooled MediaPipe graphs by state.", lambda: [({"solution": graph["solution"], "state": state}, graph[state]) for graph in mediapipe_pool.status() for state in ("in_use", "idle")]))
+
+
+def annotate(decoded, modelObject, result):
+    return get_backend(modelObject).annotate(decoded, scale_result(result, 1 / decoded.scale))
+
+
+def encode(annotated, processed_image_file):
+    # YOLO annotations come back as a BGR array like results.plot(), everything else as a PIL image
+    if isinstance(annotated, np.ndarray):
+        import cv2
+
+        processed_image_file.write(cv2.imencode(".jpg", annotated)[1].tobytes())
+    else:
+        annotated.save(processed_image_file, format="JPEG")
+    processed_image_file.seek(0)
+
+
+def draw(decoded, modelObject, result, processed_image_file):
+    encode(annotate(decoded, modelObject, result), processed_image_file)
+
+
+def render_processed_image(processed_image, decoded=None, timer=None):
+    # Annotated images are drawn from the stored result the first time someone asks for them
+    if processed_image.blob_key or processed_image.result is None:
+        return processed_image
+
+    # Without a timer from process() this is a lazy render, whose stages are added to the existing breakdown
+    lazy = timer is None
+    if lazy:
+        timer = StageTimer()
+    if decoded is None:
+        with timer.stage("decode"):
+            decoded = DecodedImage(read_blob(processed_image.image), settings.DECODE_RENDER_MAX_SIDE)
+            decoded.rgb_np
+
+    with timer.stage("draw"):
+        annotated = annotate(decoded, processed_image.model, processed_image.result)
+    processed_image_file = BytesIO()
+    with timer.stage("encode"):
+        encode(annotated, processed_image_file)
+    with timer.stage("store"):
+        processed_image.blob_key = save_blob(processed_image_file.getvalue())
+
+    processed_image.output_format = "JPEG"
+    processed_image.stage_times = {**(processed_image.stage_times or {}), **timer.as_dict()}
+    fields = {"blob_key": processed_image.blob_key, "output_format": "JPEG", "stage_times": processed_image.stage_times}
+    if not lazy:
+        processed_image.processing_time = fields["processing_time"] = timedelta(seconds=timer.total())
+    ProcessedImage.objects.filter(pk=processed_image.pk).update(**fields)
+
+    if lazy:
+        observe_stages(processed_image.model, timer)
+    return processed_image
+
+
+def image_content_hash(imageObject):
+    # Images uploaded before hashing was introduced are hashed on first use
+    if not imageObject.content_hash:
+        imageObject.content_hash = imageObject.blob_key or content_hash(read_blob(imageObject))
+        ImageModel.objects.filter(pk=imageObject.pk).update(content_hash=imageObject.content_hash)
+    return imageObject.content_hash
+
+
+def infer_frames(frames, modelObject):
+    import cv2
+
+    images = (DecodedImage.from_array(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) for frame in frames)
+    backend = get_backend(modelObject)
+    if backend.tracking:
+        yield from backend.track(images)
+        return
+
+    for batch in batched(images, settings.VIDEO_BATCH_SIZE):
+        yield from zip(batch, run_inference(list(batch), modelObject))
+
+
+def to_bgr(annotated):
+    import cv2
+
+    return annotated if isinstance(annotated, np.ndarray) else cv2.cvtColor(np.asarray(annotated.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def process_video(imageObject, modelObject, stride):
+    timer = StageTimer()
+    with timer.stage("cache_lookup"):
+        cache_key = result_cache_key(image_content_hash(imageObject), modelObject, {"stride": stride})
+        cached = result_cache.get(imageObject.user_id, cache_key, modelObject)
+    if cached is not None:
+        observe_stages(modelObject, timer)
+        return cached
+
+    if not settings.INFERENCE_PROCESSES:
+        with timer.stage("model_load"):
+            model_registry.get(modelObject)
+
+    # Videos are drawn in the same pass, decoding the clip a second time later would cost more than drawing now
+    output_format = "GIF" if imageObject.image_format == "gif" else "MP4"
+    frame_results = []
+    with local_path(imageObject.blob_key, imageObject.image_format) as path, tempfile.TemporaryDirectory() as temp_dir:
+        _, _, frame_count, fps = media_info(path)
+        output_path = os.path.join(temp_dir, f"output.{output_format.lower()}")
+        writer = WRITERS[output_format](output_path, fps / stride)
+        try:
+            frames = infer_frames(islice(iter_frames(path, stride), settings.VIDEO_MAX_FRAMES), modelObject)
+            while True:
+                # Frames are decoded lazily, so decoding is counted together with inference
+                with timer.stage("decode_inference"):
+                    item = next(frames, None)
+                if item is None:
+                    break
+                decoded, result = item
+                frame_results.append(result)
+                with timer.stage("draw"):
+                    annotated = to_bgr(annotate(decoded, modelObject, result))
+                with timer.stage("encode"):
+                    writer.write(annotated)
+        finally:
+            writer.close()
+
+        with timer.stage("store"), open(output_path, "rb") as f:
+            blob_key, _ = get_blob_store().save(iter(lambda: f.read(1024 * 1024), b""))
+
+    result = {
+        "type": "video",
+        "fps": round(fps / stride, 3),
+        "stride": stride,
+        "truncated": len(frame_results) == settings.VIDEO_MAX_FRAMES and frame_count > settings.VIDEO_MAX_FRAMES * stride,
+        "frames": frame_results,
+    }
+    with timer.stage("db_insert"):
+        processed_image = ProcessedImage.objects.create(image=imageObject, user_id=imageObject.user_id, model=modelObject, result=result, blob_key=blob_key, output_format=output_format, processing_time=timedelta(seconds=timer.total()), stage_times=timer.as_dict(), cache_key=cache_key)
+    observe_stages(modelObject, timer)
+    result_cache.put(imageObject.user_id, processed_image)
+
+    imageObject.is_processed = True
+    imageObject.save()
+
+    return processed_image
+
+
+def process(imageObject, modelObject, render=True, stride=1, tiling=None):
+    try:
+        if imageObject.frame_count is not None:
+            return process_video(imageObject, modelObject, stride)
+
+        timer = StageTimer()
+        tiles = tiling_options(imageObject, modelObject, tiling)
+        with timer.stage("cache_lookup"):
+            cache_key = result_cache_key(image_content_hash(imageObject), modelObject, tiles)
+            cached = result_cache.get(imageObject.user_id, cache_key, modelObject)
+        if cached is not None:
+            observe_stages(modelObject, timer)
+            return render_processed_image(cached) if render else cached
+
+        # Tiles are cut from the full resolution image, which is what makes small objects visible to the model
+        with timer.stage("decode"):
+            decoded = DecodedImage(read_blob(imageObject), None if tiles else decode_max_side([modelObject], render))
+            decoded.rgb_np
+
+        # Loaded here rather than inside the batcher so loading is not counted as inference
+        if not settings.INFERENCE_PROCESSES:
+            with timer.stage("model_load"):
+                model_registry.get(modelObject)
+
+        with timer.stage("preprocess"):
+            decoded.prepare([modelObject])
+
+        # Requests for the same model that arrive together share one batched inference
+        with timer.stage("inference"):
+            if tiles:
+                result = scale_result(infer_tiled(decoded, modelObject, **tiles), decoded.scale)
             else:
-                age = ["(0-2)", "(4-6)", "(8-12)", "(15-20)", "(25-32)", "(38-43)", "(48-53)", "(60-100)"][index]
-                text = f"Age: {age}"
-
-            image_width, image_height = image.size
-            new_height = image_height + 150
-            new_image = Image.new("RGB", (image_width, new_height), color=(0, 0, 0))
-            new_image.paste(image, (0, 0))
-
-            draw = ImageDraw.Draw(new_image)
-
-            font = ImageFont.truetype("static/EudoxusSans-Bold.ttf", 40)
-
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-
-            text_position = ((image_width - text_width) // 2, image_height + 50)
-
-            draw.text(text_position, text, font=font, fill="white")
-
-            new_image.save(processed_image_file, format="JPEG")
-            processed_image_file.seek(0)
-
-        # MediaPipe Models (Face Detection using MediaPipe)
-        elif modelObject.model_name == "MediaPipe Face Detection":
-            # Using MediaPipe's Face Detection solution
-            mp_face_detection = mp.solutions.face_detection
-
-            with mp_face_detection.FaceDetection(min_detection_confidence=0.5) as face_detection:
-                image = image.convert("RGB")
-                image_np = np.array(image)
-                results = face_detection.process(image_np)
-
-                draw = ImageDraw.Draw(image)
-                if results.detections:
-                    for detection in results.detections:
-                        bboxC = detection.location_data.relative_bounding_box
-                        ih, iw, _ = image_np.shape
-                        x, y, w, h = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.width * iw), int(bboxC.height * ih)
-                        draw.rectangle([x, y, x + w, y + h], outline="red", width=5)
-
-                image.save(processed_image_file, format="JPEG")
-                processed_image_file.seek(0)
-
-        # MediaPipe Models (Hand Landmark)
-        elif modelObject.model_name == "MediaPipe Hand Landmark":
-            mp_hands = mp.solutions.hands
-
-            with mp_hands.Hands(min_detection_confidence=0.5, min_tracking_confidence=0.5) as hands:
-                image = image.convert("RGB")
-                image_np = np.array(image)
-                results = hands.process(image_np)
-
-                draw = ImageDraw.Draw(image)
-                if results.multi_hand_landmarks:
-                    for landmarks in results.multi_hand_landmarks:
-                        for connection in mp_hands.HAND_CONNECTIONS:
-                            start_idx = connection[0]
-                            end_idx = connection[1]
-                            x_start = int(landmarks.landmark[start_idx].x * image.width)
-                            y_start = int(landmarks.landmark[start_idx].y * image.height)
-                            x_end = int(landmarks.landmark[end_idx].x * image.width)
-                            y_end = int(landmarks.landmark[end_idx].y * image.height)
-                            draw.line([(x_start, y_start), (x_end, y_end)], fill="red", width=2)
-
-                        for landmark in landmarks.landmark:
-                            x = int(landmark.x * image.width)
-                            y = int(landmark.y * image.height)
-                            draw.ellipse([x - 5, y - 5, x + 5, y + 5], fill="red")
-
-                image.save(processed_image_file, format="JPEG")
-                processed_image_file.seek(0)
-
-        # MediaPipe Models (Full Body Pose Landmark)
-        elif modelObject.model_name == "MediaPipe Full Body Pose Landmark":
-            mp_pose = mp.solutions.pose
-
-            with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-                image = image.convert("RGB")
-                image_np = np.array(image)
-                results = pose.process(image_np)
-
-                draw = ImageDraw.Draw(image)
-                if results.pose_landmarks:
-                    for connection in mp_pose.POSE_CONNECTIONS:
-                        start_idx = connection[0]
-                        end_idx = connection[1]
-                        x_start = int(results.pose_landmarks.landmark[start_idx].x * image.width)
-                        y_start = int(results.pose_landmarks.landmark[start_idx].y * image.height)
-                        x_end = int(results.pose_landmarks.landmark[end_idx].x * image.width)
-                        y_end = int(results.pose_landmarks.landmark[end_idx].y * image.height)
-                        draw.line([(x_start, y_start), (x_end, y_end)], fill="red", width=2)
-
-                    for landmark in results.pose_landmarks.landmark:
-                        x = int(landmark.x * image.width)
-                        y = int(landmark.y * image.height)
-                        draw.ellipse([x - 5, y - 5, x + 5, y + 5], fill="red")
-
-                image.save(processed_image_file, format="JPEG")
-                processed_image_file.seek(0)
-
-        # YOLO Models (Ultralytics)
-        elif modelObject.model_name == "YOLO v11 Object Detection (Best Model)":
-            # Inferencing
-            results = model(image)[0]
-
-            # Drawing
-            plot = results.plot()
-            im_bytes = cv2.imencode(".jpg", plot)[1].tobytes()
-            processed_image_file.write(im_bytes)
-            processed_image_file.seek(0)
-
-        processed_image = ProcessedImage.objects.create(image=imageObject, model=modelObject, output_format="JPEG", binary_data=processed_image_file.getvalue(), processing_time=datetime.now() - datetime.fromtimestamp(start_time))
+                result = batch_scheduler.infer(decoded, modelObject)
+
+        with timer.stage("db_insert"):
+            processed_image = ProcessedImage.objects.create(image=imageObject, user_id=imageObject.user_id, model=modelObject, result=result, processing_time=timedelta(seconds=timer.total()), stage_times=timer.as_dict(), cache_key=cache_key)
+        if render:
+            render_processed_image(processed_image, decoded, timer)
+        observe_stages(modelObject, timer)
+        result_cache.put(imageObject.user_id, processed_image)
 
         imageObject.is_processed = True
         imageObject.save()
 
         return processed_image
 
+    except (QueueFull, BatchFailed, DecodeBudgetExceeded):
+        raise
+
     except Exception as e:
         print(f"Error during processing: {e}")
         return None
+
+
+def process_in_executor(imageObject, modelObject, render, stride, tiling):
+    # Executor threads keep their database connections between requests, so stale ones are dropped like at request boundaries
+    close_old_connections()
+    try:
+        return process(imageObject, modelObject, render, stride, tiling)
+    finally:
+        close_old_connections()
+
+
+async def aprocess(imageObject, modelObject, render=True, stride=1, tiling=None):
+    # Async views hand the whole pipeline to a dedicated executor so inference never runs on the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, process_in_executor, imageObject, modelObject, render, stride, tiling)
+
+
+def process_multi(imageObject, modelObjects, tiling=None):
+    try:
+        image_hash = image_content_hash(imageObject)
+        tiles = {modelObject.id: tiling_options(imageObject, modelObject, tiling) for modelObject in modelObjects}
+        cache_keys = {modelObject.id: result_cache_key(image_hash, modelObject, tiles[modelObject.id]) for modelObject in modelObjects}
+        cached = {modelObject.id: result_cache.get(imageObject.user_id, cache_keys[modelObject.id], modelObject) for modelObject in modelObjects}
+        pending = [modelObject for modelObject in modelObjects if cached[modelObject.id] is None]
+        if not pending:
+            return [cached[modelObject.id] for modelObject in modelObjects]
+
+        shared = StageTimer()
+        with shared.stage("decode"):
+            decoded = DecodedImage(read_blob(imageObject), None if any(tiles[modelObject.id] for modelObject in pending) else decode_max_side(pending))
+            decoded.rgb_np
+        with shared.stage("preprocess"):
+            decoded.prepare(pending)
+        # With INFERENCE_PROCESSES set the models live in the inference processes, not in this worker
+        if not settings.INFERENCE_PROCESSES:
+            with shared.stage("model_load"):
+                for modelObject in pending:
+                    model_registry.get(modelObject)
+
+        def run(modelObject):
+            timer = StageTimer()
+            timer.stages.update(shared.stages)
+            with timer.stage("inference"):
+                if tiles[modelObject.id]:
+                    result = scale_result(infer_tiled(decoded, modelObject, **tiles[modelObject.id]), decoded.scale)
+                else:
+                    result = run_inference([decoded], modelObject)[0]
+            return result, timer
+
+        # ONNX Runtime and MediaPipe release the GIL while inferencing, so the models overlap
+        # Tiled models spread their tiles over the same executor, so they run here rather than wait inside it
+        futures = {modelObject.id: fanout_executor.submit(run, modelObject) for modelObject in pending if not tiles[modelObject.id]}
+        outputs = [futures[modelObject.id].result() if modelObject.id in futures else run(modelObject) for modelObject in pending]
+
+        processed_images = ProcessedImage.objects.bulk_create(
+            ProcessedImage(image=imageObject, user_id=imageObject.user_id, model=modelObject, result=result, processing_time=timedelta(seconds=timer.total()), stage_times=timer.as_dict(), cache_key=cache_keys[modelObject.id])
+            for modelObject, (result, timer) in zip(pending, outputs)
+        )
+        for modelObject, (_, timer) in zip(pending, outputs):
+            observe_stages(modelObject, timer)
+        for processed_image in processed_images:
+            result_cache.put(imageObject.user_id, processed_image)
+            cached[processed_image.model_id] = processed_image
+
+        imageObject.is_processed = True
+        imageObject.save()
+
+        return [cached[modelObject.id] for modelObject in modelObjects]
+
+    except DecodeBudgetExceeded:
+        raise
+
+    except Exception as e:
+        print(f"Error during processing: {e}")
+        return None
+
+
+def process_batch(imageObjects, modelObject, batch_size, tiling=None):
+    # Images with a cached result are answered from the cache, only the rest are batched
+    done = {}
+    pending = []
+    for imageObject in {imageObject.pk: imageObject for imageObject in imageObjects}.values():
+        image_tiles = tiling_options(imageObject, modelObject, tiling)
+        cache_key = result_cache_key(image_content_hash(imageObject), modelObject, image_tiles)
+        cached = result_cache.get(imageObject.user_id, cache_key, modelObject)
+        if cached is not None:
+            done[imageObject.pk] = cached
+        else:
+            pending.append((imageObject, image_tiles, cache_key))
+
+    # Loaded before the timers start, and only here when inference runs in this worker
+    if pending and not settings.INFERENCE_PROCESSES:
+        model_registry.get(modelObject)
+    processed_images = []
+    batches = []
+
+    for batch_start in range(0, len(pending), batch_size):
+        batch = pending[batch_start : batch_start + batch_size]
+        timer = StageTimer()
+        with timer.stage("decode"):
+            images = [DecodedImage(read_blob(imageObject), None if image_tiles else decode_max_side([modelObject])) for imageObject, image_tiles, _ in batch]
+            for image in images:
+                image.rgb_np
+        with timer.stage("preprocess"):
+            for image in images:
+                image.prepare([modelObject])
+        with timer.stage("inference"):
+            # Tiled images run over their own tiles, the rest still share one batched call
+            untiled = [image for image, (_, image_tiles, _) in zip(images, batch) if not image_tiles]
+            untiled_results = iter(run_inference(untiled, modelObject) if untiled else [])
+            results = [scale_result(infer_tiled(image, modelObject, **image_tiles), image.scale) if image_tiles else next(untiled_results) for image, (_, image_tiles, _) in zip(images, batch)]
+        observe_stages(modelObject, timer)
+
+        # Each image is charged an equal share of its batch
+        elapsed = timer.total()
+        stage_times = {stage: round(seconds / len(batch), 6) for stage, seconds in timer.stages.items()}
+        processed_images.extend(
+            ProcessedImage(image=imageObject, user_id=imageObject.user_id, model=modelObject, result=result, processing_time=timedelta(seconds=elapsed / len(batch)), stage_times=stage_times, cache_key=cache_key)
+            for (imageObject, _, cache_key), result in zip(batch, results)
+        )
+        batches.append({"size": len(batch), "time": round(elapsed, 4), "images_per_second": round(len(batch) / elapsed, 2) if elapsed else None})
+
+    for processed_image in ProcessedImage.objects.bulk_create(processed_images):
+        result_cache.put(processed_image.image.user_id, processed_image)
+        done[processed_image.image_id] = processed_image
+    ImageModel.objects.filter(pk__in=[imageObject.pk for imageObject in imageObjects]).update(is_processed=True)
+
+    return [done[imageObject.pk] for imageObject in imageObjects], batches
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def artifact_size(model_dir):
+    # The on-disk artifact is used as the estimate of a model's resident footprint
+    if model_dir is None or not os.path.exists(model_dir):
+        return 0
+    return os.path.getsize(model_dir)
+
+
+class ModelRegistry:
+    def __init__(self, loader, warmer, memory_budget):
+        self.loader = loader
+        self.warmer = warmer
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._warm_up_state = "pending"
+        self._warm_up_errors = {}
+
+    @staticmethod
+    def key(modelObject):
+        return (modelObject.id, modelObject.model_version)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            return entry
+        return None
+
+    def get(self, modelObject):
+        key = self.key(modelObject)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry["model"]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model, the others wait for it and reuse the result
+        with load_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry["model"]
+
+            start_time = time.monotonic()
+            model = self.loader(modelObject)
+
+            with self._lock:
+                # A new model_version supersedes whatever was loaded for the same Model row
+                for stale_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                    del self._entries[stale_key]
+                self._entries[key] = {
+                    "model": model,
+                    "model_name": modelObject.model_name,
+                    "model_format": modelObject.model_format,
+                    "size": artifact_size(modelObject.model_dir),
+                    "load_time": time.monotonic() - start_time,
+                    "hits": 0,
+                    "warm": False,
+                }
+                self._evict(keep=key)
+                self._load_locks.pop(key, None)
+            return model
+
+    def _evict(self, keep):
+        while self.memory_used() > self.memory_budget and len(self._entries) > 1:
+            oldest = next(k for k in self._entries if k != keep)
+            del self._entries[oldest]
+
+    def memory_used(self):
+        return sum(entry["size"] for entry in self._entries.values())
+
+    def evict(self, modelObject):
+        with self._lock:
+            self._entries.pop(self.key(modelObject), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def warm_up(self, modelObjects):
+        self._warm_up_state = "warming"
+        for modelObject in modelObjects:
+            try:
+                model = self.get(modelObject)
+                self.warmer(model, modelObject)
+                with self._lock:
+                    entry = self._entries.get(self.key(modelObject))
+                    if entry is not None:
+                        entry["warm"] = True
+            except Exception as e:
+                self._warm_up_errors[modelObject.model_name] = str(e)
+                print(f"Error warming up {modelObject.model_name}: {e}")
+        self._warm_up_state = "failed" if self._warm_up_errors else "ready"
+
+    def mark_ready(self):
+        self._warm_up_state = "ready"
+
+    def is_ready(self):
+        return self._warm_up_state == "ready"
+
+    def status(self):
+        with self._lock:
+            loaded = [
+                {
+                    "id": key[0],
+                    "model_version": key[1],
+                    "model_name": entry["model_name"],
+                    "model_format": entry["model_format"],
+                    "size": entry["size"],
+                    "load_time": round(entry["load_time"], 4),
+                    "hits": entry["hits"],
+                    "warm": entry["warm"],
+                }
+                for key, entry in self._entries.items()
+            ]
+            memory_used = self.memory_used()
+        return {
+            "ready": self.is_ready(),
+            "warm_up": self._warm_up_state,
+            "warm_up_errors": dict(self._warm_up_errors),
+            "memory_used": memory_used,
+            "memory_budget": self.memory_budget,
+            "loaded_models": loaded,
+        }
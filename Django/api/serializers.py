@@ -62,7 +62,7 @@ class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
         exclude = ["binary_data"]
-        read_only_fields = ["user", "upload_date", "is_processed"]
+        read_only_fields = ["user", "upload_date", "is_processed", "blob_key", "content_hash", "image_width", "image_height", "frame_count"]
 
 
 class ModelCategorySerializer(serializers.ModelSerializer):
@@ -0,0 +1,134 @@
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+
+# Enum member names, onnxruntime is only imported once a session is created
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+
+def session_config(modelObject):
+    return {**settings.ONNX_SESSION_DEFAULTS, **(modelObject.runtime_options or {})}
+
+
+def session_options(config):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = config["intra_op_num_threads"]
+    options.inter_op_num_threads = config["inter_op_num_threads"]
+    options.execution_mode = getattr(onnxruntime.ExecutionMode, EXECUTION_MODES[config["execution_mode"]])
+    options.enable_cpu_mem_arena = config["enable_cpu_mem_arena"]
+    options.enable_mem_pattern = config["enable_mem_pattern"]
+    options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[config["graph_optimization_level"]])
+    return options
+
+
+def optimized_model_path(model_dir, model_version, config):
+    import onnxruntime
+
+    # Optimized graphs depend on the source file, the optimization level and the runtime that produced them
+    stem = os.path.splitext(os.path.basename(model_dir))[0]
+    source_size = os.path.getsize(model_dir)
+    name = f"{stem}-{model_version}-{source_size}-{config['graph_optimization_level']}-ort{onnxruntime.__version__}.onnx"
+    return os.path.join(settings.ONNX_OPTIMIZED_CACHE_DIR, name)
+
+
+def create_session(model_dir, model_version, config, use_cache=True):
+    from onnxruntime import GraphOptimizationLevel, InferenceSession
+
+    providers = ["CPUExecutionProvider"]
+    options = session_options(config)
+
+    if not use_cache or config["graph_optimization_level"] == "disabled":
+        return InferenceSession(model_dir, options, providers=providers)
+
+    cache_path = optimized_model_path(model_dir, model_version, config)
+    if os.path.exists(cache_path):
+        # The cached graph is already optimized, so the passes are not run again
+        options.graph_optimization_level = GraphOptimizationLevel.ORT_DISABLE_ALL
+        return InferenceSession(cache_path, options, providers=providers)
+
+    os.makedirs(settings.ONNX_OPTIMIZED_CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=settings.ONNX_OPTIMIZED_CACHE_DIR, prefix=".optimizing-", suffix=".onnx")
+    os.close(fd)
+    options.optimized_model_filepath = temp_path
+    try:
+        session = InferenceSession(model_dir, options, providers=providers)
+        # Moved into place only once complete, so other workers never load a half-written graph
+        os.replace(temp_path, cache_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return session
+
+
+def dynamic_batch_path(model_dir):
+    return f"{os.path.splitext(model_dir)[0]}-dynamic.onnx"
+
+
+def graph_path(model_dir):
+    # The copy with a dynamic batch axis written by batch_models, the downloaded graph stays as it is for its checksum
+    path = dynamic_batch_path(model_dir)
+    return path if os.path.exists(path) else model_dir
+
+
+def load_session(modelObject):
+    return create_session(graph_path(modelObject.model_dir), modelObject.model_version, session_config(modelObject))
+
+
+def fixed_batch_size(model):
+    batch_dim = model.get_inputs()[0].shape[0]
+    return batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+
+
+def graph_inputs(graph):
+    # Older graphs list their weights as inputs too
+    initializers = {initializer.name for initializer in graph.initializer}
+    return [value for value in graph.input if value.name not in initializers]
+
+
+@lru_cache(maxsize=None)
+def _graph_batch_size(path, mtime):
+    import onnx
+
+    dim = graph_inputs(onnx.load(path, load_external_data=False).graph)[0].type.tensor_type.shape.dim[0]
+    return dim.dim_value if dim.HasField("dim_value") else None
+
+
+def graph_batch_size(model_dir):
+    # Read from the file rather than a session, so it can be answered where the model is not loaded
+    path = graph_path(model_dir)
+    if not os.path.exists(path):
+        return None
+    return _graph_batch_size(path, os.path.getmtime(path))
+
+
+def run_onnx(model, input_batch):
+    model_input = model.get_inputs()[0]
+    batch_size = fixed_batch_size(model)
+    # Graphs exported with a fixed batch dimension have to be fed one image at a time, see batch_models
+    if batch_size is not None and batch_size != len(input_batch):
+        outputs = []
+        for i in range(0, len(input_batch), batch_size):
+            chunk = input_batch[i : i + batch_size]
+            count = len(chunk)
+            # A short last chunk is padded with copies of its last image, whose outputs are dropped again
+            if count < batch_size:
+                chunk = np.concatenate([chunk, np.repeat(chunk[-1:], batch_size - count, axis=0)])
+            outputs.append(model.run(None, {model_input.name: chunk})[0][:count])
+        return np.concatenate(outputs)
+    return model.run(None, {model_input.name: input_batch})[0]
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import BlobRelease, Image, ImageDerivative, ProcessedImage
+from .storage import get_blob_store
+
+
+def blob_referenced(blob_key):
+    return any(model.objects.filter(blob_key=blob_key).exists() for model in (Image, ProcessedImage, ImageDerivative))
+
+
+def sweep_blobs(grace=None, limit=100):
+    # Blobs are deleted a grace period after their last reference went away and only if nothing saved them since,
+    # so an upload of the same content that has not created its row yet never loses its file
+    cutoff = timezone.now() - timedelta(seconds=settings.BLOB_DELETE_GRACE if grace is None else grace)
+    store = get_blob_store()
+    deleted = 0
+    for release in BlobRelease.objects.filter(release_date__lt=cutoff).order_by("release_date")[:limit]:
+        if blob_referenced(release.blob_key):
+            release.delete()
+        elif store.delete(release.blob_key, saved_before=cutoff.timestamp()):
+            release.delete()
+            deleted += 1
+    return deleted
+
+
+def release_blob(blob_key):
+    # Blobs are content-addressed and may be shared, so they are only removed once nothing references them
+    if not blob_key or blob_referenced(blob_key):
+        return
+    BlobRelease.objects.update_or_create(blob_key=blob_key, defaults={"release_date": timezone.now()})
+    sweep_blobs()
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    release_blob(instance.blob_key)
+
+
+@receiver(post_delete, sender=ProcessedImage)
+def processed_image_deleted(sender, instance, **kwargs):
+    from .process import result_cache
+
+    result_cache.discard(instance.pk)
+    release_blob(instance.blob_key)
+
+
+@receiver(post_delete, sender=ImageDerivative)
+def derivative_deleted(sender, instance, **kwargs):
+    release_blob(instance.blob_key)
+
+
+@receiver(post_migrate)
+def backfill_processed_image_users(sender, using, **kwargs):
+    # Rows written before ProcessedImage.user existed take it from their image, or they would drop out of the listing
+    if sender.name == "api":
+        ProcessedImage.objects.using(using).filter(user__isnull=True).update(user=Subquery(Image.objects.filter(pk=OuterRef("image_id")).values("user_id")[:1]))
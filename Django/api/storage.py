@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LocalBlobStore:
+    def __init__(self, root=None):
+        self.root = str(root or settings.BLOB_STORAGE_ROOT)
+
+    def relative_path(self, key):
+        return f"{key[:2]}/{key[2:4]}/{key}"
+
+    def path(self, key):
+        return os.path.join(self.root, self.relative_path(key))
+
+    def save(self, chunks):
+        # Written to a temporary file while hashing, then moved into its content-addressed place
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            key = digest.hexdigest()
+            path = self.path(key)
+            try:
+                # Saving existing content refreshes its mtime, which keeps a pending delete() from removing it
+                os.utime(path)
+                os.remove(temp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return key, size
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key, saved_before=None):
+        # With saved_before (a timestamp) the blob is kept if it was saved again since, and False is returned
+        path = self.path(key)
+        if saved_before is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return True
+
+        # Moved aside before the check, so a concurrent save either refreshed it first or writes the content anew
+        tombstone = f"{path}.deleting-{uuid.uuid4().hex}"
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return True
+        if os.path.getmtime(tombstone) >= saved_before:
+            os.replace(tombstone, path)
+            return False
+        os.remove(tombstone)
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_blob_store():
+    return import_string(settings.BLOB_STORAGE_BACKEND)()
+
+
+def save_blob(data):
+    return get_blob_store().save([bytes(data)])[0]
+
+
+def open_blob(instance):
+    # Rows that have not been moved out of the database yet are served from their bytea column
+    if instance.blob_key:
+        store = get_blob_store()
+        return store.open(instance.blob_key), store.size(instance.blob_key)
+    return BytesIO(instance.binary_data), len(instance.binary_data)
+
+
+def read_blob(instance):
+    if instance.blob_key:
+        with get_blob_store().open(instance.blob_key) as f:
+            return f.read()
+    return instance.binary_data
+
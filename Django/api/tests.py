@@ -1,3 +1,1112 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework_simplejwt.tokens import RefreshToken
+
+import setup
+
+from . import jobs
+from .backends import get_backend
+from .benchmark import STUB_MODELS, rss_usage, stub_infer
+from .batching import BatcherStopped, BatchTimeout, MicroBatcher
+from .cache import ENTRY_OVERHEAD, ResultCache, entry_size
+from .derivatives import CONTENT_TYPES
+from .jobs import JobQueueFull, submit_job
+from .models import BlobRelease, Image, ImageDerivative, Model, ModelCategory, ProcessedImage, ProcessingJob, User
+from .management.commands.batch_models import make_dynamic_batch
+from .pool import SOLUTIONS, SolutionPool
+from .process import BatchScheduler, DecodedImage, infer_tiled, model_registry, process_batch, process_multi, result_cache, tile_grid
+from .registry import ModelRegistry
+from .sessions import dynamic_batch_path, fixed_batch_size, graph_batch_size, graph_path, run_onnx
+from .signals import backfill_processed_image_users, sweep_blobs
+from .storage import get_blob_store, open_blob, save_blob
+from .yolo import PAD_VALUE, letterbox, nms, postprocess
+
+
+class FakeGraph:
+    def __init__(self, options):
+        self.options = options
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch.dict(SOLUTIONS, {"fake": FakeGraph})
+class SolutionPoolTests(SimpleTestCase):
+    def checkout_in_thread(self, pool, checked_out):
+        def run():
+            with pool.checkout("fake") as graph:
+                checked_out.append(graph)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_reuses_returned_graphs(self):
+        pool = SolutionPool(2)
+        with pool.checkout("fake") as first:
+            pass
+        with pool.checkout("fake") as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(pool.status()[0]["created"], 1)
+
+    def test_waits_while_exhausted(self):
+        pool = SolutionPool(1)
+        checked_out = []
+        with pool.checkout("fake") as graph:
+            thread = self.checkout_in_thread(pool, checked_out)
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(checked_out, [])
+        thread.join(5)
+        self.assertEqual(checked_out, [graph])
+
+    def test_waiters_recover_when_graphs_are_discarded(self):
+        pool = SolutionPool(1)
+        checked_out = []
+        with self.assertRaises(RuntimeError):
+            with pool.checkout("fake") as graph:
+                thread = self.checkout_in_thread(pool, checked_out)
+                thread.join(0.2)
+                raise RuntimeError("graph failed")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(graph.closed)
+        self.assertEqual(len(checked_out), 1)
+        self.assertIsNot(checked_out[0], graph)
+        self.assertEqual(pool.status()[0], {"solution": "fake", "options": {}, "created": 1, "in_use": 0, "idle": 1})
+
+    def test_failed_creation_frees_its_slot(self):
+        pool = SolutionPool(1)
+        with mock.patch.dict(SOLUTIONS, {"fake": mock.Mock(side_effect=[RuntimeError("no graph"), FakeGraph({})])}):
+            with self.assertRaises(RuntimeError):
+                with pool.checkout("fake"):
+                    pass
+            with pool.checkout("fake") as graph:
+                self.assertIsInstance(graph, FakeGraph)
+
+    def test_clear_closes_idle_graphs(self):
+        pool = SolutionPool(2)
+        with pool.checkout("fake") as graph:
+            pass
+        pool.clear()
+        self.assertTrue(graph.closed)
+        self.assertEqual(pool.status()[0]["created"], 0)
+
+
+def create_user(username="user"):
+    return User.objects.create_user(username=username, password="password")
+
+
+def create_model(name="Test Model", **fields):
+    category, _ = ModelCategory.objects.get_or_create(category_name="Test")
+    fields = {"model_dir": "", "model_format": "onnx", "model_version": "1", **fields}
+    return Model.objects.create(model_name=name, category=category, **fields)
+
+
+def create_image(user, data=b"image", **fields):
+    fields = {"image_format": "jpeg", "image_size": len(data), **fields}
+    return Image.objects.create(user=user, binary_data=data, **fields)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition.")
+        time.sleep(0.01)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.loader = mock.Mock(side_effect=lambda modelObject: object())
+        self.warmer = mock.Mock()
+
+    def model(self, id, size=100, version="1"):
+        model_dir = os.path.join(self.temp_dir, f"model-{id}.onnx")
+        with open(model_dir, "wb") as f:
+            f.write(b"\0" * size)
+        return Model(id=id, model_name=f"Model {id}", model_dir=model_dir, model_format="onnx", model_version=version)
+
+    def loaded(self, registry):
+        return [(model["id"], model["model_version"]) for model in registry.status()["loaded_models"]]
+
+    def test_loads_each_model_once(self):
+        registry = ModelRegistry(self.loader, self.warmer, 1000)
+        modelObject = self.model(1)
+        self.assertIs(registry.get(modelObject), registry.get(modelObject))
+        self.assertEqual(self.loader.call_count, 1)
+        self.assertEqual(registry.status()["loaded_models"][0]["hits"], 1)
+
+    def test_evicts_least_recently_used_by_artifact_size(self):
+        registry = ModelRegistry(self.loader, self.warmer, 250)
+        first, second, third = self.model(1), self.model(2), self.model(3)
+        registry.get(first)
+        registry.get(second)
+        registry.get(first)
+        registry.get(third)
+        self.assertEqual(self.loaded(registry), [(1, "1"), (3, "1")])
+        self.assertEqual(registry.memory_used(), 200)
+
+        # A model larger than the budget still loads, on its own
+        registry.get(self.model(4, size=500))
+        self.assertEqual(self.loaded(registry), [(4, "1")])
+
+    def test_new_version_replaces_the_loaded_one(self):
+        registry = ModelRegistry(self.loader, self.warmer, 1000)
+        registry.get(self.model(1))
+        registry.get(self.model(1, version="2"))
+        self.assertEqual(self.loaded(registry), [(1, "2")])
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_warm_up_marks_models_warm_and_ready(self):
+        registry = ModelRegistry(self.loader, self.warmer, 1000)
+        self.assertFalse(registry.status()["ready"])
+        registry.warm_up([self.model(1), self.model(2)])
+        status = registry.status()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["warm_up"], "ready")
+        self.assertEqual([model["warm"] for model in status["loaded_models"]], [True, True])
+        self.assertEqual(self.warmer.call_count, 2)
+
+    def test_failed_warm_up_is_reported(self):
+        self.warmer.side_effect = [None, RuntimeError("no weights")]
+        registry = ModelRegistry(self.loader, self.warmer, 1000)
+        with redirect_stdout(StringIO()):
+            registry.warm_up([self.model(1), self.model(2)])
+        status = registry.status()
+        self.assertFalse(status["ready"])
+        self.assertEqual(status["warm_up"], "failed")
+        self.assertEqual(status["warm_up_errors"], {"Model 2": "no weights"})
+
+    def test_health_reports_readiness(self):
+        for state, ready in [("warming", False), ("ready", True)]:
+            with self.subTest(state=state), mock.patch.object(model_registry, "_warm_up_state", state):
+                httpresponse = self.client.get("/api/v1/health")
+                self.assertEqual(httpresponse.status_code, 200)
+                self.assertIs(httpresponse.json()["data"]["models"]["ready"], ready)
+
+
+class ProcessingJobTests(TransactionTestCase):
+    def setUp(self):
+        self.image = create_image(create_user())
+        self.model = create_model()
+
+    def fake_process(self, imageObject, modelObject, **kwargs):
+        return ProcessedImage.objects.create(image=imageObject, model=modelObject, binary_data=b"")
+
+    def job_status(self, job):
+        job.refresh_from_db()
+        return job.status
+
+    def test_job_runs_to_done(self):
+        with mock.patch("api.jobs.process", side_effect=self.fake_process):
+            job = submit_job(self.image, self.model, stride=2)
+            wait_for(lambda: self.job_status(job) not in ("queued", "running"))
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.worker, jobs.worker_id())
+        self.assertEqual(job.processed_image.image_id, self.image.id)
+        self.assertIsNotNone(job.end_date)
+
+    def test_failed_job_records_error(self):
+        with mock.patch("api.jobs.process", side_effect=RuntimeError("model exploded")):
+            job = submit_job(self.image, self.model)
+            wait_for(lambda: self.job_status(job) not in ("queued", "running"))
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "model exploded")
+
+    def test_claimed_jobs_are_not_run_twice(self):
+        job = ProcessingJob.objects.create(image=self.image, model=self.model, status="done")
+        with mock.patch("api.jobs.process") as process:
+            jobs.run_job(job.id)
+        process.assert_not_called()
+
+    def test_restart_resumes_orphaned_jobs(self):
+        started = timezone.now()
+        # Claimed under this pid, so by a process that is gone now that this one is starting up
+        orphaned = ProcessingJob.objects.create(image=self.image, model=self.model, status="running", worker=jobs.worker_id(), start_date=started, attempts=1)
+        queued = ProcessingJob.objects.create(image=self.image, model=self.model)
+        live = ProcessingJob.objects.create(image=self.image, model=self.model, status="running", worker=f"{jobs.HOSTNAME}:{os.getppid()}", start_date=started, attempts=1)
+        timed_out = ProcessingJob.objects.create(image=self.image, model=self.model, status="running", worker="elsewhere:1", start_date=started - timedelta(seconds=settings.PROCESSING_JOB_TIMEOUT + 1), attempts=1)
+        exhausted = ProcessingJob.objects.create(image=self.image, model=self.model, status="running", worker=jobs.worker_id(), start_date=started, attempts=settings.PROCESSING_JOB_MAX_ATTEMPTS)
+
+        with mock.patch("api.jobs.process", side_effect=self.fake_process):
+            jobs._resume_jobs()
+            for job in (orphaned, queued, timed_out):
+                wait_for(lambda: self.job_status(job) not in ("queued", "running"))
+                self.assertEqual(job.status, "done", job.error)
+
+        self.assertEqual(orphaned.attempts, 2)
+        self.assertEqual(self.job_status(live), "running")
+        self.assertEqual(self.job_status(exhausted), "failed")
+        self.assertEqual(exhausted.error, "The worker stopped while processing the job.")
+
+    def test_resumed_jobs_take_queue_slots(self):
+        for _ in range(3):
+            ProcessingJob.objects.create(image=self.image, model=self.model)
+        futures = []
+
+        def submit(fn, job_id):
+            futures.append(Future())
+            return futures[-1]
+
+        with mock.patch.object(jobs, "_slots", threading.BoundedSemaphore(2)), mock.patch.object(jobs.executor, "submit", side_effect=submit):
+            thread = threading.Thread(target=jobs._resume_jobs, daemon=True)
+            thread.start()
+            wait_for(lambda: len(futures) == 2)
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            with self.assertRaises(JobQueueFull):
+                submit_job(self.image, self.model)
+
+            futures[0].set_result(None)
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(futures), 3)
+
+
+def fixed_batch_graph(path, batch_size=1):
+    # A small classifier shaped like the published GoogleNet graphs: batch size 1 in the shapes and in a Reshape
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Conv", ["input", "conv_weight"], ["conv"], kernel_shape=[3, 3], pads=[1, 1, 1, 1]),
+            helper.make_node("Relu", ["conv"], ["relu"]),
+            helper.make_node("Reshape", ["relu", "flat_shape"], ["flat"]),
+            helper.make_node("Gemm", ["flat", "fc_weight", "fc_bias"], ["fc"], transB=1),
+            helper.make_node("Softmax", ["fc"], ["prob"], axis=1),
+        ],
+        "fixed_batch",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch_size, 3, 8, 8])],
+        [helper.make_tensor_value_info("prob", TensorProto.FLOAT, [batch_size, 8])],
+        [
+            numpy_helper.from_array(rng.normal(size=(4, 3, 3, 3)).astype(np.float32), "conv_weight"),
+            numpy_helper.from_array(np.array([batch_size, 256], dtype=np.int64), "flat_shape"),
+            numpy_helper.from_array(rng.normal(size=(8, 256)).astype(np.float32) / 16, "fc_weight"),
+            numpy_helper.from_array(np.zeros(8, dtype=np.float32), "fc_bias"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+class DynamicBatchTests(SimpleTestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.model_dir = os.path.join(temp_dir.name, "classifier.onnx")
+        fixed_batch_graph(self.model_dir)
+        self.modelObject = Model(model_name="Classifier", model_dir=self.model_dir, model_format="onnx", handler="googlenet_age", model_version="1")
+        self.input_batch = np.random.default_rng(1).normal(size=(5, 3, 8, 8)).astype(np.float32)
+
+    def session(self, path):
+        from onnxruntime import InferenceSession
+
+        return InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def test_fixed_batch_graphs_are_not_micro_batched(self):
+        self.assertEqual(graph_batch_size(self.model_dir), 1)
+        self.assertFalse(get_backend(self.modelObject).batches(self.modelObject))
+        # Still correct, one run per image
+        self.assertEqual(run_onnx(self.session(self.model_dir), self.input_batch).shape, (5, 8))
+
+    def test_fixed_batch_remainder_is_padded(self):
+        path = os.path.join(os.path.dirname(self.model_dir), "batch4.onnx")
+        fixed_batch_graph(path, batch_size=4)
+        session = self.session(path)
+        self.assertEqual(fixed_batch_size(session), 4)
+        with mock.patch.object(session, "run", wraps=session.run) as run:
+            outputs = run_onnx(session, self.input_batch)
+        self.assertEqual(run.call_count, 2)
+        expected = run_onnx(self.session(self.model_dir), self.input_batch)
+        np.testing.assert_allclose(outputs, expected, atol=1e-5)
+
+    def test_rewritten_graph_runs_a_batch_in_one_call(self):
+        self.assertTrue(make_dynamic_batch(self.model_dir, dynamic_batch_path(self.model_dir)))
+        self.assertEqual(graph_path(self.model_dir), dynamic_batch_path(self.model_dir))
+        self.assertIsNone(graph_batch_size(self.model_dir))
+        self.assertTrue(get_backend(self.modelObject).batches(self.modelObject))
+
+        session = self.session(graph_path(self.model_dir))
+        self.assertIsNone(fixed_batch_size(session))
+        with mock.patch.object(session, "run", wraps=session.run) as run:
+            batched = run_onnx(session, self.input_batch)
+        self.assertEqual(run.call_count, 1)
+        expected = run_onnx(self.session(self.model_dir), self.input_batch)
+        np.testing.assert_allclose(batched, expected, atol=1e-5)
+
+    def test_dynamic_graphs_are_left_alone(self):
+        make_dynamic_batch(self.model_dir, dynamic_batch_path(self.model_dir))
+        self.assertFalse(make_dynamic_batch(dynamic_batch_path(self.model_dir), os.path.join(os.path.dirname(self.model_dir), "again.onnx")))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def blocking_batcher(self, max_queue_depth=2):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def run_batch(items):
+            release.wait(5)
+            return items
+
+        batcher = MicroBatcher(run_batch, 1, 0, max_queue_depth, name="test-batcher")
+        self.addCleanup(batcher.stop)
+        return batcher, release
+
+    def test_stop_fails_queued_requests_without_blocking(self):
+        batcher, release = self.blocking_batcher()
+        running = batcher.submit("running")
+        time.sleep(0.1)
+        queued = [batcher.submit("a"), batcher.submit("b")]
+
+        # The queue is full, a blocking put here would wait for the running batch
+        started = time.monotonic()
+        batcher.stop()
+        self.assertLess(time.monotonic() - started, 1)
+        with self.assertRaises(BatcherStopped):
+            batcher.submit("late")
+
+        release.set()
+        self.assertEqual(running.result(5), "running")
+        for future in queued:
+            with self.assertRaises(BatcherStopped):
+                future.result(5)
+        batcher._thread.join(5)
+        self.assertFalse(batcher._thread.is_alive())
+
+    def test_stop_ends_an_idle_batcher(self):
+        batcher, _ = self.blocking_batcher()
+        batcher.stop()
+        batcher._thread.join(5)
+        self.assertFalse(batcher._thread.is_alive())
+
+    @override_settings(MICRO_BATCHING={**settings.MICRO_BATCHING, "timeout_s": 0.1})
+    def test_slow_batches_time_out(self):
+        batcher, _ = self.blocking_batcher()
+        scheduler = BatchScheduler()
+        with mock.patch.object(scheduler, "batcher", return_value=batcher):
+            with self.assertRaises(BatchTimeout):
+                scheduler.infer("image", Model(runtime_options={}))
+
+    @override_settings(MICRO_BATCHING={**settings.MICRO_BATCHING, "timeout_s": 5})
+    def test_requests_move_to_the_replacement_batcher(self):
+        stopped, _ = self.blocking_batcher()
+        stopped.stop()
+        replacement = MicroBatcher(lambda items: [f"{item} done" for item in items], 8, 0, 8, name="test-replacement")
+        self.addCleanup(replacement.stop)
+        scheduler = BatchScheduler()
+        with mock.patch.object(scheduler, "batcher", side_effect=[stopped, replacement]):
+            self.assertEqual(scheduler.infer("image", Model(runtime_options={})), "image done")
+
+
+class StubBenchmarkTests(SimpleTestCase):
+    def test_stub_landmarks_cover_every_connection(self):
+        decoded = DecodedImage(image_bytes("JPEG", (64, 48)))
+        for handler, count in [("hands", 21), ("pose", 33)]:
+            modelObject = next(modelObject for modelObject in STUB_MODELS if modelObject.handler == handler)
+            points = stub_infer(decoded, modelObject)["landmarks"][0]
+            self.assertEqual(len(points), count)
+            self.assertLess(max(max(edge) for edge in get_backend(modelObject).connections()), count)
+
+    @skipUnless(os.path.exists("/proc/self/clear_refs"), "needs Linux /proc")
+    def test_memory_is_measured_per_run(self):
+        def allocate():
+            data = bytearray(64 * 2**20)
+            data[:: 4096] = b"x" * len(data[:: 4096])
+
+        _, grown = rss_usage(allocate)
+        peak, unchanged = rss_usage(lambda: None)
+        self.assertGreater(grown, 48 * 2**20)
+        self.assertLess(unchanged, 8 * 2**20)
+        self.assertIsNotNone(peak)
+
+    def test_stub_pipeline_runs_without_mediapipe(self):
+        stdout = StringIO()
+        call_command("benchmark_pipeline", "--stub", "--iterations", "1", "--sizes", "64x48", stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), len(STUB_MODELS))
+        self.assertNotIn("mediapipe", sys.modules)
+
+
+class ArtifactHandler(BaseHTTPRequestHandler):
+    # Serves server.body with Range support, cutting the next server.truncate responses off halfway
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        self.server.ranges.append(range_header)
+        start = int(range_header.removeprefix("bytes=").rstrip("-")) if range_header else 0
+        if start >= len(self.server.body):
+            self.send_response(416)
+            self.end_headers()
+            return
+
+        body = self.server.body[start:]
+        self.send_response(206 if range_header else 200)
+        if range_header:
+            self.send_header("Content-Range", f"bytes {start}-{len(self.server.body) - 1}/{len(self.server.body)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.truncate:
+            self.server.truncate -= 1
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArtifactHandler)
+        self.server.body = os.urandom(256 * 1024)
+        self.server.ranges = []
+        self.server.truncate = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.url = f"http://127.0.0.1:{self.server.server_port}/model.onnx"
+        self.path = os.path.join(self.temp_dir, "models", "model.onnx")
+        self.sha256 = hashlib.sha256(self.server.body).hexdigest()
+
+        self.enterContext(mock.patch.object(setup, "DOWNLOAD_RETRIES", 3))
+        self.enterContext(mock.patch.object(setup.time, "sleep"))
+        self.enterContext(redirect_stdout(StringIO()))
+
+    def test_resumes_a_partial_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(f"{self.path}.part", "wb") as f:
+            f.write(self.server.body[:1000])
+
+        self.assertEqual(setup.download(self.url, self.path, self.sha256), "downloaded")
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+        self.assertEqual(setup.file_sha256(self.path), self.sha256)
+        self.assertFalse(os.path.exists(f"{self.path}.part"))
+
+    def test_resumes_after_a_dropped_connection(self):
+        self.server.truncate = 1
+        # Whole chunks reach the partial file, so the cut-off half is kept with chunks smaller than the body
+        self.enterContext(mock.patch.object(setup, "CHUNK_SIZE", 16 * 1024))
+        self.assertEqual(setup.download(self.url, self.path, self.sha256), "downloaded")
+        self.assertEqual(self.server.ranges, [None, f"bytes={len(self.server.body) // 2}-"])
+        self.assertEqual(setup.file_sha256(self.path), self.sha256)
+
+    def test_checksum_mismatch_starts_over(self):
+        with self.assertRaisesRegex(ValueError, "Checksum mismatch"):
+            setup.download(self.url, self.path, "0" * 64)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(f"{self.path}.part"))
+
+        self.assertEqual(setup.download(self.url, self.path, self.sha256), "downloaded")
+        self.assertEqual(self.server.ranges, [None, None])
+
+    def test_unpinned_files_can_be_refused(self):
+        models_data = [{"model_name": "Model", "url": self.url, "model_dir": self.path}, {"model_name": "Pinned", "url": self.url, "model_dir": f"{self.path}.pinned", "sha256": self.sha256}]
+        ready = setup.download_models(models_data, workers=1, require_sha256=True)
+        self.assertEqual([model_info["model_name"] for model_info in ready], ["Pinned"])
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(len(self.server.ranges), 1)
+
+    def test_pin_records_missing_checksums(self):
+        manifest = os.path.join(self.temp_dir, "models.json")
+        models_data = [
+            {"model_name": "Model", "url": self.url, "model_dir": self.path},
+            {"model_name": "Without weights", "url": "", "model_dir": None},
+        ]
+        with open(manifest, "w") as f:
+            json.dump(models_data, f)
+
+        self.assertTrue(setup.setup_models(manifest, workers=1, pin=True))
+        with open(manifest) as f:
+            pinned = json.load(f)
+        self.assertEqual(pinned[0]["sha256"], self.sha256)
+        self.assertNotIn("sha256", pinned[1])
+
+
+class LoadModelsTests(TestCase):
+    def write_manifest(self, models_data):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        path = os.path.join(temp_dir.name, "models.json")
+        with open(path, "w") as f:
+            json.dump(models_data, f)
+        return path
+
+    def model_info(self, name, category="classification"):
+        return {"model_name": name, "url": "", "model_dir": f"./api/models/{name}.onnx", "model_format": "onnx", "handler": "googlenet_age", "model_description": "", "model_version": "1", "model_category": category}
+
+    def test_loads_and_leaves_unchanged_rows_alone(self):
+        manifest = self.write_manifest([{**self.model_info("Age"), "variants": [{"precision": "int8", "model_dir": "./api/models/Age-int8.onnx"}]}])
+        call_command("load_models", manifest, stdout=StringIO())
+        variant = Model.objects.get(model_name="Age (INT8)")
+        self.assertEqual(variant.variant_of.model_name, "Age")
+
+        stdout = StringIO()
+        call_command("load_models", manifest, stdout=stdout)
+        self.assertIn("0 created, 0 updated, 2 unchanged", stdout.getvalue())
+
+    def test_failure_rolls_back_every_row(self):
+        manifest = self.write_manifest([self.model_info("Age"), self.model_info("Broken", category="detection")])
+        create = Model.objects.create
+
+        def fail_on_broken(**fields):
+            if fields["model_name"] == "Broken":
+                raise IntegrityError("broken row")
+            return create(**fields)
+
+        with mock.patch.object(Model.objects, "create", side_effect=fail_on_broken):
+            with self.assertRaises(IntegrityError):
+                call_command("load_models", manifest, stdout=StringIO())
+        self.assertFalse(Model.objects.exists())
+        self.assertFalse(ModelCategory.objects.exists())
+
+
+class ListingTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.headers = auth_headers(self.user)
+        self.model = create_model()
+        other = create_user("other")
+        ProcessedImage.objects.create(image=create_image(other), user=other, model=self.model)
+
+    def pages(self, url, limit):
+        ids, cursor = [], None
+        while True:
+            httpresponse = self.client.get(url, {"limit": limit, **({"cursor": cursor} if cursor else {})}, **self.headers)
+            self.assertEqual(httpresponse.status_code, 200)
+            data = httpresponse.json()["data"]
+            self.assertLessEqual(len(data["results"]), limit)
+            ids.extend(row["id"] for row in data["results"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids, data["results"]
+
+    def test_pages_cross_the_boundary_without_gaps(self):
+        images = [create_image(self.user) for _ in range(5)]
+        processed_images = [ProcessedImage.objects.create(image=image, user=self.user, model=self.model) for image in images]
+        for url, rows in [("/api/v1/user/image/", images), ("/api/v1/user/processedimage/", processed_images)]:
+            with self.subTest(url=url):
+                ids, _ = self.pages(url, 2)
+                self.assertEqual(ids, sorted((row.id for row in rows), reverse=True))
+
+        _, last_page = self.pages("/api/v1/user/processedimage/", 2)
+        self.assertEqual(last_page[0]["model_name"], self.model.model_name)
+
+    def test_invalid_cursor(self):
+        httpresponse = self.client.get("/api/v1/user/processedimage/", {"cursor": "not-a-cursor"}, **self.headers)
+        self.assertEqual(httpresponse.status_code, 400)
+
+    def test_existing_rows_get_their_user_back(self):
+        processed_image = ProcessedImage.objects.create(image=create_image(self.user), model=self.model)
+        backfill_processed_image_users(sender=apps.get_app_config("api"), using="default")
+        processed_image.refresh_from_db()
+        self.assertEqual(processed_image.user_id, self.user.id)
+
+
+class YoloPostprocessTests(SimpleTestCase):
+    def test_nms_keeps_the_best_box_per_class(self):
+        boxes = np.array([[0, 0, 100, 100], [2, 2, 102, 102], [1, 1, 101, 101], [200, 200, 260, 260], [10, 10, 110, 110]], dtype=np.float32)
+        scores = np.array([0.9, 0.8, 0.85, 0.6, 0.7], dtype=np.float32)
+        classes = np.array([0, 0, 1, 0, 0])
+        # Box 1 overlaps box 0 far beyond the threshold, box 4 only by 0.68, and box 2 is another class
+        self.assertEqual(nms(boxes, scores, classes).tolist(), [0, 2, 4, 3])
+        self.assertEqual(nms(boxes, scores, classes, iou_threshold=0.5).tolist(), [0, 2, 3])
+        self.assertEqual(nms(boxes[:0], scores[:0], classes[:0]).tolist(), [])
+
+    def test_letterbox_pads_like_ultralytics(self):
+        # 482 rows scale to 241, leaving 79 rows of padding, split 39 above and 40 below
+        image_np = np.zeros((482, 640, 3), dtype=np.uint8)
+        padded, ratio, (left, top) = letterbox(image_np, 320)
+        self.assertEqual(padded.shape, (320, 320, 3))
+        self.assertEqual((ratio, left, top), (0.5, 0, 39))
+        self.assertTrue((padded[:39] == PAD_VALUE).all())
+        self.assertTrue((padded[39:280] == 0).all())
+        self.assertTrue((padded[280:] == PAD_VALUE).all())
+
+    def test_boxes_round_trip_through_the_letterbox(self):
+        for height, width in [(480, 640), (517, 333), (1080, 1920)]:
+            with self.subTest(size=(width, height)):
+                _, ratio, (left, top) = letterbox(np.zeros((height, width, 3), dtype=np.uint8), 640)
+                box = np.array([width * 0.2, height * 0.3, width * 0.6, height * 0.9])
+                x1, y1, x2, y2 = box * ratio + [left, top, left, top]
+                # One anchor in the model's output layout: centre, size, then a score per class
+                output = np.zeros((4 + 3, 2), dtype=np.float32)
+                output[:, 0] = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.1, 0.9, 0.0]
+                output[:, 1] = [10, 10, 5, 5, 0.1, 0.1, 0.1]
+
+                result = postprocess(output, ratio, (left, top), (height, width), {0: "person", 1: "car", 2: "dog"})
+                self.assertEqual(len(result["detections"]), 1)
+                detection = result["detections"][0]
+                self.assertEqual((detection["label"], detection["score"]), ("car", 0.9))
+                np.testing.assert_allclose(detection["box"], box, atol=0.05)
+
+
+class TilingTests(SimpleTestCase):
+    def test_tile_grid_covers_the_edges(self):
+        # With a stride of 256 neither side is a multiple of it, so the last tiles are pulled back to the far edges
+        grid = tile_grid(1000, 700, 320, 0.2)
+        self.assertEqual(sorted({x1 for x1, _, _, _ in grid}), [0, 256, 512, 680])
+        self.assertEqual(sorted({y1 for _, y1, _, _ in grid}), [0, 256, 380])
+        self.assertTrue(all(x2 - x1 == 320 and y2 - y1 == 320 for x1, y1, x2, y2 in grid))
+        self.assertEqual(max(x2 for _, _, x2, _ in grid), 1000)
+        self.assertEqual(max(y2 for _, _, _, y2 in grid), 700)
+        covered = np.zeros((700, 1000), dtype=bool)
+        for x1, y1, x2, y2 in grid:
+            covered[y1:y2, x1:x2] = True
+        self.assertTrue(covered.all())
+        # Neighbouring tiles overlap by at least the requested share of a tile
+        for xs in (sorted({x1 for x1, _, _, _ in grid}), sorted({y1 for _, y1, _, _ in grid})):
+            self.assertTrue(all(b - a <= 256 for a, b in zip(xs, xs[1:])))
+
+    def test_tile_grid_clips_an_image_smaller_than_a_tile(self):
+        self.assertEqual(tile_grid(200, 500, 320, 0.2), [(0, 0, 200, 320), (0, 180, 200, 500)])
+
+    def test_tiles_merge_by_intersection_over_the_smaller_box(self):
+        objects = [((600, 300, 760, 420), 0), ((600, 300, 760, 420), 1), ((40, 40, 80, 80), 0)]
+
+        def fake_infer_tiles(rgb_np, regions, modelObject):
+            results = []
+            for x1, y1, x2, y2 in regions:
+                whole = (x1, y1, x2, y2) == (0, 0, 1000, 700)
+                detections = []
+                for box, cls in objects:
+                    # Each tile sees only the part of an object inside it
+                    cut = [max(box[0], x1), max(box[1], y1), min(box[2], x2), min(box[3], y2)]
+                    if cut[0] < cut[2] and cut[1] < cut[3]:
+                        detections.append({"box": [cut[0] - x1, cut[1] - y1, cut[2] - x1, cut[3] - y1], "score": 0.9 if whole else 0.8, "class": cls})
+                results.append({"type": "detection", "detections": detections})
+            return results
+
+        decoded = DecodedImage.from_array(np.zeros((700, 1000, 3), dtype=np.uint8))
+        with mock.patch("api.process.infer_tiles", side_effect=fake_infer_tiles):
+            result = infer_tiled(decoded, None, 320, 0.2)
+        # The pieces cut off at tile edges are swallowed by the whole box, while the other class is kept apart
+        self.assertEqual(
+            sorted((detection["class"], detection["box"], detection["score"]) for detection in result["detections"]),
+            [(0, [40, 40, 80, 80], 0.9), (0, [600, 300, 760, 420], 0.9), (1, [600, 300, 760, 420], 0.9)],
+        )
+        self.assertEqual(result["tiling"]["tiles"], 12)
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.image = create_image(self.user)
+        self.model = create_model()
+
+    def processed_image(self, cache_key, size=0):
+        return ProcessedImage.objects.create(image=self.image, model=self.model, binary_data=b"x" * size, cache_key=cache_key)
+
+    def test_memory_hits_skip_the_database(self):
+        cache = ResultCache(10 * 1024**2)
+        processed_image = self.processed_image("a")
+        cache.put(self.user.id, processed_image)
+        with self.assertNumQueries(0):
+            self.assertIs(cache.get(self.user.id, "a", self.model), processed_image)
+        self.assertEqual(cache.status()["memory_hits"], 1)
+
+    def test_evicts_least_recently_used_within_budget(self):
+        size = entry_size(self.processed_image("sized", 1000))
+        cache = ResultCache(3 * size)
+        for key in "abc":
+            cache.put(self.user.id, self.processed_image(key, 1000))
+        self.assertEqual(cache.memory_used(), 3 * size)
+
+        # "a" becomes the most recently used, so "b" is the one evicted
+        cache.get(self.user.id, "a", self.model)
+        cache.put(self.user.id, self.processed_image("d", 1000))
+
+        status = cache.status()
+        self.assertEqual(status["entries"], 3)
+        self.assertEqual(status["memory_used"], 3 * size)
+        with self.assertNumQueries(1):
+            # Not in memory any more, so it is looked up again
+            cache.get(self.user.id, "b", self.model)
+
+    def test_replacing_an_entry_keeps_the_total(self):
+        cache = ResultCache(10 * 1024**2)
+        cache.put(self.user.id, self.processed_image("a", 500))
+        replacement = self.processed_image("a", 200)
+        cache.put(self.user.id, replacement)
+        self.assertEqual(cache.memory_used(), entry_size(replacement))
+
+    def test_results_count_against_the_budget(self):
+        frames = [{"frame": i, "detections": [{"box": [0, 0, 10, 10], "label": "person", "score": 0.9}]} for i in range(500)]
+        video = ProcessedImage.objects.create(image=self.image, model=self.model, result={"type": "video", "frames": frames}, stage_times={"inference": 1.5}, cache_key="video")
+        self.assertGreater(entry_size(video), len(json.dumps(frames)))
+
+        cache = ResultCache(entry_size(video) + ENTRY_OVERHEAD)
+        cache.put(self.user.id, self.processed_image("a"))
+        cache.put(self.user.id, video)
+        self.assertEqual(cache.status()["entries"], 1)
+        self.assertLessEqual(cache.memory_used(), cache.memory_budget)
+
+    def test_entries_larger_than_the_budget_are_not_kept(self):
+        cache = ResultCache(100)
+        cache.put(self.user.id, self.processed_image("a", 1000))
+        self.assertEqual(cache.status()["entries"], 0)
+        self.assertEqual(cache.memory_used(), 0)
+
+    def test_deleted_rows_are_dropped(self):
+        processed_image = self.processed_image("a")
+        result_cache.put(self.user.id, processed_image)
+        self.addCleanup(result_cache.clear)
+        processed_image.delete()
+        self.assertEqual(result_cache.status()["entries"], 0)
+        self.assertIsNone(result_cache.get(self.user.id, "a", self.model))
+
+    def test_rows_deleted_elsewhere_are_caught_on_revalidation(self):
+        cache = ResultCache(10 * 1024**2, revalidate_after=0)
+        processed_image = self.processed_image("a")
+        cache.put(self.user.id, processed_image)
+        # Deleted without signals, as another worker's delete looks from here
+        ProcessedImage.objects.filter(pk=processed_image.pk)._raw_delete("default")
+        self.assertIsNone(cache.get(self.user.id, "a", self.model))
+        self.assertEqual(cache.status()["entries"], 0)
+
+    def test_new_model_version_invalidates(self):
+        cache = ResultCache(10 * 1024**2)
+        cache.get(self.user.id, "a", self.model)
+        cache.put(self.user.id, self.processed_image("a"))
+        self.model.model_version = "2"
+        with self.assertNumQueries(1):
+            cache.get(self.user.id, "a", self.model)
+        self.assertEqual(cache.status()["invalidations"], 1)
+
+
+class TempBlobStoreMixin:
+    # Every test gets an empty local store in a temporary directory, standing in for the configured backend
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        settings_override = override_settings(BLOB_STORAGE_ROOT=temp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_blob_store.cache_clear()
+        self.addCleanup(get_blob_store.cache_clear)
+        self.store = get_blob_store()
+
+    def age_blob(self, blob_key, seconds=3600):
+        # Backdated as if it was saved a while ago
+        saved = time.time() - seconds
+        os.utime(self.store.path(blob_key), (saved, saved))
+
+
+class BlobStoreTests(TempBlobStoreMixin, TestCase):
+    def test_content_addressed_and_deduplicated(self):
+        key, size = self.store.save([b"hello ", b"world"])
+        self.assertEqual(key, hashlib.sha256(b"hello world").hexdigest())
+        self.assertEqual(size, 11)
+        self.assertEqual(self.store.save([b"hello world"]), (key, 11))
+        self.assertEqual(self.store.size(key), 11)
+        with self.store.open(key) as f:
+            self.assertEqual(f.read(), b"hello world")
+        # Only the blob itself, no temporary files left behind
+        self.assertEqual([name for _, _, names in os.walk(self.store.root) for name in names], [key])
+
+    def test_open_blob_falls_back_to_the_database_column(self):
+        image = create_image(create_user(), b"in the database")
+        blob, size = open_blob(image)
+        with blob:
+            self.assertEqual((blob.read(), size), (b"in the database", 15))
+
+    def test_shared_blobs_are_kept_while_referenced(self):
+        user = create_user()
+        blob_key = save_blob(b"shared")
+        first = create_image(user, blob_key=blob_key)
+        create_image(user, blob_key=blob_key)
+        first.delete()
+        self.assertTrue(self.store.exists(blob_key))
+        self.assertFalse(BlobRelease.objects.exists())
+
+    @override_settings(BLOB_DELETE_GRACE=60)
+    def test_unreferenced_blobs_are_deleted_after_the_grace_period(self):
+        blob_key = save_blob(b"orphan")
+        image = create_image(create_user(), blob_key=blob_key)
+        image.delete()
+        # Still within the grace period
+        self.assertTrue(self.store.exists(blob_key))
+        self.assertTrue(BlobRelease.objects.filter(blob_key=blob_key).exists())
+
+        self.age_blob(blob_key)
+        BlobRelease.objects.update(release_date=timezone.now() - timedelta(hours=1))
+        self.assertEqual(sweep_blobs(), 1)
+        self.assertFalse(self.store.exists(blob_key))
+        self.assertFalse(BlobRelease.objects.exists())
+
+    @override_settings(BLOB_DELETE_GRACE=60)
+    def test_saving_the_same_content_again_cancels_a_pending_delete(self):
+        user = create_user()
+        blob_key = save_blob(b"uploaded twice")
+        create_image(user, blob_key=blob_key).delete()
+        self.age_blob(blob_key)
+        BlobRelease.objects.update(release_date=timezone.now() - timedelta(hours=1))
+
+        # A second upload of the same bytes has stored its blob but not created its row yet
+        self.assertEqual(save_blob(b"uploaded twice"), blob_key)
+        self.assertEqual(sweep_blobs(), 0)
+        self.assertTrue(self.store.exists(blob_key))
+
+        create_image(user, blob_key=blob_key)
+        sweep_blobs()
+        self.assertTrue(self.store.exists(blob_key))
+        self.assertFalse(BlobRelease.objects.exists())
+
+    def test_delete_keeps_blobs_saved_since(self):
+        blob_key = save_blob(b"fresh")
+        self.assertFalse(self.store.delete(blob_key, saved_before=time.time() - 60))
+        self.assertTrue(self.store.exists(blob_key))
+        self.assertTrue(self.store.delete(blob_key, saved_before=time.time() + 60))
+        self.assertFalse(self.store.exists(blob_key))
+        self.assertTrue(self.store.delete(blob_key, saved_before=time.time()))
+
+
+def image_bytes(image_format="PNG", size=(640, 480)):
+    output = BytesIO()
+    PILImage.new("RGB", size, (200, 30, 30)).save(output, format=image_format)
+    return output.getvalue()
+
+
+def auth_headers(user):
+    return {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+
+class DerivativeTests(TempBlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user()
+        self.headers = auth_headers(self.user)
+        self.image = create_image(self.user, b"", blob_key=save_blob(image_bytes()), image_format="png")
+        self.processed_image = ProcessedImage.objects.create(image=self.image, model=create_model(), blob_key=save_blob(image_bytes("JPEG")), output_format="JPEG")
+
+    def assert_derivative(self, url, output_format, size):
+        httpresponse = self.client.get(url, {"size": size, "output": output_format}, **self.headers)
+        self.assertEqual(httpresponse.status_code, 200)
+        self.assertEqual(httpresponse["Content-Type"], CONTENT_TYPES[output_format])
+        with PILImage.open(BytesIO(b"".join(httpresponse.streaming_content))) as derivative:
+            self.assertEqual(derivative.format, output_format.upper())
+            self.assertEqual(max(derivative.size), size)
+        return httpresponse
+
+    def test_every_format(self):
+        for url in (f"/api/v1/user/image/{self.image.id}/derivative/", f"/api/v1/user/processedimage/{self.processed_image.id}/derivative/"):
+            for output_format in settings.DERIVATIVE_FORMATS:
+                with self.subTest(url=url, output=output_format):
+                    self.assert_derivative(url, output_format, 256)
+
+    def test_defaults_to_webp(self):
+        httpresponse = self.client.get(f"/api/v1/user/image/{self.image.id}/derivative/", **self.headers)
+        self.assertEqual(httpresponse["Content-Type"], "image/webp")
+
+    def test_rendered_once_then_served_with_validators(self):
+        url = f"/api/v1/user/image/{self.image.id}/derivative/"
+        first = self.assert_derivative(url, "png", 128)
+        self.assert_derivative(url, "png", 128)
+        self.assertEqual(ImageDerivative.objects.filter(image=self.image).count(), 1)
+        self.assertEqual(first["Cache-Control"], settings.BLOB_CACHE_CONTROL)
+
+        not_modified = self.client.get(url, {"size": 128, "output": "png"}, HTTP_IF_NONE_MATCH=first["ETag"], **self.headers)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_rejects_unknown_sizes_and_formats(self):
+        url = f"/api/v1/user/image/{self.image.id}/derivative/"
+        self.assertEqual(self.client.get(url, {"size": 300}, **self.headers).status_code, 400)
+        self.assertEqual(self.client.get(url, {"output": "gif"}, **self.headers).status_code, 400)
+
+    def test_other_users_images_are_not_found(self):
+        other = auth_headers(create_user("other"))
+        self.assertEqual(self.client.get(f"/api/v1/user/image/{self.image.id}/derivative/", **other).status_code, 404)
+
+
+class VariantEndpointTests(TempBlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        result_cache.clear()
+        self.addCleanup(result_cache.clear)
+        self.user = create_user()
+        self.headers = auth_headers(self.user)
+        self.image = create_image(self.user, b"", blob_key=save_blob(image_bytes()), image_format="png", image_width=640, image_height=480)
+        self.model = create_model("Detector", model_format="yolo", handler="detection")
+        self.variant = create_model("Detector (INT8)", model_format="yolo", handler="detection", precision="int8", variant_of=self.model)
+
+    def test_multi_runs_the_variant_with_tiling(self):
+        with mock.patch("api.views.process_multi", return_value=[]) as process_multi:
+            httpresponse = self.client.post(f"/api/v1/user/image/{self.image.id}/process/?precision=int8&tiling=on&tile_size=320", {"model_ids": [self.model.id, self.variant.id]}, content_type="application/json", **self.headers)
+        self.assertEqual(httpresponse.status_code, 201)
+        image, models, tiling = process_multi.call_args.args
+        self.assertEqual(models, [self.variant])
+        self.assertEqual((tiling["mode"], tiling["tile_size"]), ("on", 320))
+
+    def test_batch_runs_the_variant_with_tiling(self):
+        with mock.patch("api.views.process_batch", return_value=([], [])) as process_batch:
+            httpresponse = self.client.post(f"/api/v1/user/image/process/{self.model.id}/?precision=int8&tiling=off", {"image_ids": [self.image.id]}, content_type="application/json", **self.headers)
+        self.assertEqual(httpresponse.status_code, 201)
+        images, model, batch_size, tiling = process_batch.call_args.args
+        self.assertEqual(model, self.variant)
+        self.assertEqual(tiling["mode"], "off")
+
+    def test_unknown_variants_and_tiling_are_rejected(self):
+        for url, data in [(f"/api/v1/user/image/{self.image.id}/process/", {"model_ids": [self.model.id]}), (f"/api/v1/user/image/process/{self.model.id}/", {"image_ids": [self.image.id]})]:
+            with self.subTest(url=url):
+                httpresponse = self.client.post(f"{url}?precision=fp16", data, content_type="application/json", **self.headers)
+                self.assertEqual(httpresponse.status_code, 404)
+                httpresponse = self.client.post(f"{url}?tiling=sometimes", data, content_type="application/json", **self.headers)
+                self.assertEqual(httpresponse.status_code, 400)
+
+    def test_batch_tiles_large_images_and_batches_the_rest(self):
+        small = create_image(self.user, b"", blob_key=save_blob(image_bytes(size=(64, 48))), image_format="png", image_width=64, image_height=48)
+        tiles = {"tile_size": 320, "overlap": 0.2}
+        detection = {"type": "detection", "detections": []}
+        with (
+            mock.patch("api.process.model_registry.get"),
+            mock.patch("api.process.tiling_options", side_effect=lambda imageObject, modelObject, tiling: tiles if imageObject == self.image else None),
+            mock.patch("api.process.infer_tiled", return_value={**detection, "tiling": tiles}) as infer_tiled,
+            mock.patch("api.process.infer_batch", return_value=[detection]) as infer_batch,
+        ):
+            processed_images, _ = process_batch([self.image, small], self.model, 2, {"mode": "auto"})
+
+        self.assertEqual(infer_tiled.call_count, 1)
+        self.assertEqual(len(infer_batch.call_args.args[0]), 1)
+        self.assertEqual([processed_image.result.get("tiling") for processed_image in processed_images], [tiles, None])
+
+    def test_batch_errors_are_not_reported_as_busy(self):
+        url = f"/api/v1/user/image/{self.image.id}/process/{self.model.id}/"
+        for error, status in [(BatchTimeout("slow"), 504), (BatcherStopped("stopped"), 503)]:
+            with self.subTest(error=error), mock.patch("api.views.aprocess", side_effect=error):
+                httpresponse = self.client.post(url, **self.headers)
+                self.assertEqual(httpresponse.status_code, status)
+                self.assertNotIn("busy", httpresponse.json()["message"])
+
+    @override_settings(INFERENCE_PROCESSES=2)
+    def test_multi_and_batch_use_the_inference_processes(self):
+        detection = {"type": "detection", "detections": []}
+        pool = mock.Mock()
+        pool.infer_batch.side_effect = lambda images, modelObject: [detection] * len(images)
+        other = create_model("Other", model_format="yolo", handler="detection")
+        with mock.patch("api.process.get_inference_pool", return_value=pool), mock.patch("api.process.model_registry.get") as registry_get:
+            self.assertEqual(len(process_multi(self.image, [self.model, other], {"mode": "off"})), 2)
+            processed_images, _ = process_batch([self.image], self.variant, 2, {"mode": "off"})
+
+        self.assertEqual(len(processed_images), 1)
+        self.assertEqual(pool.infer_batch.call_count, 3)
+        registry_get.assert_not_called()
+
+    def test_batch_reuses_cached_results(self):
+        detection = {"type": "detection", "detections": []}
+        with mock.patch("api.process.model_registry.get"), mock.patch("api.process.infer_batch", return_value=[detection]) as infer_batch:
+            first, batches = process_batch([self.image, self.image], self.model, 2)
+            again, again_batches = process_batch([self.image], self.model, 2)
+
+        self.assertEqual(infer_batch.call_count, 1)
+        self.assertEqual(len(infer_batch.call_args.args[0]), 1)
+        self.assertEqual([processed_image.pk for processed_image in first], [first[0].pk, first[0].pk])
+        self.assertEqual(again[0].pk, first[0].pk)
+        self.assertEqual((len(batches), again_batches), (1, []))
+        self.assertEqual(ProcessedImage.objects.filter(image=self.image).count(), 1)
+
+
+def streamed_content(httpresponse):
+    # Async views stream blobs through an async iterator
+    async def collect():
+        return b"".join([chunk async for chunk in httpresponse.streaming_content])
+
+    return asyncio.run(collect())
+
+
+# Async views read deferred fields from another thread, which only sees committed rows
+class UploadDownloadTests(TempBlobStoreMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user()
+        self.headers = auth_headers(self.user)
+        self.data = image_bytes("PNG", (320, 240))
+
+    def upload(self, data, name="photo.png"):
+        return self.client.post("/api/v1/user/image/upload/", {"image": SimpleUploadedFile(name, data)}, **self.headers)
+
+    def download(self, image, **headers):
+        return self.client.get(f"/api/v1/user/image/{image.id}/", **self.headers, **headers)
+
+    def test_upload_is_stored_by_content(self):
+        httpresponse = self.upload(self.data)
+        self.assertEqual(httpresponse.status_code, 201)
+        image = Image.objects.get(pk=httpresponse.json()["data"]["id"])
+        self.assertEqual(image.blob_key, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual((image.image_format, image.image_size, image.image_width, image.image_height), ("png", len(self.data), 320, 240))
+        blob, size = open_blob(image)
+        with blob:
+            self.assertEqual(blob.read(), self.data)
+
+    def test_upload_rejects_bad_files(self):
+        self.assertEqual(self.upload(b"not an image", "notes.png").status_code, 400)
+        with override_settings(UPLOAD_MAX_SIZE=len(self.data) - 1):
+            self.assertEqual(self.upload(self.data).status_code, 413)
+        self.assertFalse(Image.objects.exists())
+
+    def test_download_with_validators(self):
+        image = Image.objects.get(pk=self.upload(self.data).json()["data"]["id"])
+        httpresponse = self.download(image)
+        self.assertEqual(httpresponse.status_code, 200)
+        self.assertEqual(streamed_content(httpresponse), self.data)
+        self.assertEqual(httpresponse["ETag"], f'"{image.blob_key}"')
+        self.assertEqual(httpresponse["Content-Length"], str(len(self.data)))
+        self.assertEqual(httpresponse["Accept-Ranges"], "bytes")
+
+        not_modified = self.download(image, HTTP_IF_NONE_MATCH=httpresponse["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], httpresponse["ETag"])
+        self.assertEqual(self.download(image, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_download_ranges(self):
+        image = Image.objects.get(pk=self.upload(self.data).json()["data"]["id"])
+        size = len(self.data)
+        for range_header, start, end in [("bytes=0-9", 0, 9), ("bytes=100-", 100, size - 1), ("bytes=-16", size - 16, size - 1), (f"bytes=10-{size * 2}", 10, size - 1)]:
+            with self.subTest(range=range_header):
+                httpresponse = self.download(image, HTTP_RANGE=range_header)
+                self.assertEqual(httpresponse.status_code, 206)
+                self.assertEqual(httpresponse["Content-Range"], f"bytes {start}-{end}/{size}")
+                self.assertEqual(streamed_content(httpresponse), self.data[start : end + 1])
+
+        httpresponse = self.download(image, HTTP_RANGE=f"bytes={size}-")
+        self.assertEqual(httpresponse.status_code, 416)
+        self.assertEqual(httpresponse["Content-Range"], f"bytes */{size}")
+
+    def test_rows_without_a_blob_are_served_from_the_database(self):
+        image = create_image(self.user, self.data, image_format="png")
+        httpresponse = self.download(image, HTTP_RANGE="bytes=0-3")
+        self.assertEqual(httpresponse.status_code, 206)
+        self.assertEqual(streamed_content(httpresponse), self.data[:4])
+        self.assertEqual(httpresponse["ETag"], f'"image-{image.pk}"')
@@ -0,0 +1,40 @@
+from io import BytesIO
+from itertools import chain
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, UnidentifiedImageError
+
+from .video import video_format
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    # Placed first in FILE_UPLOAD_HANDLERS so oversized files are dropped before any handler buffers them
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_SIZE:
+            self.request.upload_too_large = True
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def probe_image(chunks):
+    # Only the header is parsed, the pixel data is neither decoded nor allocated
+    head = []
+    for chunk in chunks:
+        head.append(chunk)
+        # Video dimensions come from OpenCV once the file is stored
+        video = video_format(b"".join(head)[:16])
+        if video is not None:
+            return (video, None, None), chain(head, chunks)
+        try:
+            with Image.open(BytesIO(b"".join(head))) as image:
+                return (image.format, image.width, image.height), chain(head, chunks)
+        except Image.DecompressionBombError:
+            raise ValueError("Image dimensions are too large.")
+        except (UnidentifiedImageError, OSError):
+            if sum(len(c) for c in head) >= settings.UPLOAD_PROBE_SIZE:
+                break
+    raise ValueError("Unsupported or invalid image.")
@@ -5,6 +5,7 @@ urlpatterns = [
     # API Related
     path("", views.home, name="home"),
     path("health", views.health, name="health"),
+    path("metrics", views.metrics_view, name="metrics"),
     # Auth Related
     path("auth/register/", views.register, name="register"),
     path("auth/login/", views.login.as_view(), name="login"),
@@ -17,6 +18,7 @@ urlpatterns = [
     path("user/image/", views.image, name="image"),
     path("user/image/upload/", views.upload_image, name="upload_image"),
     path("user/image/<int:image_id>/", views.image_id, name="image_id"),
+    path("user/image/<int:image_id>/derivative/", views.image_derivative, name="image_derivative"),
     # Model Categories Related
     path("model_categories/", views.model_categories, name="model_categories"),
     # Model Related
@@ -24,6 +26,12 @@ urlpatterns = [
     path("models/<int:model_id>/", views.model_details, name="model_detail"),
     # Processed Image Related
     path("user/image/<int:image_id>/process/<int:model_id>/", views.process_image, name="process_image"),
+    path("user/image/<int:image_id>/process/", views.process_image_multi, name="process_image_multi"),
+    path("user/image/process/<int:model_id>/", views.process_image_batch, name="process_image_batch"),
     path("user/processedimage/", views.processed_image, name="processed_images"),
     path("user/processedimage/<int:processed_image_id>/", views.processed_image_id, name="processed_image_id"),
+    path("user/processedimage/<int:processed_image_id>/derivative/", views.processed_image_derivative, name="processed_image_derivative"),
+    # Processing Job Related
+    path("user/job/<int:job_id>/", views.processing_job, name="processing_job"),
+    path("user/job/<int:job_id>/result/", views.processing_job_result, name="processing_job_result"),
 ]
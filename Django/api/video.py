@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from PIL import GifImagePlugin, Image
+
+from .storage import get_blob_store
+
+
+VIDEO_FORMATS = ["mp4", "webm", "avi"]
+
+
+def video_format(head):
+    # Containers are recognised by their signature, Pillow cannot open them to probe the header
+    if head[4:8] == b"ftyp":
+        return "MP4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "WEBM"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "AVI"
+    return None
+
+
+@contextmanager
+def local_path(blob_key, image_format):
+    # OpenCV reads from a path, so blobs outside the local store are spooled to a temporary file first
+    store = get_blob_store()
+    if hasattr(store, "path"):
+        yield store.path(blob_key)
+        return
+    with store.open(blob_key) as blob, tempfile.NamedTemporaryFile(suffix=f".{image_format}") as f:
+        shutil.copyfileobj(blob, f)
+        f.flush()
+        yield f.name
+
+
+def media_info(path):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError("Unsupported or invalid video.")
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    if not width or not height:
+        raise ValueError("Unsupported or invalid video.")
+    # GIFs and some containers do not report a frame rate
+    return width, height, frame_count, fps if fps and fps > 0 else 10.0
+
+
+def probe_stored(blob_key, image_format):
+    if image_format == "gif":
+        with get_blob_store().open(blob_key) as blob, Image.open(blob) as image:
+            return image.width, image.height, getattr(image, "n_frames", 1)
+    with local_path(blob_key, image_format) as path:
+        width, height, frame_count, _ = media_info(path)
+    return width, height, frame_count
+
+
+def iter_frames(path, stride=1):
+    # Frames are decoded one at a time, and frames skipped by the stride are grabbed without being decoded
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while capture.grab():
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    return
+                yield frame
+            index += 1
+    finally:
+        capture.release()
+
+
+class Mp4Writer:
+    # H.264 plays in browsers but is missing from some OpenCV builds, MPEG-4 Part 2 is always there
+    CODECS = ["avc1", "mp4v"]
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = fps
+        self.writer = None
+
+    def write(self, frame):
+        import cv2
+
+        if self.writer is None:
+            height, width = frame.shape[:2]
+            for codec in self.CODECS:
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*codec), self.fps, (width, height))
+                if self.writer.isOpened():
+                    break
+            else:
+                raise ValueError("No MP4 encoder is available.")
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+class GifWriter:
+    # Frames are written as they arrive, Image.save(append_images=...) would keep every frame in memory
+    def __init__(self, path, fps):
+        self.file = open(path, "wb")
+        self.duration = max(int(round(1000 / fps)), 20)
+        self.started = False
+
+    def write(self, frame):
+        import cv2
+
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).quantize(256)
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(image, info={"loop": 0, "duration": self.duration})
+            self.file.writelines(header)
+            self.started = True
+        self.file.writelines(GifImagePlugin.getdata(image, duration=self.duration, include_color_table=True))
+
+    def close(self):
+        if self.started:
+            self.file.write(b";")
+        self.file.close()
+
+
+WRITERS = {
+    "MP4": Mp4Writer,
+    "GIF": GifWriter,
+}
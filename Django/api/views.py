@@ -1,15 +1,31 @@
+import os
+import re
 from django.conf import settings
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date, urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.decorators import method_decorator
+from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenBlacklistView
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from .process import process
-from django.http import HttpResponse
-from .models import ProcessedImage
+from django.core.files.uploadedfile import UploadedFile
+from asgiref.sync import sync_to_async
+from .asyncapi import async_api_view, run_sync
+from .process import DecodeBudgetExceeded, aprocess, process_batch, process_multi, render_processed_image, model_registry, mediapipe_pool, result_cache, batch_scheduler, inference_pool_status
+from .batching import BatcherStopped, BatchTimeout, QueueFull
+from .jobs import JobQueueFull, submit_job
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from .models import ProcessedImage, ProcessingJob
+from .storage import get_blob_store, open_blob, save_blob
+from .uploads import probe_image
+from .derivatives import CONTENT_TYPES, get_derivative
+from .signals import release_blob
+from .video import VIDEO_FORMATS, probe_stored
+from . import metrics
 
 from .models import Image, Model, ModelCategory, UserSetting
 from .serializers import (
@@ -24,6 +40,148 @@ def response(success, message, data, status=200):
     return JsonResponse({"success": success, "message": message, "data": data}, status=status)
 
 
+def read_range(blob, start, length, chunk_size=64 * 1024):
+    try:
+        blob.seek(start)
+        while length > 0:
+            chunk = blob.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        blob.close()
+
+
+def blob_etag(instance):
+    # Stored images never change, so the content hash (or the row identity for data still in the database) is a strong validator
+    return f'"{instance.blob_key or f"{instance._meta.model_name}-{instance.pk}"}"'
+
+
+def cache_headers(httpresponse, etag, last_modified):
+    httpresponse["ETag"] = etag
+    if last_modified is not None:
+        httpresponse["Last-Modified"] = http_date(last_modified)
+    httpresponse["Cache-Control"] = settings.BLOB_CACHE_CONTROL
+    return httpresponse
+
+
+def blob_response(request, instance, content_type, filename, last_modified=None):
+    disposition = f'attachment; filename="{filename}"'
+    etag = blob_etag(instance)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    if request.method in ("GET", "HEAD"):
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return cache_headers(not_modified, etag, last_modified)
+
+    store = get_blob_store()
+    if settings.BLOB_ACCEL_REDIRECT_PREFIX and instance.blob_key and hasattr(store, "relative_path"):
+        # The reverse proxy serves the file itself (sendfile, ranges), Django only authorises it
+        httpresponse = HttpResponse(content_type=content_type)
+        httpresponse["X-Accel-Redirect"] = settings.BLOB_ACCEL_REDIRECT_PREFIX + store.relative_path(instance.blob_key)
+        httpresponse["Content-Disposition"] = disposition
+        return cache_headers(httpresponse, etag, last_modified)
+
+    blob, size = open_blob(instance)
+    range_match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("Range", "").strip())
+    if range_match and any(range_match.groups()):
+        first, last = range_match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start > end or start >= size:
+            blob.close()
+            httpresponse = HttpResponse(status=416)
+            httpresponse["Content-Range"] = f"bytes */{size}"
+            return httpresponse
+
+        httpresponse = StreamingHttpResponse(read_range(blob, start, end - start + 1), status=206, content_type=content_type)
+        httpresponse["Content-Range"] = f"bytes {start}-{end}/{size}"
+        httpresponse["Content-Length"] = str(end - start + 1)
+    else:
+        httpresponse = FileResponse(blob, content_type=content_type)
+        httpresponse["Content-Length"] = str(size)
+
+    httpresponse["Accept-Ranges"] = "bytes"
+    httpresponse["Content-Disposition"] = disposition
+    return cache_headers(httpresponse, etag, last_modified)
+
+
+def derivative_response(request, instance, filename):
+    if getattr(instance, "image_format", None) in VIDEO_FORMATS or getattr(instance, "output_format", None) == "MP4":
+        return response(False, "Derivatives are only available for images.", {}, 400)
+
+    try:
+        size = int(request.GET.get("size", 256))
+    except ValueError:
+        size = None
+    # Not ?format=, which DRF takes as its renderer override and rejects with a 404 before the view runs
+    output_format = request.GET.get("output", "webp").lower()
+    if size not in settings.DERIVATIVE_SIZES or output_format not in settings.DERIVATIVE_FORMATS:
+        return response(False, f"Size must be one of {settings.DERIVATIVE_SIZES} and output one of {settings.DERIVATIVE_FORMATS}.", {}, 400)
+
+    derivative = get_derivative(instance, size, output_format)
+    return blob_response(request, derivative, CONTENT_TYPES[output_format], f"{filename}_{size}.{output_format}", derivative.creation_date)
+
+
+async def cursor_page(request, queryset):
+    # Keyset pagination on the primary key, newest first, so deep pages cost the same as the first one
+    try:
+        limit = min(max(int(request.GET.get("limit", settings.LISTING_PAGE_SIZE)), 1), settings.LISTING_MAX_PAGE_SIZE)
+        cursor = request.GET.get("cursor")
+        if cursor:
+            queryset = queryset.filter(id__lt=int(urlsafe_base64_decode(cursor)))
+    except ValueError:
+        return None
+
+    rows = [row async for row in queryset.order_by("-id")[: limit + 1]]
+    next_cursor = urlsafe_base64_encode(force_bytes(rows[limit - 1]["id"])) if len(rows) > limit else None
+    return {"results": rows[:limit], "next_cursor": next_cursor}
+
+
+OUTPUT_TYPES = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "MP4": ("video/mp4", "mp4"),
+    "GIF": ("image/gif", "gif"),
+}
+
+
+def processed_image_response(request, processed_image):
+    if request.GET.get("format") == "json":
+        data = {
+            "id": processed_image.id,
+            "image_id": processed_image.image_id,
+            "model_id": processed_image.model_id,
+            "processing_time": processed_image.processing_time.total_seconds() if processed_image.processing_time is not None else None,
+            "stage_times": processed_image.stage_times,
+            "result": processed_image.result,
+        }
+        return response(True, "Processed image result retrieved successfully!", data, 200)
+
+    render_processed_image(processed_image)
+    content_type, extension = OUTPUT_TYPES.get(processed_image.output_format, OUTPUT_TYPES["JPEG"])
+    return blob_response(request, processed_image, content_type, f"processed_image_{processed_image.id}.{extension}", processed_image.creation_date)
+
+
+def job_data(job):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "image_id": job.image_id,
+        "model_id": job.model_id,
+        "processed_image_id": job.processed_image_id,
+        "creation_date": job.creation_date,
+        "start_date": job.start_date,
+        "end_date": job.end_date,
+        "queue_time": (job.start_date - job.creation_date).total_seconds() if job.start_date else None,
+        "run_time": (job.end_date - job.start_date).total_seconds() if job.start_date and job.end_date else None,
+        "error": job.error,
+    }
+
+
 @api_view(["GET"])
 def home(request):
     return response(True, "Welcome to the DeepSight API!", {}, 200)
@@ -32,7 +190,13 @@ def home(request):
 @api_view(["GET"])
 @ensure_csrf_cookie
 def health(request):
-    return response(True, "API is healthy!", {}, 200)
+    # Always 200 so clients can still pick up the CSRF cookie while models are warming up
+    return response(True, "API is healthy!", {"models": model_registry.status(), "mediapipe_pool": mediapipe_pool.status(), "result_cache": result_cache.status(), "batching": batch_scheduler.status(), "inference_processes": inference_pool_status()}, 200)
+
+
+@api_view(["GET"])
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 class login(TokenObtainPairView):
@@ -156,92 +320,119 @@ def user(request):
         return response(False, "Failed to update user data.", serializer.errors, 400)
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def image(request):
-    images = Image.objects.filter(user=request.user)
-    data = [{"id": image.id} for image in images]
-    return response(True, "Image IDs retrieved successfully!", data, 200)
+@async_api_view(["GET"], authenticated=True)
+async def image(request):
+    images = Image.objects.filter(user=request.user).values("id", "image_name", "image_format", "image_size", "upload_date", "is_processed")
+    data = await cursor_page(request, images)
+    if data is None:
+        return response(False, "Invalid cursor or limit.", {}, 400)
+    return response(True, "Images retrieved successfully!", data, 200)
 
 
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-@csrf_protect
-def upload_image(request):
-    if "image" not in request.FILES:
-        return response(False, "No image provided.", {}, 400)
+def receive_upload(request):
+    # Parsing the multipart body, probing it and writing the blob are all file I/O, so this runs off the event loop
+    image_file: UploadedFile = request.FILES.get("image")
+    if getattr(request, "upload_too_large", False) or (image_file is not None and image_file.size > settings.UPLOAD_MAX_SIZE):
+        return response(False, f"Image is larger than {settings.UPLOAD_MAX_SIZE} bytes.", {}, 413), None
+
+    if image_file is None:
+        return response(False, "No image provided.", {}, 400), None
 
-    image_file: InMemoryUploadedFile = request.FILES["image"]
+    # The header is validated from the first chunks, the rest is streamed straight into the blob store
+    try:
+        (image_format, image_width, image_height), chunks = probe_image(image_file.chunks())
+    except ValueError as e:
+        return response(False, str(e), {}, 400), None
+    if image_width is not None and image_width * image_height > settings.UPLOAD_MAX_PIXELS:
+        return response(False, f"Image has more than {settings.UPLOAD_MAX_PIXELS} pixels.", {}, 400), None
 
     data = {
         "image_name": image_file.name,
-        "image_format": image_file.content_type.split("/")[1],
+        "image_format": image_format.lower(),
         "image_size": image_file.size,
     }
 
     serializer = ImageSerializer(data=data)
-    if serializer.is_valid():
-        image_instance = serializer.save(user=request.user)
-        image_instance.binary_data = image_file.read()
-        image_instance.save()
-        return response(
-            True,
-            "Image uploaded successfully!",
-            {
-                "id": image_instance.id,
-                "image_name": image_instance.image_name,
-                "upload_date": image_instance.upload_date,
-                "image_format": image_instance.image_format,
-                "image_size": image_instance.image_size,
-            },
-            201,
-        )
-    return response(False, "Failed to upload image.", serializer.errors, 400)
-
-
-@api_view(["GET", "DELETE"])
-@permission_classes([IsAuthenticated])
-@csrf_protect
-def image_id(request, image_id):
+    if not serializer.is_valid():
+        return response(False, "Failed to upload image.", serializer.errors, 400), None
+
+    blob_key, image_size = get_blob_store().save(chunks)
+    frame_count = None
+    if data["image_format"] in VIDEO_FORMATS or data["image_format"] == "gif":
+        try:
+            image_width, image_height, frame_count = probe_stored(blob_key, data["image_format"])
+        except (ValueError, OSError) as e:
+            release_blob(blob_key)
+            return response(False, str(e), {}, 400), None
+        if image_width * image_height > settings.UPLOAD_MAX_PIXELS:
+            release_blob(blob_key)
+            return response(False, f"Image has more than {settings.UPLOAD_MAX_PIXELS} pixels.", {}, 400), None
+        # A GIF with a single frame is a still image
+        if data["image_format"] == "gif" and frame_count <= 1:
+            frame_count = None
+
+    return None, {**serializer.validated_data, "blob_key": blob_key, "content_hash": blob_key, "image_size": image_size, "image_width": image_width, "image_height": image_height, "frame_count": frame_count}
+
+
+@async_api_view(["POST"], authenticated=True)
+async def upload_image(request):
+    error, fields = await sync_to_async(receive_upload, thread_sensitive=False)(request)
+    if error is not None:
+        return error
+
+    image_instance = await Image.objects.acreate(user=request.user, **fields)
+    return response(
+        True,
+        "Image uploaded successfully!",
+        {
+            "id": image_instance.id,
+            "image_name": image_instance.image_name,
+            "upload_date": image_instance.upload_date,
+            "image_format": image_instance.image_format,
+            "image_size": image_instance.image_size,
+            "frame_count": image_instance.frame_count,
+        },
+        201,
+    )
+
+
+@async_api_view(["GET", "DELETE"], authenticated=True)
+async def image_id(request, image_id):
     try:
-        image = Image.objects.get(pk=image_id, user=request.user)
+        image = await Image.objects.defer("binary_data").aget(pk=image_id, user=request.user)
     except Image.DoesNotExist:
         return response(False, "Image not found.", {}, 404)
 
-    if request.method == "GET":
-        httpresponse = HttpResponse(content=image.binary_data, content_type=image.image_format)
-        httpresponse["Content-Disposition"] = f'attachment; filename="{image.image_name}"'
-        return httpresponse
+    if request.method in ("GET", "HEAD"):
+        return await run_sync(blob_response, request, image, image.image_format, image.image_name, image.upload_date)
 
     elif request.method == "DELETE":
-        image.delete()
+        await image.adelete()
         return response(True, "Image deleted successfully!", {}, 204)
 
 
-@api_view(["GET"])
-def model_categories(request):
-    categories = ModelCategory.objects.all()
-    data = [{"id": cat.id, "category_name": cat.category_name} for cat in categories]
+@async_api_view(["GET"])
+async def model_categories(request):
+    data = [{"id": cat.id, "category_name": cat.category_name} async for cat in ModelCategory.objects.all()]
     return response(True, "Model categories retrieved successfully!", data, 200)
 
 
-@api_view(["GET"])
-def models(request):
-    models = Model.objects.all()
+@async_api_view(["GET"])
+async def models(request):
     data = [
         {
-            "id": model.id,
-            "model_name": model.model_name,
+            "id": model["id"],
+            "model_name": model["model_name"],
         }
-        for model in models
+        async for model in Model.objects.filter(variant_of__isnull=True).values("id", "model_name")
     ]
     return response(True, "Models retrieved successfully!", data, 200)
 
 
-@api_view(["GET"])
-def model_details(request, model_id):
+@async_api_view(["GET"])
+async def model_details(request, model_id):
     try:
-        model = Model.objects.get(pk=model_id)
+        model = await Model.objects.select_related("category").aget(pk=model_id)
     except Model.DoesNotExist:
         return response(False, "Model not found.", {}, 404)
 
@@ -253,6 +444,8 @@ def model_details(request, model_id):
         "model_description": model.model_description,
         "model_version": model.model_version,
         "category": model.category.category_name.capitalize(),
+        "precision": model.precision,
+        "precisions": [precision async for precision in Model.objects.filter(Q(pk=model.variant_of_id or model.id) | Q(variant_of_id=model.variant_of_id or model.id)).order_by("precision").values_list("precision", flat=True)],
     }
     return response(True, "Model data retrieved successfully!", data, 200)
 
@@ -285,52 +478,266 @@ def user_settings(request):
         return response(False, "Failed to update user settings.", serializer.errors, 400)
 
 
-@api_view(["POST"])
-@csrf_protect
-@permission_classes([IsAuthenticated])
-def process_image(request, image_id, model_id):
+def tiling_params(request):
+    # ?tiling=auto|on|off with optional tile_size (pixels) and tile_overlap (share of a tile)
+    mode = request.GET.get("tiling", "auto")
+    if mode not in ("auto", "on", "off"):
+        return "Tiling must be auto, on or off.", None
     try:
-        image_instance = Image.objects.get(pk=image_id, user=request.user)
+        tile_size = int(request.GET["tile_size"]) if "tile_size" in request.GET else None
+        overlap = float(request.GET["tile_overlap"]) if "tile_overlap" in request.GET else settings.TILE_OVERLAP
+    except ValueError:
+        return "Tile size and overlap must be numbers.", None
+    if tile_size is not None and not settings.TILE_MIN_SIZE <= tile_size <= settings.TILE_MAX_SIZE:
+        return f"Tile size must be between {settings.TILE_MIN_SIZE} and {settings.TILE_MAX_SIZE}.", None
+    if not 0 <= overlap <= settings.TILE_MAX_OVERLAP:
+        return f"Tile overlap must be between 0 and {settings.TILE_MAX_OVERLAP}.", None
+    return None, {"mode": mode, "tile_size": tile_size, "overlap": overlap}
+
+
+def precision_variant(model_instance, precision):
+    # Precision variants are rows of their own, looked up among the rows of the same logical model
+    if not precision or precision == model_instance.precision:
+        return None, model_instance
+    base_id = model_instance.variant_of_id or model_instance.id
+    try:
+        variant = Model.objects.get(Q(pk=base_id) | Q(variant_of_id=base_id), precision=precision)
+    except Model.DoesNotExist:
+        return f"Model has no {precision} variant.", None
+    if variant.model_dir and not os.path.exists(variant.model_dir):
+        return f"The {precision} variant of this model has not been built yet.", None
+    return None, variant
+
+
+@async_api_view(["POST"], authenticated=True)
+async def process_image(request, image_id, model_id):
+    try:
+        image_instance = await Image.objects.aget(pk=image_id, user=request.user)
     except Image.DoesNotExist:
         return JsonResponse({"success": False, "message": "Image not found."}, status=404)
 
     try:
-        model_instance = Model.objects.get(pk=model_id)
+        model_instance = await Model.objects.aget(pk=model_id)
     except Model.DoesNotExist:
         return JsonResponse({"success": False, "message": "Model not found."}, status=404)
 
-    processed_image = process(image_instance, model_instance)
+    error, model_instance = await sync_to_async(precision_variant)(model_instance, request.GET.get("precision"))
+    if error:
+        return response(False, error, {}, 404)
+
+    try:
+        stride = int(request.GET.get("stride", 1))
+    except ValueError:
+        stride = 0
+    if not 1 <= stride <= settings.VIDEO_MAX_STRIDE:
+        return response(False, f"Stride must be between 1 and {settings.VIDEO_MAX_STRIDE}.", {}, 400)
+
+    error, tiling = tiling_params(request)
+    if error:
+        return response(False, error, {}, 400)
+
+    if request.GET.get("async", "").lower() in ("1", "true"):
+        try:
+            job = await sync_to_async(submit_job)(image_instance, model_instance, stride, tiling)
+        except JobQueueFull:
+            return response(False, "Processing queue is full, try again later.", {}, 503)
+        return response(True, "Processing job queued.", job_data(job), 202)
+
+    try:
+        processed_image = await aprocess(image_instance, model_instance, render=request.GET.get("format") != "json", stride=stride, tiling=tiling)
+    except QueueFull:
+        return response(False, "Model is busy, try again later.", {}, 503)
+    except BatchTimeout:
+        return response(False, "Model did not answer in time.", {}, 504)
+    except BatcherStopped:
+        return response(False, "Model is being reloaded, try again later.", {}, 503)
+    except DecodeBudgetExceeded as e:
+        return response(False, str(e), {}, 413)
 
     if processed_image is None:
         return JsonResponse({"success": False, "message": "Failed to process image."}, status=500)
 
-    response = HttpResponse(content=processed_image.binary_data, content_type="image/jpeg")
-    response["Content-Disposition"] = f'attachment; filename="processed_image_{processed_image.id}.jpg"'
-
-    return response
+    return await run_sync(processed_image_response, request, processed_image)
 
 
-@api_view(["GET"])
+@api_view(["POST"])
+@csrf_protect
 @permission_classes([IsAuthenticated])
-def processed_image(request):
-    processed_images = ProcessedImage.objects.filter(image__user=request.user)
-    data = [{"id": image.id} for image in processed_images]
-    return response(True, "Processed image IDs retrieved successfully!", data, 200)
+def process_image_multi(request, image_id):
+    model_ids = request.data.get("model_ids")
+    if not isinstance(model_ids, list) or not model_ids or not all(isinstance(model_id, int) for model_id in model_ids):
+        return response(False, "No model IDs provided.", {}, 400)
+
+    try:
+        image_instance = Image.objects.get(pk=image_id, user=request.user)
+    except Image.DoesNotExist:
+        return response(False, "Image not found.", {}, 404)
+
+    if image_instance.frame_count is not None:
+        return response(False, "Videos can only be processed with one model at a time.", {}, 400)
+
+    model_ids = list(dict.fromkeys(model_ids))
+    models = Model.objects.in_bulk(model_ids)
+    if len(models) != len(model_ids):
+        return response(False, "Model not found.", {}, 404)
 
+    model_instances = []
+    for model_id in model_ids:
+        error, model_instance = precision_variant(models[model_id], request.GET.get("precision"))
+        if error:
+            return response(False, error, {}, 404)
+        model_instances.append(model_instance)
+    # A model and its variant both asked for at one precision are one model
+    model_instances = list({model_instance.id: model_instance for model_instance in model_instances}.values())
 
-@api_view(["GET", "DELETE"])
+    error, tiling = tiling_params(request)
+    if error:
+        return response(False, error, {}, 400)
+
+    try:
+        processed_images = process_multi(image_instance, model_instances, tiling)
+    except DecodeBudgetExceeded as e:
+        return response(False, str(e), {}, 413)
+
+    if processed_images is None:
+        return response(False, "Failed to process image.", {}, 500)
+
+    data = [
+        {
+            "id": processed_image.id,
+            "model_id": processed_image.model_id,
+            "processing_time": processed_image.processing_time.total_seconds(),
+            "stage_times": processed_image.stage_times,
+        }
+        for processed_image in processed_images
+    ]
+    return response(True, "Image processed successfully!", data, 201)
+
+
+@api_view(["POST"])
+@csrf_protect
 @permission_classes([IsAuthenticated])
-def processed_image_id(request, processed_image_id):
+def process_image_batch(request, model_id):
+    image_ids = request.data.get("image_ids")
+    if not isinstance(image_ids, list) or not image_ids:
+        return response(False, "No image IDs provided.", {}, 400)
+    if len(image_ids) > settings.BATCH_PROCESSING_MAX_IMAGES:
+        return response(False, f"At most {settings.BATCH_PROCESSING_MAX_IMAGES} images can be processed at once.", {}, 400)
+
+    try:
+        batch_size = int(request.data.get("batch_size", settings.BATCH_PROCESSING_SIZE))
+    except (TypeError, ValueError):
+        return response(False, "Invalid batch size.", {}, 400)
+    if not 1 <= batch_size <= settings.BATCH_PROCESSING_MAX_IMAGES:
+        return response(False, "Invalid batch size.", {}, 400)
+
+    try:
+        model_instance = Model.objects.get(pk=model_id)
+    except Model.DoesNotExist:
+        return response(False, "Model not found.", {}, 404)
+
+    error, model_instance = precision_variant(model_instance, request.GET.get("precision"))
+    if error:
+        return response(False, error, {}, 404)
+
+    error, tiling = tiling_params(request)
+    if error:
+        return response(False, error, {}, 400)
+
+    images = Image.objects.in_bulk(image_ids) if all(isinstance(image_id, int) for image_id in image_ids) else {}
+    image_instances = [images[image_id] for image_id in image_ids if image_id in images and images[image_id].user_id == request.user.id]
+    if len(image_instances) != len(image_ids):
+        return response(False, "Image not found.", {}, 404)
+    if any(image_instance.frame_count is not None for image_instance in image_instances):
+        return response(False, "Videos can only be processed one at a time.", {}, 400)
+
+    try:
+        processed_images, batches = process_batch(image_instances, model_instance, batch_size, tiling)
+    except DecodeBudgetExceeded as e:
+        return response(False, str(e), {}, 413)
+    except Exception as e:
+        print(f"Error during batch processing: {e}")
+        return response(False, "Failed to process images.", {}, 500)
+
+    data = {
+        "processed_images": [{"id": processed_image.id, "image_id": processed_image.image_id} for processed_image in processed_images],
+        "batches": batches,
+    }
+    return response(True, "Images processed successfully!", data, 201)
+
+
+@async_api_view(["GET"], authenticated=True)
+async def processed_image(request):
+    # No join in the paginated query, so the page comes from the listing index alone and names are looked up for the page only
+    processed_images = ProcessedImage.objects.filter(user=request.user).values("id", "image_id", "model_id", "creation_date", "processing_time", "output_format")
+    data = await cursor_page(request, processed_images)
+    if data is None:
+        return response(False, "Invalid cursor or limit.", {}, 400)
+    model_names = {model_id: model_name async for model_id, model_name in Model.objects.filter(id__in={row["model_id"] for row in data["results"]}).values_list("id", "model_name")}
+    for row in data["results"]:
+        row["model_name"] = model_names.get(row["model_id"])
+        row["processing_time"] = row["processing_time"].total_seconds() if row["processing_time"] is not None else None
+    return response(True, "Processed images retrieved successfully!", data, 200)
+
+
+@async_api_view(["GET", "DELETE"], authenticated=True)
+async def processed_image_id(request, processed_image_id):
     try:
-        processed_image = ProcessedImage.objects.get(pk=processed_image_id, image__user=request.user)
+        processed_image = await ProcessedImage.objects.select_related("model").defer("binary_data").aget(pk=processed_image_id, image__user=request.user)
     except ProcessedImage.DoesNotExist:
         return response(False, "Processed image not found.", {}, 404)
 
-    if request.method == "GET":
-        httpresponse = HttpResponse(content=processed_image.binary_data, content_type="image/jpeg")
-        httpresponse["Content-Disposition"] = f'attachment; filename="processed_image_{processed_image.id}.jpg"'
-        return httpresponse
+    if request.method in ("GET", "HEAD"):
+        return await run_sync(processed_image_response, request, processed_image)
 
     elif request.method == "DELETE":
-        processed_image.delete()
+        await processed_image.adelete()
         return response(True, "Processed image deleted successfully!", {}, 204)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def processing_job(request, job_id):
+    try:
+        job = ProcessingJob.objects.get(pk=job_id, image__user=request.user)
+    except ProcessingJob.DoesNotExist:
+        return response(False, "Processing job not found.", {}, 404)
+
+    return response(True, "Processing job retrieved successfully!", job_data(job), 200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def processing_job_result(request, job_id):
+    try:
+        job = ProcessingJob.objects.select_related("processed_image").defer("processed_image__binary_data").get(pk=job_id, image__user=request.user)
+    except ProcessingJob.DoesNotExist:
+        return response(False, "Processing job not found.", {}, 404)
+
+    if job.status != "done" or job.processed_image is None:
+        return response(False, "Processing job has no result.", job_data(job), 409)
+
+    return processed_image_response(request, job.processed_image)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def image_derivative(request, image_id):
+    try:
+        image = Image.objects.defer("binary_data").get(pk=image_id, user=request.user)
+    except Image.DoesNotExist:
+        return response(False, "Image not found.", {}, 404)
+
+    return derivative_response(request, image, f"image_{image.id}")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def processed_image_derivative(request, processed_image_id):
+    try:
+        processed_image = ProcessedImage.objects.defer("binary_data").get(pk=processed_image_id, image__user=request.user)
+    except ProcessedImage.DoesNotExist:
+        return response(False, "Processed image not found.", {}, 404)
+
+    render_processed_image(processed_image)
+    return derivative_response(request, processed_image, f"processed_image_{processed_image.id}")
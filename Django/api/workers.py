@@ -0,0 +1,137 @@
+import multiprocessing
+import queue
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def worker_main(conn):
+    # Runs in a spawned process: Django and the heavy runtimes are imported here, never in the parent's fork
+    import django
+
+    django.setup()
+
+    from .models import Model
+    from .process import DecodedImage, infer_batch, model_registry
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        buffers, fields = task
+        segments = []
+        images = None
+        try:
+            # Spawned processes share the parent's resource tracker, so the parent's unlink is the only cleanup
+            segments.extend(SharedMemory(name=name) for name, _, _ in buffers)
+            images = [DecodedImage.from_array(np.ndarray(shape, dtype=dtype, buffer=shm.buf)) for shm, (_, shape, dtype) in zip(segments, buffers)]
+            modelObject = Model(**fields)
+            results = infer_batch(images, modelObject, model_registry.get(modelObject))
+            conn.send(("ok", results))
+        except Exception as e:
+            conn.send(("error", str(e)))
+        finally:
+            images = None
+            for shm in segments:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+
+
+def model_fields(modelObject):
+    return {
+        "id": modelObject.id,
+        "model_name": modelObject.model_name,
+        "model_dir": modelObject.model_dir,
+        "model_format": modelObject.model_format,
+        "handler": modelObject.handler,
+        "model_version": modelObject.model_version,
+        "runtime_options": modelObject.runtime_options,
+    }
+
+
+class InferenceProcess:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn,), name="inference-process", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class InferencePool:
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.respawns = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(InferenceProcess(self._context))
+
+    def infer_batch(self, images, modelObject):
+        segments = []
+        try:
+            buffers = []
+            for image in images:
+                array = image.rgb_np
+                shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+                segments.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+                buffers.append((shm.name, array.shape, array.dtype.str))
+
+            worker = self._idle.get()
+            try:
+                worker.conn.send((buffers, model_fields(modelObject)))
+                if not worker.conn.poll(self.timeout):
+                    raise WorkerCrashed(f"no response within {self.timeout} seconds")
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError, WorkerCrashed) as e:
+                # A crashed or hung process only fails its own request, a fresh one takes its place
+                worker.kill()
+                worker = InferenceProcess(self._context)
+                self.respawns += 1
+                raise WorkerCrashed(f"Inference process failed: {e}")
+            finally:
+                self._idle.put(worker)
+
+            if status == "error":
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+    def status(self):
+        return {
+            "processes": self.size,
+            "idle": self._idle.qsize(),
+            "respawns": self.respawns,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool(size, timeout):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool(size, timeout)
+        return _pool
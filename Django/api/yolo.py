@@ -0,0 +1,151 @@
+import ast
+import os
+
+import numpy as np
+
+from .sessions import run_onnx
+
+
+# Same defaults as Ultralytics predict(), so both runtimes return the same detections
+CONFIDENCE_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_CANDIDATES = 30000
+PAD_VALUE = 114
+
+# Ultralytics' default palette, boxes keep their colours whichever runtime produced them
+PALETTE = ["FF3838", "FF9D97", "FF701F", "FFB21D", "CFD231", "48F90A", "92CC17", "3DDB86", "1A9334", "00D4BB", "2C99A8", "00C2FF", "344593", "6473FF", "0018EC", "8438FF", "520085", "CB38FF", "FF95C8", "FF37C7"]
+
+
+def exported_path(model_dir):
+    return f"{os.path.splitext(model_dir)[0]}.onnx"
+
+
+def letterbox(image_np, size):
+    # Resized to fit and padded evenly to a square, like Ultralytics' LetterBox for fixed-size exports
+    import cv2
+
+    height, width = image_np.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    if (new_width, new_height) != (width, height):
+        image_np = cv2.resize(image_np, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(image_np, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return padded, ratio, (left, top)
+
+
+def box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def box_ios(box, boxes):
+    # Intersection over the smaller box, so a box cut off at a tile edge still matches the whole one
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def nms(boxes, scores, classes, iou_threshold=IOU_THRESHOLD, overlap=box_iou):
+    # Boxes of different classes are shifted apart so one pass never suppresses across classes
+    if not len(scores):
+        return np.empty(0, dtype=np.int64)
+    offset_boxes = boxes + (classes.astype(boxes.dtype) * (boxes.max() + 1))[:, None]
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        order = rest[overlap(offset_boxes[best], offset_boxes[rest]) <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(output, ratio, pad, shape, names):
+    # One row per anchor: centre x, centre y, width, height, then a score per class
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+    candidates = scores > CONFIDENCE_THRESHOLD
+    predictions, classes, scores = predictions[candidates], classes[candidates], scores[candidates]
+    if len(scores) > MAX_CANDIDATES:
+        top = scores.argsort()[::-1][:MAX_CANDIDATES]
+        predictions, classes, scores = predictions[top], classes[top], scores[top]
+
+    centres, sizes = predictions[:, :2], predictions[:, 2:4]
+    boxes = np.concatenate([centres - sizes / 2, centres + sizes / 2], axis=1)
+    keep = nms(boxes, scores, classes)[:MAX_DETECTIONS]
+    boxes, classes, scores = boxes[keep], classes[keep], scores[keep]
+
+    # Back from the letterboxed input to the image the model was given
+    boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)
+    boxes /= ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+    return {
+        "type": "detection",
+        "detections": [
+            {"box": [round(float(v), 2) for v in box], "class": int(cls), "label": names[int(cls)], "score": round(float(score), 5)}
+            for box, cls, score in zip(boxes, classes, scores)
+        ],
+    }
+
+
+class YoloSession:
+    # A YOLO model exported to ONNX, run with ONNX Runtime so PyTorch is never imported
+    def __init__(self, session):
+        self.session = session
+        metadata = session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+        self.size = ast.literal_eval(metadata.get("imgsz", "[640, 640]"))[0]
+
+    def predict(self, images_np):
+        letterboxed = [letterbox(image_np, self.size) for image_np in images_np]
+        input_batch = np.stack([padded for padded, _, _ in letterboxed]).transpose(0, 3, 1, 2).astype(np.float32) / 255
+        outputs = run_onnx(self.session, input_batch)
+        return [postprocess(output, ratio, pad, image_np.shape, self.names) for output, (_, ratio, pad), image_np in zip(outputs, letterboxed, images_np)]
+
+
+def color(index):
+    value = PALETTE[index % len(PALETTE)]
+    return int(value[4:6], 16), int(value[2:4], 16), int(value[0:2], 16)
+
+
+def draw_detections(image_bgr, detections):
+    # Boxes and labels drawn the way Ultralytics' Annotator does, without importing it
+    import cv2
+
+    line_width = max(round(sum(image_bgr.shape) / 2 * 0.003), 2)
+    text_thickness = max(line_width - 1, 1)
+    font_scale = line_width / 3
+    for detection in detections:
+        box_color = color(detection.get("class", 0))
+        p1 = (int(detection["box"][0]), int(detection["box"][1]))
+        p2 = (int(detection["box"][2]), int(detection["box"][3]))
+        cv2.rectangle(image_bgr, p1, p2, box_color, thickness=line_width, lineType=cv2.LINE_AA)
+
+        label = f"{detection['label']} {detection['score']:.2f}"
+        width, height = cv2.getTextSize(label, 0, fontScale=font_scale, thickness=text_thickness)[0]
+        height += 3
+        outside = p1[1] >= height
+        if p1[0] > image_bgr.shape[1] - width:
+            p1 = (image_bgr.shape[1] - width, p1[1])
+        p2 = (p1[0] + width, p1[1] - height if outside else p1[1] + height)
+        cv2.rectangle(image_bgr, p1, p2, box_color, -1, cv2.LINE_AA)
+        cv2.putText(image_bgr, label, (p1[0], p1[1] - 2 if outside else p1[1] + height - 1), 0, font_scale, (255, 255, 255), thickness=text_thickness, lineType=cv2.LINE_AA)
+    return image_bgr
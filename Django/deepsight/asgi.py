@@ -17,3 +17,9 @@ application = BlackNoise(
     immutable_file_test=immutable_file_test,
 )
 application.add(BASE_DIR / "static", "/static")
+
+from api.process import start_warm_up  # noqa: E402
+from api.jobs import resume_jobs  # noqa: E402
+
+start_warm_up()
+resume_jobs()
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -170,3 +171,124 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = "api.User"
+
+# Model Registry
+MODEL_REGISTRY_MEMORY_BUDGET = int(os.environ.get("MODEL_REGISTRY_MEMORY_BUDGET", 2 * 1024**3))
+MODEL_REGISTRY_WARM_UP = [name.strip() for name in os.environ.get("MODEL_REGISTRY_WARM_UP", "").split(",") if name.strip()]
+
+# MediaPipe Pool
+MEDIAPIPE_POOL_SIZE = int(os.environ.get("MEDIAPIPE_POOL_SIZE", 4))
+
+# Processing Jobs
+PROCESSING_JOB_WORKERS = int(os.environ.get("PROCESSING_JOB_WORKERS", 2))
+PROCESSING_JOB_QUEUE_SIZE = int(os.environ.get("PROCESSING_JOB_QUEUE_SIZE", 32))
+# Running jobs older than this are taken to be orphaned and queued again when a worker starts
+PROCESSING_JOB_TIMEOUT = int(os.environ.get("PROCESSING_JOB_TIMEOUT", 3600))
+PROCESSING_JOB_MAX_ATTEMPTS = int(os.environ.get("PROCESSING_JOB_MAX_ATTEMPTS", 3))
+
+# Batch Processing
+BATCH_PROCESSING_SIZE = int(os.environ.get("BATCH_PROCESSING_SIZE", 8))
+BATCH_PROCESSING_MAX_IMAGES = int(os.environ.get("BATCH_PROCESSING_MAX_IMAGES", 64))
+
+# Multi-Model Processing
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", 4))
+
+# Result Cache
+RESULT_CACHE_MEMORY_BUDGET = int(os.environ.get("RESULT_CACHE_MEMORY_BUDGET", 256 * 1024**2))
+# Seconds a cached result is served without checking that no other worker deleted it
+RESULT_CACHE_REVALIDATE_AFTER = float(os.environ.get("RESULT_CACHE_REVALIDATE_AFTER", 60))
+
+# Blob Storage
+BLOB_STORAGE_BACKEND = os.environ.get("BLOB_STORAGE_BACKEND", "api.storage.LocalBlobStore")
+BLOB_STORAGE_ROOT = Path(os.environ.get("BLOB_STORAGE_ROOT", BASE_DIR / "blobs"))
+# When set, downloads are handed to the reverse proxy (e.g. an nginx internal location) instead of being streamed by Django
+BLOB_ACCEL_REDIRECT_PREFIX = os.environ.get("BLOB_ACCEL_REDIRECT_PREFIX", "")
+# Seconds an unreferenced blob is kept before it is deleted, longer than any save takes to create its row
+BLOB_DELETE_GRACE = int(os.environ.get("BLOB_DELETE_GRACE", 600))
+# Stored images and processed images never change after creation
+BLOB_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Derivatives
+DERIVATIVE_SIZES = [128, 256, 512, 1024]
+DERIVATIVE_FORMATS = ["webp", "jpeg", "png"]
+DERIVATIVE_QUALITY = int(os.environ.get("DERIVATIVE_QUALITY", 80))
+
+# Uploads
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 50 * 1024**2))
+UPLOAD_MAX_PIXELS = int(os.environ.get("UPLOAD_MAX_PIXELS", 100_000_000))
+UPLOAD_PROBE_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    "api.uploads.MaxSizeUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
+# Listings
+LISTING_PAGE_SIZE = int(os.environ.get("LISTING_PAGE_SIZE", 50))
+LISTING_MAX_PAGE_SIZE = 200
+
+# ONNX Runtime
+ONNX_SESSION_DEFAULTS = {
+    # Extended optimizations stay hardware independent, so the cached graph can be reused across hosts
+    "graph_optimization_level": os.environ.get("ONNX_GRAPH_OPTIMIZATION_LEVEL", "extended"),
+    "intra_op_num_threads": int(os.environ.get("ONNX_INTRA_OP_THREADS", 2)),
+    "inter_op_num_threads": int(os.environ.get("ONNX_INTER_OP_THREADS", 1)),
+    "execution_mode": "sequential",
+    "enable_cpu_mem_arena": True,
+    "enable_mem_pattern": True,
+}
+ONNX_OPTIMIZED_CACHE_DIR = BASE_DIR / "api/models/optimized"
+
+# YOLO Runtime (per model override in Model.runtime_options["yolo_runtime"])
+# "onnx" serves the graph exported by export_models when it exists, "pytorch" always loads the .pt weights
+YOLO_RUNTIME = os.environ.get("YOLO_RUNTIME", "onnx")
+
+# Micro-Batching (per model overrides live in Model.runtime_options["batching"])
+MICRO_BATCHING = {
+    "enabled": os.environ.get("MICRO_BATCHING_ENABLED", "False") == "True",
+    "max_batch_size": int(os.environ.get("MICRO_BATCHING_MAX_BATCH_SIZE", 8)),
+    "max_wait_ms": float(os.environ.get("MICRO_BATCHING_MAX_WAIT_MS", 10)),
+    "max_queue_depth": int(os.environ.get("MICRO_BATCHING_MAX_QUEUE_DEPTH", 64)),
+    "timeout_s": float(os.environ.get("MICRO_BATCHING_TIMEOUT_S", 60)),
+}
+
+# Inference Processes
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", 0))
+INFERENCE_PROCESS_TIMEOUT = float(os.environ.get("INFERENCE_PROCESS_TIMEOUT", 120))
+
+# Async Views
+# Threads that run processing for the async views, off the event loop
+ASYNC_INFERENCE_WORKERS = int(os.environ.get("ASYNC_INFERENCE_WORKERS", 4))
+# Read size when async views stream blobs from storage
+ASYNC_BLOB_CHUNK_SIZE = int(os.environ.get("ASYNC_BLOB_CHUNK_SIZE", 512 * 1024))
+
+# Video
+# Frames run through the batched models (GoogleNet, YOLO) at once
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 16))
+# Frames processed per clip after striding, the rest of a longer clip is skipped
+VIDEO_MAX_FRAMES = int(os.environ.get("VIDEO_MAX_FRAMES", 900))
+VIDEO_MAX_STRIDE = 30
+
+# Decoding
+# Pixels a single request may decode, JPEGs are decoded at a reduced scale to fit
+DECODE_MAX_PIXELS = int(os.environ.get("DECODE_MAX_PIXELS", 50_000_000))
+# Bytes a single request may allocate for decoded pixels
+DECODE_MEMORY_BUDGET = int(os.environ.get("DECODE_MEMORY_BUDGET", 512 * 1024**2))
+# Long side annotated images are drawn at
+DECODE_RENDER_MAX_SIDE = int(os.environ.get("DECODE_RENDER_MAX_SIDE", 2048))
+
+# Tiled Detection
+# Detection models cut images above this many pixels into overlapping tiles, unless the request says otherwise
+TILING_PIXEL_THRESHOLD = int(os.environ.get("TILING_PIXEL_THRESHOLD", 20_000_000))
+# Tile side in original pixels and the share neighbouring tiles overlap by
+TILE_SIZE = int(os.environ.get("TILE_SIZE", 640))
+TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", 0.2))
+# Tiles per inference batch, batches run in parallel on the fan-out threads
+TILE_BATCH_SIZE = int(os.environ.get("TILE_BATCH_SIZE", 8))
+# Tiles grow past the requested size when an image would need more than this
+TILING_MAX_TILES = int(os.environ.get("TILING_MAX_TILES", 256))
+# Overlap (intersection over the smaller box) above which detections from different tiles are merged
+TILE_NMS_THRESHOLD = 0.5
+TILE_MIN_SIZE = 128
+TILE_MAX_SIZE = 4096
+TILE_MAX_OVERLAP = 0.5
@@ -4,3 +4,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "deepsight.settings")
 
 application = get_wsgi_application()
+
+from api.process import start_warm_up  # noqa: E402
+from api.jobs import resume_jobs  # noqa: E402
+
+start_warm_up()
+resume_jobs()
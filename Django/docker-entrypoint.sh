@@ -19,7 +19,7 @@ if [ ! -f ".setup_complete" ]; then
 
   echo "Installing ML Libraries: Mediapipe, ONNX Runtime, and Ultralytics..."
   echo "This may take up to 5-6 minutes for the first time setup."
-  pip install mediapipe==0.10.18 onnxruntime==1.19.2 ultralytics==8.3.21 --no-cache-dir --quiet || exit 1
+  pip install mediapipe==0.10.18 onnxruntime==1.19.2 ultralytics==8.3.21 onnx==1.17.0 --no-cache-dir --quiet || exit 1
 
   echo "Collecting static files..."
   python manage.py collectstatic --noinput --clear || exit 1
@@ -45,7 +45,7 @@ if [ ! -f ".setup_complete" ]; then
   python manage.py createsuperuser --noinput
 
   echo "Setting up Models..."
-  python setup.py
+  python setup.py || exit 1
 
   touch .setup_complete
 else
@@ -59,6 +59,9 @@ else
 
   echo "Flushing expired tokens..."
   python manage.py flushexpiredtokens
+
+  echo "Deleting unreferenced blobs..."
+  python manage.py sweep_blobs
 fi
 
 if [ "$DEBUG" = "True" ]; then
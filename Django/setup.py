@@ -1,56 +1,134 @@
+import argparse
+import hashlib
 import json
 import os
 import requests
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
-def download(url, dir):
-    if dir is None:
-        return
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        os.makedirs(os.path.dirname(dir), exist_ok=True)
+DOWNLOAD_WORKERS = int(os.environ.get("MODEL_DOWNLOAD_WORKERS", 4))
+DOWNLOAD_RETRIES = int(os.environ.get("MODEL_DOWNLOAD_RETRIES", 5))
+REQUIRE_SHA256 = os.environ.get("MODEL_DOWNLOAD_REQUIRE_SHA256", "False") == "True"
+DOWNLOAD_TIMEOUT = 30
+CHUNK_SIZE = 1024 * 1024
+
 
-        with open(dir, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch(url, part_path):
+    # Picks up where an earlier attempt stopped, the partial file is only moved into place once verified
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+        # 416 means the partial file already holds the whole body
+        if offset and response.status_code == 416:
+            return
+        response.raise_for_status()
+        # Servers that ignore Range send the whole file again
+        with open(part_path, "ab" if response.status_code == 206 else "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
                 f.write(chunk)
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading from {url}: {e}")
-        raise
-    except OSError as e:
-        print(f"Error saving file to {dir}: {e}")
-        raise
 
 
-def setup_models():
-    with open("models.json", "r") as f:
+def download(url, dir, sha256=None):
+    if dir is None:
+        return "skipped"
+    if os.path.exists(dir) and (sha256 is None or file_sha256(dir) == sha256):
+        return "present"
+
+    os.makedirs(os.path.dirname(dir), exist_ok=True)
+    part_path = f"{dir}.part"
+    for attempt in range(DOWNLOAD_RETRIES):
+        try:
+            fetch(url, part_path)
+            break
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading from {url} (attempt {attempt + 1}/{DOWNLOAD_RETRIES}): {e}")
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+            time.sleep(2**attempt)
+
+    digest = file_sha256(part_path)
+    if sha256 is None:
+        print(f"No sha256 for {dir} in the manifest, downloaded file hashes to {digest}, run setup.py --pin to record it")
+    elif digest != sha256:
+        # A corrupt partial file would be resumed forever, so it is started over next time
+        os.remove(part_path)
+        raise ValueError(f"Checksum mismatch for {dir}: expected {sha256}, got {digest}")
+    os.replace(part_path, dir)
+    return "downloaded"
+
+
+def download_models(models_data, workers=DOWNLOAD_WORKERS, require_sha256=False):
+    def run(model_info):
+        # Checked before downloading, an unpinned file would otherwise be fetched only to be refused
+        if require_sha256 and model_info["model_dir"] is not None and "sha256" not in model_info:
+            return None, ValueError("no sha256 in the manifest, run setup.py --pin")
+        try:
+            return download(model_info["url"], model_info["model_dir"], model_info.get("sha256")), None
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(run, models_data))
+
+    for model_info, (status, error) in zip(models_data, outcomes):
+        print(f"{model_info['model_name']}: {status or f'failed ({error})'}")
+    return [model_info for model_info, (status, _) in zip(models_data, outcomes) if status is not None]
+
+
+def pin_checksums(manifest, models_data, ready):
+    # Only fills in missing digests, a pinned file that no longer matches has already failed its download
+    pinned = 0
+    for model_info in ready:
+        if model_info.get("model_dir") and "sha256" not in model_info:
+            model_info["sha256"] = file_sha256(model_info["model_dir"])
+            pinned += 1
+    with open(manifest, "w") as f:
+        f.write(json.dumps(models_data, indent=2) + "\n")
+    print(f"Pinned {pinned} checksum(s) in {manifest}")
+
+
+def setup_models(manifest="models.json", workers=DOWNLOAD_WORKERS, pin=False):
+    with open(manifest, "r") as f:
         models_data = json.load(f)
 
-        for model_info in models_data:
-            url = model_info["url"]
-            model_dir = model_info["model_dir"]
-            download(url, model_dir)
-
-            command = f"""python manage.py shell -c "
-from api.models import Model, ModelCategory
-category, created = ModelCategory.objects.get_or_create(category_name='{model_info['model_category']}')
-Model.objects.get_or_create(
-    model_name='{model_info['model_name']}',
-    url='{model_info['url']}',
-    model_dir='{model_dir}',
-    model_format='{model_info['model_format']}',
-    model_description='{model_info['model_description']}',
-    model_version='{model_info['model_version']}',
-    category=category
-)
-print('Loaded: {model_info['model_name']}')
-" """
-            try:
-                subprocess.run(command, shell=True, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error executing command: {e}")
+    ready = download_models(models_data, workers, require_sha256=REQUIRE_SHA256 and not pin)
+
+    if pin:
+        pin_checksums(manifest, models_data, ready)
+        return len(ready) == len(models_data)
+
+    # One Django process for every row instead of one per model
+    if ready:
+        command = [sys.executable, "manage.py", "load_models", manifest, "--models", *[model_info["model_name"] for model_info in ready]]
+        subprocess.run(command, check=True)
+
+        # YOLO models fall back to PyTorch without their ONNX export, so a failed export does not fail setup
+        if subprocess.run([sys.executable, "manage.py", "export_models"]).returncode != 0:
+            print("Exporting YOLO models to ONNX failed, they will be served with PyTorch")
+
+        # Likewise ONNX models that cannot be given a dynamic batch axis still run, one image per call
+        if subprocess.run([sys.executable, "manage.py", "batch_models"]).returncode != 0:
+            print("Rewriting ONNX models with a dynamic batch axis failed, they will run one image at a time")
+
+    return len(ready) == len(models_data)
 
 
 if __name__ == "__main__":
-    setup_models()
+    parser = argparse.ArgumentParser(description="Downloads the models in the manifest and registers them")
+    parser.add_argument("manifest", nargs="?", default="models.json")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help="Concurrent downloads")
+    parser.add_argument("--pin", action="store_true", help="Record the sha256 of every downloaded file in the manifest instead of registering the models")
+    args = parser.parse_args()
+    if not setup_models(args.manifest, args.workers, args.pin):
+        sys.exit(1)
@@ -1,6 +1,6 @@
 "use client";
 
-import { apiFetch } from "@/utils/api";
+import { apiFetch, apiFetchAllPages } from "@/utils/api";
 import React, { useState, useEffect, useCallback } from "react";
 import { useDropzone } from "react-dropzone";
 
@@ -27,10 +27,11 @@ const ImagePage: React.FC = () => {
 
   const fetchUploadedImages = async () => {
     try {
-      const response = await apiFetch("/user/image/");
-      const data = await response.json();
+      const uploadedImages = await apiFetchAllPages<{ id: string }>(
+        "/user/image/",
+      );
       const images = await Promise.all(
-        data.data.map(async (image: { id: string }) => {
+        uploadedImages.map(async (image) => {
           const blobUrl = await fetchImageBlob(image.id);
           return { id: image.id, blobUrl };
         }),
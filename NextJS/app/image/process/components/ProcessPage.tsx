@@ -1,7 +1,7 @@
 "use client";
 
 import React, { useState, useEffect } from "react";
-import { apiFetch } from "@/utils/api";
+import { apiFetch, apiFetchAllPages } from "@/utils/api";
 
 const ProcessPage: React.FC = () => {
   const [images, setImages] = useState<{ id: string; blobUrl: string }[]>([]);
@@ -21,9 +21,10 @@ const ProcessPage: React.FC = () => {
 
   const fetchUploadedImages = async () => {
     try {
-      const response = await apiFetch("/user/image/");
-      const data = await response.json();
-      const ids = data.data.map((image: { id: string }) => image.id);
+      const uploadedImages = await apiFetchAllPages<{ id: string }>(
+        "/user/image/",
+      );
+      const ids = uploadedImages.map((image) => image.id);
       await fetchImageBlobs(ids);
     } catch (error) {
       console.error("Error fetching images:", error);
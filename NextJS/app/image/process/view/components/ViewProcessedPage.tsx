@@ -1,6 +1,6 @@
 "use client";
 
-import { apiFetch } from "@/utils/api";
+import { apiFetch, apiFetchAllPages } from "@/utils/api";
 import React, { useState, useEffect } from "react";
 
 const ViewProcessedPage: React.FC = () => {
@@ -11,9 +11,10 @@ const ViewProcessedPage: React.FC = () => {
 
   const fetchProcessedImages = async () => {
     try {
-      const response = await apiFetch("/user/processedimage/");
-      const data = await response.json();
-      const images = data.data.map((image: { id: string }) => ({
+      const processedImages = await apiFetchAllPages<{ id: string }>(
+        "/user/processedimage/",
+      );
+      const images = processedImages.map((image) => ({
         id: image.id,
         blobUrl: "",
       }));
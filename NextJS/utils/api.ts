@@ -134,6 +134,25 @@ export const apiFetch = async <T>(
   }
 };
 
+export const apiFetchAllPages = async <T>(url: string): Promise<T[]> => {
+  const results: T[] = [];
+  let cursor: string | null = null;
+
+  do {
+    const response = await apiFetch(
+      cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url,
+    );
+    if (!response.ok) {
+      throw new Error(`Failed to fetch ${url}: ${response.status}`);
+    }
+    const data = await response.json();
+    results.push(...data.data.results);
+    cursor = data.data.next_cursor;
+  } while (cursor);
+
+  return results;
+};
+
 export const isAuthenticated = async (
   onAuthenticated: () => void,
   onUnauthenticated: () => void,